@@ -1,48 +1,169 @@
 import os
 import logging
 
-from flask import Flask
+import click
+from flask import Flask, current_app
+from flask.cli import with_appcontext
 from flask_sqlalchemy import SQLAlchemy
 from sqlalchemy.orm import DeclarativeBase
 from flask_login import LoginManager
+from werkzeug.local import LocalProxy
 from werkzeug.middleware.proxy_fix import ProxyFix
-
-# Configure logging
-logging.basicConfig(level=logging.DEBUG)
+from cache import ResponseCache
+from security import PasswordHasher, LoginThrottle
+from database import engine_options, configure_engines
+from replicas import RoutingSession, ReplicaRouter, replica_binds
+from metrics import RequestMetrics
+from feed import CommentFeed
+from jobs import JobQueue
+from assets import StaticAssets, build_assets_command
+from images import ImageStore
+from documents import PostDocuments
 
 # Create a Base class for SQLAlchemy models
 class Base(DeclarativeBase):
     pass
 
-# Initialize Flask app
-app = Flask(__name__)
-app.secret_key = os.environ.get("SESSION_SECRET", "dev_secret_key")
-app.wsgi_app = ProxyFix(app.wsgi_app, x_proto=1, x_host=1)  # needed for url_for to generate with https
-
-# Database configuration - use SQLite for simplicity
-app.config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///blog.db")
-app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
-app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
-    'pool_pre_ping': True,
-    "pool_recycle": 300,
-}
+def app_extension(name):
+    """Proxy to the current app's instance of an extension created by create_app()."""
+    return LocalProxy(lambda: current_app.extensions[name])
 
-# Initialize SQLAlchemy with the app
-db = SQLAlchemy(model_class=Base)
-db.init_app(app)
+# Extensions are created unbound here and bound to an app by create_app(),
+# so importing this module does no configuration, I/O or route setup. Those
+# whose decorators are applied at import are shared and keep each app's
+# state in app.extensions; the rest are created per app and proxied.
+db = SQLAlchemy(model_class=Base, session_options={"class_": RoutingSession})
+replica_router = ReplicaRouter()
+job_queue = JobQueue()
+request_metrics = RequestMetrics()
+response_cache = ResponseCache()
+comment_feed = app_extension('comment_feed')
+password_hasher = app_extension('password_hasher')
+login_throttle = app_extension('login_throttle')
+static_assets = app_extension('static_assets')
+image_store = app_extension('image_store')
+post_documents = app_extension('post_documents')
 
-# Initialize Login Manager
 login_manager = LoginManager()
-login_manager.init_app(app)
-login_manager.login_view = 'login'
+login_manager.login_view = 'blog.login'
 login_manager.login_message_category = 'info'
 
-# Create all tables in the database
-with app.app_context():
-    # Import models here to avoid circular imports
-    from models import User, Post, Comment
-    db.create_all()
-    logging.info("Database tables created or verified")
 
-# Import routes to register them with the app
-from routes import *
+def config_from_env():
+    """Read the app settings from environment variables."""
+    config = {}
+    config["SECRET_KEY"] = os.environ.get("SESSION_SECRET", "dev_secret_key")
+
+    # Database configuration - use SQLite for simplicity
+    config["SQLALCHEMY_DATABASE_URI"] = os.environ.get("DATABASE_URL", "sqlite:///blog.db")
+    config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+
+    # Optional read replicas (comma-separated URLs) for the read-only views
+    replica_urls = [url.strip() for url in os.environ.get("DATABASE_REPLICA_URLS", "").split(",") if url.strip()]
+    config["SQLALCHEMY_BINDS"] = replica_binds(replica_urls)
+    config["REPLICA_STICKY_SECONDS"] = int(os.environ.get("REPLICA_STICKY_SECONDS", 5))
+
+    # Background jobs for write side effects (external: flask run-jobs, or thread)
+    config["JOBS_MODE"] = os.environ.get("JOBS_MODE", "external")
+    config["JOBS_WORKERS"] = int(os.environ.get("JOBS_WORKERS", 2))
+    config["MAIL_SERVER"] = os.environ.get("MAIL_SERVER")
+    config["MAIL_PORT"] = int(os.environ.get("MAIL_PORT", 25))
+    config["MAIL_FROM"] = os.environ.get("MAIL_FROM", "blog@localhost")
+    config["SITE_URL"] = os.environ.get("SITE_URL", "http://localhost:5000")
+
+    # Request latency, SQL and template metrics, served on /metrics
+    config["SLOW_REQUEST_MS"] = int(os.environ.get("SLOW_REQUEST_MS", 500))
+    config["SLOW_REQUEST_QUERIES"] = int(os.environ.get("SLOW_REQUEST_QUERIES", 50))
+    config["METRICS_TOKEN"] = os.environ.get("METRICS_TOKEN")
+
+    # Response cache for anonymous page views and the JSON API
+    config["CACHE_TYPE"] = os.environ.get("CACHE_TYPE", "local")
+    config["CACHE_DEFAULT_TTL"] = int(os.environ.get("CACHE_DEFAULT_TTL", 300))
+    config["CACHE_REDIS_URL"] = os.environ.get("CACHE_REDIS_URL")
+    config["USER_CACHE_TTL"] = int(os.environ.get("USER_CACHE_TTL", 300))
+
+    # Live comment feed (local, or redis to share events between workers)
+    config["COMMENT_FEED_TYPE"] = os.environ.get("COMMENT_FEED_TYPE", "local")
+    if "COMMENT_FEED_REDIS_URL" in os.environ:
+        config["COMMENT_FEED_REDIS_URL"] = os.environ["COMMENT_FEED_REDIS_URL"]
+
+    # Password hashing cost and login throttling
+    config["PASSWORD_HASH_METHOD"] = os.environ.get("PASSWORD_HASH_METHOD", "scrypt")
+    config["PASSWORD_HASH_POOL"] = os.environ.get("PASSWORD_HASH_POOL", "thread")
+    config["PASSWORD_HASH_WORKERS"] = int(os.environ.get("PASSWORD_HASH_WORKERS", 2))
+    config["LOGIN_ATTEMPTS_PER_IP"] = int(os.environ.get("LOGIN_ATTEMPTS_PER_IP", 30))
+    config["LOGIN_ATTEMPTS_PER_ACCOUNT"] = int(os.environ.get("LOGIN_ATTEMPTS_PER_ACCOUNT", 10))
+    # Reverse proxies in front of the app whose X-Forwarded-* headers are trusted
+    config["TRUSTED_PROXIES"] = int(os.environ.get("TRUSTED_PROXIES", 0))
+
+    # Uploaded post images, resized in a process pool by background jobs
+    if "IMAGE_FOLDER" in os.environ:
+        config["IMAGE_FOLDER"] = os.environ["IMAGE_FOLDER"]
+    config["IMAGE_MAX_BYTES"] = int(os.environ.get("IMAGE_MAX_BYTES", 10 * 1024 * 1024))
+    config["IMAGE_WORKERS"] = int(os.environ.get("IMAGE_WORKERS", 2))
+    config["IMAGE_REMOVE_GRACE"] = int(os.environ.get("IMAGE_REMOVE_GRACE", 3600))
+
+    # PDF and Word downloads of posts, rendered in a process pool and cached on disk
+    if "DOCUMENT_FOLDER" in os.environ:
+        config["DOCUMENT_FOLDER"] = os.environ["DOCUMENT_FOLDER"]
+    config["DOCUMENT_CACHE_BYTES"] = int(os.environ.get("DOCUMENT_CACHE_BYTES", 200 * 1024 * 1024))
+    config["DOCUMENT_WORKERS"] = int(os.environ.get("DOCUMENT_WORKERS", 2))
+
+    # Cache lifetime of the fingerprinted files from flask build-assets
+    config["ASSETS_MAX_AGE"] = int(os.environ.get("ASSETS_MAX_AGE", 31536000))
+    return config
+
+
+def create_app(config=None):
+    """Create and configure the app; ``config`` overrides the environment settings.
+
+    Nothing here connects to the database: engines connect on first use,
+    and the schema is created or upgraded only by ``flask upgrade-db``.
+    """
+    logging.basicConfig(level=os.environ.get("LOG_LEVEL", "INFO").upper())
+
+    app = Flask(__name__)
+    app.config.update(config_from_env())
+    app.config.update(config or {})
+    proxies = app.config.get("TRUSTED_PROXIES", 0)
+    if proxies:
+        # The client address (for login throttling) and https for url_for
+        # come from the headers each trusted proxy adds
+        app.wsgi_app = ProxyFix(app.wsgi_app, x_for=proxies, x_proto=proxies, x_host=proxies)
+    app.config.setdefault("SQLALCHEMY_ENGINE_OPTIONS", engine_options(app.config["SQLALCHEMY_DATABASE_URI"]))
+
+    db.init_app(app)
+    configure_engines(app, db)
+    replica_router.init_app(app, db)
+    job_queue.init_app(app, db)
+    request_metrics.init_app(app)
+    response_cache.init_app(app)
+    CommentFeed(app)
+    PasswordHasher(app)
+    LoginThrottle(response_cache, app)
+    login_manager.init_app(app)
+    StaticAssets(app)
+    ImageStore(app)
+    PostDocuments(app)
+
+    # Views, jobs and commands are imported here rather than at module
+    # level, so that importing app (e.g. from models) stays cheap
+    from routes import blog
+    import bulk
+    import export
+    import tasks
+    app.register_blueprint(blog)
+    for command in (upgrade_db_command, build_assets_command, bulk.import_posts_command,
+                    bulk.import_comments_command, export.export_command, tasks.run_jobs_command):
+        app.cli.add_command(command)
+    return app
+
+
+@click.command('upgrade-db')
+@with_appcontext
+def upgrade_db_command():
+    """Create the database schema or apply any pending migrations."""
+    import models
+    import migrations
+    version = migrations.upgrade(db)
+    click.echo(f"Database schema is at version {version}")
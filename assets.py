@@ -0,0 +1,281 @@
+import gzip
+import hashlib
+import json
+import logging
+import mimetypes
+import os
+import re
+import click
+from flask import current_app, url_for
+from flask.cli import with_appcontext
+from werkzeug.datastructures import Headers
+from werkzeug.http import parse_accept_header, quote_etag, unquote_etag
+from werkzeug.security import safe_join
+from werkzeug.wsgi import wrap_file
+
+# Output files, each built from these static files in order
+BUNDLES = {
+    'app.css': ['css/style.css'],
+    'app.js': ['js/main.js', 'js/posts.js', 'js/comments.js'],
+}
+BUILD_DIR = 'dist'
+MANIFEST = 'manifest.json'
+COMPRESSIBLE = ('.css', '.js', '.svg', '.json', '.txt', '.html')
+# Encodings we precompress to, in order of preference
+ENCODINGS = [('br', '.br'), ('gzip', '.gz')]
+
+
+def minify_css(text):
+    try:
+        import rcssmin
+        return rcssmin.cssmin(text)
+    except ImportError:
+        pass
+    text = re.sub(r'/\*.*?\*/', '', text, flags=re.S)
+    text = re.sub(r'\s+', ' ', text)
+    text = re.sub(r'\s*([{};,>])\s*', r'\1', text)
+    text = re.sub(r':\s+', ':', text)
+    return text.replace(';}', '}').strip()
+
+
+def minify_js(text):
+    """Minify JavaScript, conservatively unless rjsmin is installed.
+
+    The fallback only drops indentation, blank lines and comments that
+    start a line (code after a block comment is kept), keeping line breaks
+    so automatic semicolon insertion and multi-line template literals are
+    unaffected.
+    """
+    try:
+        import rjsmin
+        return rjsmin.jsmin(text)
+    except ImportError:
+        pass
+    lines = []
+    in_comment = in_template = False
+    for line in text.splitlines():
+        if in_template:
+            lines.append(line)
+            code = line
+        else:
+            code = line.strip()
+            while in_comment or code.startswith('/*'):
+                end = code.find('*/', 0 if in_comment else 2)
+                if end < 0:
+                    in_comment, code = True, ''
+                    break
+                in_comment, code = False, code[end + 2:].strip()
+            if not code or code.startswith('//'):
+                continue
+            lines.append(code)
+        # An odd number of backticks opens or closes a template literal
+        if code.count('`') % 2:
+            in_template = not in_template
+    return '\n'.join(lines)
+
+
+def compressors():
+    """The available precompression functions, by Content-Encoding."""
+    available = {'gzip': lambda data: gzip.compress(data, compresslevel=9, mtime=0)}
+    try:
+        import brotli
+        available['br'] = lambda data: brotli.compress(data, quality=11)
+    except ImportError:
+        logging.warning("The brotli package is not installed; building gzip variants only")
+    return available
+
+
+def fingerprint(name, data):
+    """app.js -> app.<content hash>.js"""
+    base, ext = os.path.splitext(name)
+    return f'{base}.{hashlib.sha256(data).hexdigest()[:12]}{ext}'
+
+
+def build(static_folder, clean=False):
+    """Write fingerprinted, minified and precompressed assets and their manifest.
+
+    Returns the manifest, which maps each bundle name and static file path
+    to its fingerprinted path under the static folder. Files from earlier
+    builds are kept, so pages still cached by browsers can load them,
+    unless ``clean`` is set.
+    """
+    output = os.path.join(static_folder, BUILD_DIR)
+    available = compressors()
+    outputs = {}
+    for name, sources in BUNDLES.items():
+        texts = []
+        for source in sources:
+            with open(os.path.join(static_folder, source), encoding='utf-8') as f:
+                texts.append(f.read())
+        if name.endswith('.css'):
+            data = '\n'.join(minify_css(text) for text in texts)
+        else:
+            # A semicolon between files, in case one ends without one
+            data = '\n;'.join(minify_js(text) for text in texts)
+        outputs[name] = data.encode('utf-8')
+
+    # Everything else (images, fonts) is fingerprinted as it is
+    for directory, subdirectories, files in os.walk(static_folder):
+        if directory == static_folder and BUILD_DIR in subdirectories:
+            subdirectories.remove(BUILD_DIR)
+        for filename in files:
+            path = os.path.join(directory, filename)
+            name = os.path.relpath(path, static_folder).replace(os.sep, '/')
+            if name.endswith(('.css', '.js')):
+                continue
+            with open(path, 'rb') as f:
+                outputs[name] = f.read()
+
+    manifest = {}
+    written = {MANIFEST}
+    for name, data in outputs.items():
+        built = fingerprint(name, data)
+        manifest[name] = f'{BUILD_DIR}/{built}'
+        variants = [(built, data)]
+        if name.endswith(COMPRESSIBLE):
+            for encoding, suffix in ENCODINGS:
+                compressed = available[encoding](data) if encoding in available else data
+                if len(compressed) < len(data):
+                    variants.append((built + suffix, compressed))
+        for filename, content in variants:
+            path = os.path.join(output, filename)
+            written.add(filename)
+            if not os.path.exists(path):
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                with open(path, 'wb') as f:
+                    f.write(content)
+
+    # Replace the manifest in one step, so workers never read half of it
+    temporary = os.path.join(output, MANIFEST + '.tmp')
+    with open(temporary, 'w') as f:
+        json.dump(manifest, f, indent=2, sort_keys=True)
+    os.replace(temporary, os.path.join(output, MANIFEST))
+
+    if clean:
+        for directory, _, files in os.walk(output):
+            for filename in files:
+                path = os.path.join(directory, filename)
+                if os.path.relpath(path, output).replace(os.sep, '/') not in written:
+                    os.remove(path)
+    return manifest
+
+
+@click.command('build-assets')
+@click.option('--clean', is_flag=True, help='Delete files left over from earlier builds.')
+@with_appcontext
+def build_assets_command(clean):
+    """Bundle, minify, fingerprint and precompress the static files."""
+    manifest = build(current_app.static_folder, clean)
+    for name, path in sorted(manifest.items()):
+        click.echo(f"{name} -> {path}")
+
+
+class StaticAssets:
+    """Serves the output of ``flask build-assets`` ahead of the Flask app.
+
+    Templates call asset_urls('app.js') and asset_url('images/logo.svg').
+    After a build these return the fingerprinted files, which a WSGI
+    middleware answers without running any Flask request handling: the
+    brotli or gzip variant the client accepts, with Content-Encoding and
+    an immutable, far-future Cache-Control. Without a build the original
+    static files are linked one by one, as during development.
+    """
+
+    def __init__(self, app=None):
+        self.manifest = {}
+        self.root = None
+        self.prefix = None
+        self.max_age = 31536000
+        self._files = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('ASSETS_MAX_AGE', 31536000)
+        self.max_age = app.config['ASSETS_MAX_AGE']
+        self.root = os.path.join(app.static_folder, BUILD_DIR)
+        self.prefix = f'{app.static_url_path}/{BUILD_DIR}/'
+        self.manifest = self.load_manifest()
+        self._files = {}
+        app.add_template_global(self.asset_url)
+        app.add_template_global(self.asset_urls)
+        app.wsgi_app = AssetMiddleware(app.wsgi_app, self)
+        app.extensions['static_assets'] = self
+
+    def load_manifest(self):
+        try:
+            with open(os.path.join(self.root, MANIFEST)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return {}
+
+    def asset_url(self, name):
+        """URL of one static file, fingerprinted if it has been built."""
+        return url_for('static', filename=self.manifest.get(name, name))
+
+    def asset_urls(self, name):
+        """URLs to load a bundle: the built file, or its sources before a build."""
+        if name in self.manifest:
+            return [url_for('static', filename=self.manifest[name])]
+        return [url_for('static', filename=source) for source in BUNDLES.get(name, [name])]
+
+    def find(self, filename):
+        """The variants of a built file as {encoding: (path, size)}, or None."""
+        if filename in self._files:
+            return self._files[filename]
+        path = safe_join(self.root, filename)
+        if path is None or filename.endswith(MANIFEST) or not os.path.isfile(path):
+            return None
+        variants = {None: (path, os.path.getsize(path))}
+        for encoding, suffix in ENCODINGS:
+            if os.path.isfile(path + suffix):
+                variants[encoding] = (path + suffix, os.path.getsize(path + suffix))
+        # Built files never change under the same name
+        self._files[filename] = variants
+        return variants
+
+
+class AssetMiddleware:
+    """WSGI middleware answering requests for built assets directly."""
+
+    def __init__(self, wsgi_app, assets):
+        self.wsgi_app = wsgi_app
+        self.assets = assets
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if not path.startswith(self.assets.prefix) or environ['REQUEST_METHOD'] not in ('GET', 'HEAD'):
+            return self.wsgi_app(environ, start_response)
+        filename = path[len(self.assets.prefix):]
+        variants = self.assets.find(filename)
+        if variants is None:
+            return self.wsgi_app(environ, start_response)
+
+        accepted = parse_accept_header(environ.get('HTTP_ACCEPT_ENCODING'))
+        encoding = next((encoding for encoding, _ in ENCODINGS
+                         if encoding in variants and accepted[encoding] > 0), None)
+        file_path, size = variants[encoding]
+        etag = os.path.basename(filename) + (f'-{encoding}' if encoding else '')
+
+        mimetype, _ = mimetypes.guess_type(filename)
+        mimetype = mimetype or 'application/octet-stream'
+        if mimetype.startswith('text/') or mimetype == 'application/javascript':
+            mimetype += '; charset=utf-8'
+        headers = Headers({
+            'Cache-Control': f'public, max-age={self.assets.max_age}, immutable',
+            'ETag': quote_etag(etag),
+            'Vary': 'Accept-Encoding',
+        })
+        if_none_match = environ.get('HTTP_IF_NONE_MATCH', '')
+        if etag in (unquote_etag(tag.strip())[0] for tag in if_none_match.split(',') if tag.strip()):
+            start_response('304 Not Modified', headers.to_wsgi_list())
+            return []
+
+        headers['Content-Type'] = mimetype
+        headers['Content-Length'] = str(size)
+        if encoding:
+            headers['Content-Encoding'] = encoding
+        start_response('200 OK', headers.to_wsgi_list())
+        if environ['REQUEST_METHOD'] == 'HEAD':
+            return []
+        return wrap_file(environ, open(file_path, 'rb'))
@@ -0,0 +1,234 @@
+import json
+import logging
+import os
+import re
+from urllib.parse import parse_qs
+from sqlalchemy import func, select
+from sqlalchemy.engine import make_url
+from sqlalchemy.orm import configure_mappers
+from app import create_app, db
+from models import Post, Comment
+from database import engine_options, apply_sqlite_pragmas, sqlite_pragmas
+from http_cache import make_etag
+from pagination import InvalidCursor, encode_cursor, keyset_newest_first, parse_limit
+
+# Async drivers for the database backends the app supports
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg',
+}
+STREAM_BATCH = 100
+
+# Set up the backrefs (Post.author, Comment.author) before the first query
+configure_mappers()
+
+ROUTES = [
+    (re.compile(r'^/api/posts$'), 'posts'),
+    (re.compile(r'^/api/posts/(?P<post_id>\d+)$'), 'post'),
+    (re.compile(r'^/api/posts/(?P<post_id>\d+)/comments$'), 'post_comments'),
+]
+
+
+def async_url(url):
+    """Swap the driver of a database URL for its asyncio counterpart."""
+    url = make_url(url)
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise RuntimeError(f"No async driver configured for {backend} databases")
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+def async_engine_options(url):
+    """The sync engine options for a URL, adapted to its async driver."""
+    options = engine_options(url.render_as_string(hide_password=False))
+    connect_args = options.pop('connect_args', {})
+    if url.get_backend_name() == 'postgresql' and 'options' in connect_args:
+        # asyncpg takes server settings instead of a libpq options string
+        name, value = connect_args['options'].removeprefix('-c ').split('=', 1)
+        options['connect_args'] = {'server_settings': {name: value}}
+    return options
+
+
+def create_engine(url):
+    try:
+        from sqlalchemy.ext.asyncio import create_async_engine
+    except ImportError as e:
+        raise RuntimeError("The async API requires the greenlet package (sqlalchemy[asyncio])") from e
+    url = async_url(url)
+    try:
+        engine = create_async_engine(url, **async_engine_options(url))
+    except ImportError as e:
+        raise RuntimeError(f"The async API requires the {url.get_driver_name()} package") from e
+    apply_sqlite_pragmas(engine.sync_engine, sqlite_pragmas())
+    return engine
+
+
+class NotFound(Exception):
+    """Raised by a handler when the requested resource does not exist."""
+
+
+class AsyncAPI:
+    """ASGI application serving the read-only JSON post API.
+
+    It answers ``/api/posts``, ``/api/posts/<id>`` and
+    ``/api/posts/<id>/comments`` exactly like the Flask views, but on an
+    asyncio event loop with an async SQLAlchemy engine, so a client on a
+    slow link holds a coroutine rather than a whole worker. The mapped
+    models from models.py are shared with the Flask app. Any other path is
+    passed to ``fallback`` (another ASGI app, e.g. the Flask app wrapped
+    with asgiref's WsgiToAsgi), or answered with 404.
+    """
+
+    def __init__(self, database_url=None, fallback=None):
+        self.database_url = database_url or os.environ.get('ASYNC_DATABASE_URL')
+        self.fallback = fallback
+        self.engine = None
+        self.sessionmaker = None
+
+    async def startup(self):
+        from sqlalchemy.ext.asyncio import async_sessionmaker
+        if self.database_url is None:
+            # The URL as Flask-SQLAlchemy resolved it (relative SQLite paths live in instance/)
+            with create_app().app_context():
+                self.database_url = db.engine.url.render_as_string(hide_password=False)
+        self.engine = create_engine(self.database_url)
+        self.sessionmaker = async_sessionmaker(self.engine, expire_on_commit=False)
+
+    async def shutdown(self):
+        if self.engine is not None:
+            await self.engine.dispose()
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            await self.lifespan(receive, send)
+            return
+        if scope['type'] != 'http':
+            return
+
+        for pattern, name in ROUTES:
+            match = pattern.match(scope['path'])
+            if match:
+                break
+        else:
+            if self.fallback is not None:
+                await self.fallback(scope, receive, send)
+            else:
+                await self.send_json(send, 404, {"success": False, "message": "Not found"})
+            return
+
+        if scope['method'] not in ('GET', 'HEAD'):
+            await self.send_json(send, 405, {"success": False, "message": "Method not allowed"})
+            return
+        if self.sessionmaker is None:
+            await self.startup()
+
+        args = {key: values[-1] for key, values in parse_qs(scope['query_string'].decode()).items()}
+        headers = {key.decode().lower(): value.decode() for key, value in scope['headers']}
+        kwargs = {key: int(value) for key, value in match.groupdict().items()}
+        try:
+            if name == 'posts' and wants_ndjson(args, headers):
+                await self.stream_posts(send, args.get('cursor'), args.get('limit'))
+                return
+            body = await getattr(self, name)(args, **kwargs)
+        except InvalidCursor:
+            await self.send_json(send, 400, {"success": False, "message": "Invalid cursor"})
+            return
+        except NotFound:
+            await self.send_json(send, 404, {"success": False, "message": "Not found"})
+            return
+        except Exception:
+            logging.exception(f"Async API error on {scope['path']}")
+            await self.send_json(send, 500, {"success": False, "message": "Server error"})
+            return
+        await self.send_json(send, 200, body, headers, head=scope['method'] == 'HEAD')
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                await self.startup()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.shutdown()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    async def send_json(self, send, status, body, request_headers=None, head=False):
+        """Send a JSON response, or 304 if the client already has this body."""
+        payload = json.dumps(body).encode()
+        headers = [(b'content-type', b'application/json')]
+        if status == 200:
+            etag = f'"{make_etag(payload)}"'
+            headers += [(b'etag', etag.encode()), (b'cache-control', b'no-cache')]
+            if request_headers and etag in request_headers.get('if-none-match', ''):
+                status, payload = 304, b''
+        headers.append((b'content-length', str(len(payload)).encode()))
+        await send({'type': 'http.response.start', 'status': status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': b'' if head else payload})
+
+    async def serialize_posts(self, session, posts):
+        """Serialize posts with one grouped comment-count query, as serialize_posts does."""
+        if not posts:
+            return []
+        rows = await session.execute(
+            select(Comment.post_id, func.count(Comment.id))
+            .where(Comment.post_id.in_([post.id for post in posts]))
+            .group_by(Comment.post_id))
+        counts = dict(rows.all())
+        return [post.to_dict(comment_count=counts.get(post.id, 0)) for post in posts]
+
+    async def posts(self, args):
+        """One keyset page of posts, newest first."""
+        limit = parse_limit(int(args['limit']) if args.get('limit', '').isdigit() else None)
+        query = keyset_newest_first(Post.with_author(select(Post)), Post, args.get('cursor'))
+        async with self.sessionmaker() as session:
+            posts = (await session.execute(query.limit(limit + 1))).scalars().all()
+            next_cursor = None
+            if len(posts) > limit:
+                posts = posts[:limit]
+                next_cursor = encode_cursor(posts[-1].created_at, posts[-1].id)
+            return {"posts": await self.serialize_posts(session, posts), "next_cursor": next_cursor}
+
+    async def post(self, args, post_id):
+        async with self.sessionmaker() as session:
+            post = (await session.execute(Post.with_author(select(Post)).where(Post.id == post_id))).scalar()
+            if post is None:
+                raise NotFound()
+            return (await self.serialize_posts(session, [post]))[0]
+
+    async def post_comments(self, args, post_id):
+        query = Comment.with_author(select(Comment)).where(Comment.post_id == post_id) \
+            .order_by(Comment.created_at.desc())
+        async with self.sessionmaker() as session:
+            comments = (await session.execute(query)).scalars().all()
+            return [comment.to_dict() for comment in comments]
+
+    async def stream_posts(self, send, cursor, limit=None):
+        """Stream posts as NDJSON off a server-side cursor, one batch at a time."""
+        query = keyset_newest_first(Post.with_author(select(Post)), Post, cursor)
+        if limit is not None and limit.isdigit():
+            query = query.limit(max(int(limit), 1))
+        async with self.sessionmaker() as session:
+            result = await session.stream(query.execution_options(yield_per=STREAM_BATCH))
+            await send({'type': 'http.response.start', 'status': 200,
+                        'headers': [(b'content-type', b'application/x-ndjson')]})
+            try:
+                async for partition in result.scalars().partitions(STREAM_BATCH):
+                    items = await self.serialize_posts(session, partition)
+                    chunk = ''.join(json.dumps(item) + '\n' for item in items)
+                    await send({'type': 'http.response.body', 'body': chunk.encode(), 'more_body': True})
+            except Exception:
+                # Too late for an error status; end the stream short instead
+                logging.exception("Async API error while streaming posts")
+        await send({'type': 'http.response.body', 'body': b''})
+
+
+def wants_ndjson(args, headers):
+    """Check whether the client asked for a newline-delimited JSON stream."""
+    if args.get('format') == 'ndjson':
+        return True
+    accept = headers.get('accept', '')
+    return 'application/x-ndjson' in accept and 'application/json' not in accept
+
+
+app = AsyncAPI()
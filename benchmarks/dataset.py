@@ -0,0 +1,159 @@
+#!/usr/bin/env python3
+"""
+Synthetic benchmark dataset
+Seeds users, posts and comments into DATABASE_URL (SQLite or PostgreSQL).
+Post and comment lengths follow log-normal distributions and authorship and
+comment counts are skewed, so a few posts are long and heavily discussed
+while most are short. The same --seed always produces the same data.
+
+Every user is named benchN with email benchN@example.com and the password
+"benchmark".
+
+Usage: DATABASE_URL=sqlite:///bench.db python benchmarks/dataset.py --reset [--posts 2000]
+"""
+
+import argparse
+import math
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+PASSWORD = 'benchmark'
+SYLLABLES = ['ka', 'lo', 'mi', 'ra', 'ten', 'vo', 'shi', 'ne', 'dus', 'pa', 'gri', 'or', 'el', 'tu', 'bin', 'sa']
+INSERT_BATCH = 500
+
+
+def user_email(number):
+    return f'bench{number}@example.com'
+
+
+def vocabulary(rng, size=2000):
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rng.choice(SYLLABLES) for _ in range(rng.randint(1, 4))))
+    return sorted(words)
+
+
+def lognormal_length(rng, median, sigma, maximum):
+    return max(1, min(maximum, int(rng.lognormvariate(math.log(median), sigma))))
+
+
+def sentence(rng, words, length):
+    text = ' '.join(rng.choice(words) for _ in range(length))
+    return text[0].upper() + text[1:] + '.'
+
+
+def paragraphs(rng, words, total_words):
+    """Markdown body of roughly total_words words, with the odd heading and list."""
+    blocks = []
+    remaining = total_words
+    while remaining > 0:
+        roll = rng.random()
+        if roll < 0.1:
+            blocks.append('## ' + sentence(rng, words, rng.randint(2, 6)).rstrip('.'))
+        elif roll < 0.2:
+            blocks.append('\n'.join('- ' + sentence(rng, words, rng.randint(3, 10)) for _ in range(rng.randint(2, 5))))
+        size = min(remaining, rng.randint(20, 120))
+        blocks.append(' '.join(sentence(rng, words, rng.randint(5, 18)) for _ in range(max(1, size // 12))))
+        remaining -= size
+    return '\n\n'.join(blocks)
+
+
+def seed(db, users=50, posts=2000, comments_per_post=5, post_words=250, comment_words=40, seed_value=1):
+    """Insert the synthetic dataset and rebuild the search index."""
+    from models import User, Post, Comment
+    import search
+    from app import password_hasher
+
+    rng = random.Random(seed_value)
+    words = vocabulary(rng)
+    # Every user shares one hash: hashing thousands of passwords is not what we measure
+    password_hash = password_hasher.hash(PASSWORD)
+
+    user_rows = [User(username=f'bench{n}', email=user_email(n), password_hash=password_hash) for n in range(users)]
+    db.session.add_all(user_rows)
+    db.session.commit()
+    user_ids = [user.id for user in user_rows]
+    # Zipf-like authorship: a handful of users write most of the posts
+    weights = [1 / (rank + 1) for rank in range(users)]
+
+    start = datetime.utcnow() - timedelta(days=365)
+    step = timedelta(days=365) / max(posts, 1)
+    created_comments = 0
+    for first in range(0, posts, INSERT_BATCH):
+        batch = []
+        for number in range(first, min(first + INSERT_BATCH, posts)):
+            created_at = start + step * number
+            post = Post(title=sentence(rng, words, rng.randint(3, 9)).rstrip('.'),
+                        content=paragraphs(rng, words, lognormal_length(rng, post_words, 0.8, post_words * 20)),
+                        user_id=rng.choices(user_ids, weights)[0], created_at=created_at, updated_at=created_at)
+            post.render_content()
+            batch.append(post)
+            count = int(min(rng.expovariate(1 / comments_per_post), comments_per_post * 20)) if comments_per_post else 0
+            for offset in range(count):
+                comment_at = created_at + timedelta(minutes=offset * rng.randint(1, 90))
+                comment = Comment(content=sentence(rng, words, lognormal_length(rng, comment_words, 0.7, comment_words * 10)),
+                                  user_id=rng.choice(user_ids), post=post,
+                                  created_at=comment_at, updated_at=comment_at)
+                batch.append(comment)
+                created_comments += 1
+        db.session.add_all(batch)
+        db.session.commit()
+
+    with db.engine.begin() as connection:
+        search.create_index(connection)
+    return {'users': users, 'posts': posts, 'comments': created_comments}
+
+
+def reset(db):
+    """Delete every user, post and comment; seed() rebuilds the search index afterwards."""
+    from models import User, Post, Comment
+    from app import response_cache
+    for model in (Comment, Post, User):
+        db.session.query(model).delete()
+    db.session.commit()
+    response_cache.clear()
+
+
+def create_app():
+    """Create the app and bring the schema of its database up to date."""
+    from app import create_app, db
+    import migrations
+    app = create_app()
+    with app.app_context():
+        migrations.upgrade(db)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--posts', type=int, default=2000)
+    parser.add_argument('--comments-per-post', type=float, default=5, help='mean comments per post')
+    parser.add_argument('--post-words', type=int, default=250, help='median words per post')
+    parser.add_argument('--comment-words', type=int, default=40, help='median words per comment')
+    parser.add_argument('--seed', type=int, default=1)
+    parser.add_argument('--reset', action='store_true', help='delete all existing users, posts and comments first')
+    args = parser.parse_args()
+
+    from app import db
+    from models import User
+    app = create_app()
+    with app.app_context():
+        if args.reset:
+            reset(db)
+        elif db.session.query(User.id).first() is not None:
+            sys.exit("The database already has users; pass --reset to replace them")
+        began = time.perf_counter()
+        counts = seed(db, args.users, args.posts, args.comments_per_post, args.post_words,
+                      args.comment_words, args.seed)
+    print(f"Seeded {counts['users']} users, {counts['posts']} posts and {counts['comments']} comments "
+          f"in {time.perf_counter() - began:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
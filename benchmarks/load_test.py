@@ -0,0 +1,496 @@
+#!/usr/bin/env python3
+"""
+Route load test
+Drives the main pages, login, comment posting and the JSON API against a
+synthetic dataset and reports throughput, p50/p95/p99 latency and SQL
+queries per request for each scenario.
+
+By default requests go through the Flask test client in this process. With
+--gunicorn a local gunicorn is started on the same database and driven over
+HTTP; --url targets a server that is already running (seeded beforehand
+with benchmarks/dataset.py).
+
+Results can be saved as a baseline and later runs compared against it; the
+comparison exits with status 1 if any scenario regressed beyond the
+tolerances, so it can gate upgrades.
+
+Usage:
+  python benchmarks/load_test.py --save-baseline benchmarks/baseline.json
+  python benchmarks/load_test.py --baseline benchmarks/baseline.json
+  python benchmarks/load_test.py --gunicorn --workers 4 -c 8 -n 500
+"""
+
+import argparse
+import http.cookiejar
+import itertools
+import json
+import math
+import os
+import platform
+import random
+import re
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import urllib.error
+import urllib.parse
+import urllib.request
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+CSRF_PATTERN = re.compile(r'name="csrf_token"[^>]*value="([^"]+)"')
+METRIC_PATTERN = re.compile(r'^db_queries_per_request_(sum|count)\{endpoint="([^"]+)"\} (\S+)$', re.M)
+
+
+class AppClient:
+    """Requests through the Flask test client, in this process."""
+
+    def __init__(self, app):
+        self.app = app
+        self.client = app.test_client()
+
+    def request(self, method, path, data=None):
+        response = self.client.open(path, method=method, data=data)
+        return response.status_code, response.get_data(as_text=True)
+
+    def reset(self):
+        self.client = self.app.test_client()
+
+
+class NoRedirect(urllib.request.HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class HttpClient:
+    """Requests over HTTP with a cookie jar, without following redirects."""
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip('/')
+        self.reset()
+
+    def request(self, method, path, data=None):
+        body = urllib.parse.urlencode(data).encode() if data is not None else None
+        request = urllib.request.Request(self.base_url + path, data=body, method=method)
+        try:
+            with self.opener.open(request, timeout=60) as response:
+                return response.status, response.read().decode()
+        except urllib.error.HTTPError as e:
+            return e.code, e.read().decode()
+
+    def reset(self):
+        self.opener = urllib.request.build_opener(
+            urllib.request.HTTPCookieProcessor(http.cookiejar.CookieJar()), NoRedirect)
+
+
+class VirtualUser:
+    """One simulated client: its own cookies, random stream and timings."""
+
+    def __init__(self, client, context, number):
+        self.client = client
+        self.context = context
+        self.rng = random.Random(context['seed'] * 1000 + number)
+        self.email = f"bench{number % context['users']}@example.com"
+        self.csrf_token = None
+        self.samples = []
+
+    def request(self, method, path, data=None):
+        return self.client.request(method, path, data)
+
+    def timed(self, method, path, data=None, expect=(200, 304)):
+        counter = self.context['query_counter']
+        counter.start()
+        began = time.perf_counter()
+        status, _ = self.request(method, path, data)
+        elapsed = time.perf_counter() - began
+        self.samples.append((elapsed, counter.stop(), status in expect))
+
+    def fetch_csrf(self, path):
+        status, body = self.request('GET', path)
+        match = CSRF_PATTERN.search(body)
+        if match is None:
+            raise RuntimeError(f"No CSRF token on {path} (status {status})")
+        self.csrf_token = match.group(1)
+        return self.csrf_token
+
+    def login(self):
+        data = {'email': self.email, 'password': self.context['password'], 'csrf_token': self.fetch_csrf('/login')}
+        status, _ = self.request('POST', '/login', data)
+        if status != 302:
+            raise RuntimeError(f"Could not log in as {self.email} (status {status})")
+
+    def post_id(self):
+        return self.rng.choice(self.context['post_ids'])
+
+    def word(self):
+        return self.rng.choice(self.context['words'])
+
+
+def index(user):
+    user.timed('GET', f'/?page={user.rng.randint(1, 3)}')
+
+
+def post_detail(user):
+    user.timed('GET', f'/post/{user.post_id()}')
+
+
+def dashboard(user):
+    user.timed('GET', '/dashboard')
+
+
+def login(user):
+    user.client.reset()
+    data = {'email': user.email, 'password': user.context['password'], 'csrf_token': user.fetch_csrf('/login')}
+    user.timed('POST', '/login', data, expect=(302,))
+
+
+def add_comment(user):
+    post_id = user.post_id()
+    data = {'content': f'{user.word()} {user.word()} {user.word()}', 'csrf_token': user.csrf_token}
+    user.timed('POST', f'/post/{post_id}/comment', data, expect=(302,))
+    # Follow the redirect like a browser would, which also consumes the flash message
+    user.request('GET', f'/post/{post_id}')
+
+
+def api_posts(user):
+    user.timed('GET', '/api/posts')
+
+
+def api_post(user):
+    user.timed('GET', f'/api/posts/{user.post_id()}')
+
+
+def api_post_comments(user):
+    user.timed('GET', f'/api/posts/{user.post_id()}/comments')
+
+
+def api_search(user):
+    user.timed('GET', f'/api/search?q={user.word()}')
+
+
+# name: (function, view endpoint, needs a logged-in user)
+SCENARIOS = {
+    'index': (index, 'blog.index', False),
+    'post_detail': (post_detail, 'blog.post_detail', False),
+    'dashboard': (dashboard, 'blog.dashboard', True),
+    'login': (login, 'blog.login', False),
+    'add_comment': (add_comment, 'blog.add_comment', True),
+    'api_posts': (api_posts, 'blog.api_posts', False),
+    'api_post': (api_post, 'blog.api_post', False),
+    'api_post_comments': (api_post_comments, 'blog.api_post_comments', False),
+    'api_search': (api_search, 'blog.api_search', False),
+}
+
+
+class QueryCounter:
+    """Counts SQL statements run by the current thread between start() and stop()."""
+
+    def __init__(self):
+        self.local = threading.local()
+
+    def install(self):
+        from sqlalchemy import event
+        from sqlalchemy.engine import Engine
+        event.listen(Engine, 'before_cursor_execute', self.count)
+
+    def count(self, *args):
+        if getattr(self.local, 'active', False):
+            self.local.queries += 1
+
+    def start(self):
+        self.local.active = True
+        self.local.queries = 0
+
+    def stop(self):
+        self.local.active = False
+        return self.local.queries
+
+
+class NoQueryCounter:
+    """Stand-in when the server runs in another process; see scrape_queries."""
+
+    def start(self):
+        pass
+
+    def stop(self):
+        return None
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, math.ceil(fraction * len(ordered)) - 1))]
+
+
+def run_scenario(name, make_client, context, requests, concurrency, warmup):
+    fn, _, needs_login = SCENARIOS[name]
+    users = [VirtualUser(make_client(), context, number) for number in range(concurrency)]
+    for user in users:
+        if needs_login:
+            user.login()
+    for _ in range(warmup):
+        fn(users[0])
+    users[0].samples = []
+
+    remaining = itertools.count()
+    lock = threading.Lock()
+
+    def worker(user):
+        while True:
+            with lock:
+                if next(remaining) >= requests:
+                    return
+            fn(user)
+
+    began = time.perf_counter()
+    threads = [threading.Thread(target=worker, args=(user,)) for user in users]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - began
+
+    samples = [sample for user in users for sample in user.samples]
+    latencies = [seconds for seconds, _, _ in samples]
+    queries = [count for _, count, _ in samples if count is not None]
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for _, _, ok in samples if not ok),
+        'throughput': round(len(samples) / elapsed, 2),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 2),
+        'queries_per_request': round(sum(queries) / len(queries), 2) if queries else None,
+    }
+
+
+def scrape_queries(client):
+    """Average SQL statements per request by endpoint, from the server's /metrics.
+
+    This also counts the untimed requests of each scenario (such as the
+    login form fetched for its CSRF token), and with several gunicorn
+    workers only covers the worker that answers.
+    """
+    token = os.environ.get('METRICS_TOKEN')
+    if token:
+        client.opener.addheaders = [('Authorization', f'Bearer {token}')]
+    status, body = client.request('GET', '/metrics')
+    totals = {}
+    for kind, endpoint, value in METRIC_PATTERN.findall(body):
+        totals.setdefault(endpoint, {})[kind] = float(value)
+    return {endpoint: round(t['sum'] / t['count'], 2) for endpoint, t in totals.items() if t.get('count')}
+
+
+def discover_post_ids(client, pages=5):
+    """Sample post ids through the API, so any server and backend will do."""
+    ids = []
+    cursor = None
+    for _ in range(pages):
+        path = '/api/posts?limit=100' + (f'&cursor={urllib.parse.quote(cursor)}' if cursor else '')
+        status, body = client.request('GET', path)
+        if status != 200:
+            raise RuntimeError(f"GET {path} returned {status}")
+        page = json.loads(body)
+        ids.extend(post['id'] for post in page['posts'])
+        cursor = page.get('next_cursor')
+        if not cursor:
+            break
+    if not ids:
+        raise RuntimeError("The database has no posts; seed it with benchmarks/dataset.py")
+    return ids
+
+
+def ensure_dataset(app, args):
+    """Seed the database in-process unless it already holds the benchmark users."""
+    from app import db
+    from models import User
+    import dataset
+    with app.app_context():
+        if args.reseed:
+            dataset.reset(db)
+        elif User.query.filter_by(email=dataset.user_email(0)).first() is not None:
+            return
+        counts = dataset.seed(db, users=args.users, posts=args.posts, seed_value=args.seed)
+    print(f"Seeded {counts['users']} users, {counts['posts']} posts and {counts['comments']} comments")
+
+
+def start_gunicorn(args):
+    port = args.port
+    command = [sys.executable, '-m', 'gunicorn', '--chdir', ROOT, '-w', str(args.workers),
+               '-b', f'127.0.0.1:{port}', '--log-level', 'warning', 'main:app']
+    server = subprocess.Popen(command, env=os.environ.copy())
+    client = HttpClient(f'http://127.0.0.1:{port}')
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            sys.exit(f"gunicorn exited with status {server.returncode}")
+        try:
+            if client.request('GET', '/api/posts?limit=1')[0] == 200:
+                return server, f'http://127.0.0.1:{port}'
+        except (urllib.error.URLError, ConnectionError):
+            pass
+        time.sleep(0.2)
+    server.terminate()
+    sys.exit("gunicorn did not start within 30 seconds")
+
+
+def compare(results, baseline, latency_tolerance, latency_slack, query_tolerance):
+    """Print regressions against a baseline; return whether there were any.
+
+    Timings regress when they grow by more than latency_tolerance (relative)
+    plus latency_slack milliseconds, so that noise on sub-millisecond cached
+    responses does not fail the gate. Throughput gets the relative tolerance
+    only: a millisecond of slack per request would let a fast endpoint lose
+    most of its throughput unnoticed.
+    """
+    def slower(previous_ms, current_ms):
+        return current_ms > previous_ms * (1 + latency_tolerance) + latency_slack
+
+    regressions = []
+    for name, current in results.items():
+        previous = baseline['results'].get(name)
+        if previous is None:
+            continue
+        if slower(previous['p95_ms'], current['p95_ms']):
+            regressions.append(f"{name}: p95 {previous['p95_ms']}ms -> {current['p95_ms']}ms")
+        if current['throughput'] * (1 + latency_tolerance) < previous['throughput']:
+            regressions.append(f"{name}: throughput {previous['throughput']} -> {current['throughput']} req/s")
+        if current['queries_per_request'] is not None and previous['queries_per_request'] is not None \
+                and current['queries_per_request'] > previous['queries_per_request'] + query_tolerance:
+            regressions.append(f"{name}: queries/request {previous['queries_per_request']} -> "
+                               f"{current['queries_per_request']}")
+        if current['errors'] > previous['errors']:
+            regressions.append(f"{name}: errors {previous['errors']} -> {current['errors']}")
+    for line in regressions:
+        print(f"REGRESSION {line}")
+    if not regressions:
+        print(f"No regressions against the baseline from {baseline['meta']['date']}")
+    return bool(regressions)
+
+
+def print_results(results):
+    print(f"{'scenario':<20}{'requests':>9}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'queries':>9}")
+    for name, r in results.items():
+        queries = '-' if r['queries_per_request'] is None else r['queries_per_request']
+        print(f"{name:<20}{r['requests']:>9}{r['errors']:>8}{r['throughput']:>10}{r['p50_ms']:>10}"
+              f"{r['p95_ms']:>10}{r['p99_ms']:>10}{queries:>9}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--requests', type=int, default=200, help='timed requests per scenario')
+    parser.add_argument('-c', '--concurrency', type=int, default=1, help='concurrent virtual users')
+    parser.add_argument('--warmup', type=int, default=10, help='untimed requests per scenario')
+    parser.add_argument('--scenarios', default=','.join(SCENARIOS), help='comma-separated scenarios to run')
+    parser.add_argument('--users', type=int, default=50, help='users to seed and log in as')
+    parser.add_argument('--posts', type=int, default=2000, help='posts to seed')
+    parser.add_argument('--seed', type=int, default=1, help='random seed for the dataset and the requests')
+    parser.add_argument('--reseed', action='store_true', help='replace the existing dataset')
+    parser.add_argument('--gunicorn', action='store_true', help='start a local gunicorn and test over HTTP')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--port', type=int, default=8765)
+    parser.add_argument('--url', help='test a running server instead (seed it with benchmarks/dataset.py)')
+    parser.add_argument('--output', help='write the results as JSON to this file')
+    parser.add_argument('--save-baseline', metavar='PATH', help='write the results as the new baseline')
+    parser.add_argument('--baseline', metavar='PATH', help='compare against a baseline and fail on regressions')
+    parser.add_argument('--latency-tolerance', type=float, default=0.25,
+                        help='allowed relative p95/throughput regression (default: 0.25)')
+    parser.add_argument('--latency-slack', type=float, default=1.0,
+                        help='milliseconds allowed on top of the relative tolerance (default: 1.0)')
+    parser.add_argument('--query-tolerance', type=float, default=0.5,
+                        help='allowed increase in queries per request (default: 0.5)')
+    args = parser.parse_args()
+
+    names = [name.strip() for name in args.scenarios.split(',') if name.strip()]
+    unknown = [name for name in names if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    # Configure the app before it is created: its own benchmark database,
+    # and no login throttling or slow-request logging in the way
+    os.environ.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(tempfile.gettempdir(), 'blog-benchmark.db')}")
+    os.environ.setdefault('LOGIN_ATTEMPTS_PER_IP', '0')
+    os.environ.setdefault('LOGIN_ATTEMPTS_PER_ACCOUNT', '0')
+    os.environ.setdefault('SLOW_REQUEST_MS', '600000')
+    os.environ.setdefault('SLOW_REQUEST_QUERIES', '100000')
+    os.environ.setdefault('LOG_LEVEL', 'WARNING')
+
+    import dataset
+    server = None
+    if args.url:
+        base_url = args.url
+        mode = 'http'
+    else:
+        app = dataset.create_app()
+        ensure_dataset(app, args)
+        if args.gunicorn:
+            server, base_url = start_gunicorn(args)
+            mode = 'gunicorn'
+        else:
+            mode = 'client'
+
+    if mode == 'client':
+        app.config['WTF_CSRF_TIME_LIMIT'] = None
+        counter = QueryCounter()
+        counter.install()
+        make_client = lambda: AppClient(app)
+    else:
+        counter = NoQueryCounter()
+        make_client = lambda: HttpClient(base_url)
+
+    try:
+        context = {
+            'seed': args.seed,
+            'users': args.users,
+            'password': dataset.PASSWORD,
+            'post_ids': discover_post_ids(make_client()),
+            'words': dataset.vocabulary(random.Random(args.seed))[:200],
+            'query_counter': counter,
+        }
+        results = {}
+        for name in names:
+            results[name] = run_scenario(name, make_client, context, args.requests, args.concurrency, args.warmup)
+            print(f"{name}: {results[name]['throughput']} req/s, p95 {results[name]['p95_ms']}ms", file=sys.stderr)
+        if mode != 'client':
+            scraped = scrape_queries(make_client())
+            for name, result in results.items():
+                result['queries_per_request'] = scraped.get(SCENARIOS[name][1])
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    print_results(results)
+    report = {
+        'meta': {
+            'date': datetime.utcnow().isoformat(timespec='seconds'),
+            'mode': mode,
+            'database': os.environ['DATABASE_URL'].split(':', 1)[0] if mode != 'http' else None,
+            'requests': args.requests,
+            'concurrency': args.concurrency,
+            'workers': args.workers if mode == 'gunicorn' else None,
+            'python': platform.python_version(),
+            'platform': platform.platform(),
+        },
+        'results': results,
+    }
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2)
+                f.write('\n')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline['meta'].get('mode') != mode:
+            print(f"Warning: the baseline was measured in {baseline['meta'].get('mode')} mode, this run in {mode} mode")
+        if compare(results, baseline, args.latency_tolerance, args.latency_slack, args.query_tolerance):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Password hashing benchmark
+Reports hashes per second for one server worker with the configured
+PASSWORD_HASH_METHOD, PASSWORD_HASH_POOL and PASSWORD_HASH_WORKERS.
+
+Usage: PASSWORD_HASH_METHOD=scrypt:16384:8:1 python benchmarks/password_hashing.py [-n 50]
+"""
+
+import argparse
+import os
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from flask import Flask
+from security import PasswordHasher
+
+
+def make_hasher():
+    app = Flask(__name__)
+    app.config["PASSWORD_HASH_METHOD"] = os.environ.get("PASSWORD_HASH_METHOD", "scrypt")
+    app.config["PASSWORD_HASH_POOL"] = os.environ.get("PASSWORD_HASH_POOL", "thread")
+    app.config["PASSWORD_HASH_WORKERS"] = int(os.environ.get("PASSWORD_HASH_WORKERS", 2))
+    app.config["PASSWORD_HASH_QUEUE"] = 1000
+    return PasswordHasher(app)
+
+
+def measure(label, fn, count, concurrency):
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as requests:
+        list(requests.map(lambda _: fn(), range(count)))
+    elapsed = time.perf_counter() - start
+    print(f"{label:<28} {count / elapsed:8.1f} hashes/sec  ({elapsed * 1000 / count:.1f} ms each)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-n', '--count', type=int, default=20, help='hashes per measurement')
+    parser.add_argument('-c', '--concurrency', type=int, default=8, help='simulated concurrent logins')
+    args = parser.parse_args()
+
+    hasher = make_hasher()
+    print(f"method={hasher.prefix} pool={hasher.pool_type} workers={hasher.workers}")
+    stored = hasher.hash('correct horse battery staple')
+
+    measure('hash, 1 request at a time', lambda: hasher.hash('password'), args.count, 1)
+    measure('verify, 1 request at a time', lambda: hasher.verify(stored, 'password'), args.count, 1)
+    measure(f'verify, {args.concurrency} concurrent', lambda: hasher.verify(stored, 'password'),
+            args.count, args.concurrency)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,185 @@
+#!/usr/bin/env python3
+"""
+Startup benchmark
+Measures what a new worker process pays before it serves its first
+request: starting the interpreter, importing the app module, create_app()
+and the first request, with a second (warm) request for comparison. Every
+run is a fresh interpreter, as a new gunicorn worker or a cold start would
+be.
+
+With --gunicorn it instead launches a local gunicorn per run and reports,
+for each worker, the time from launch until the worker has loaded the app,
+and the time until the server answered its first request.
+
+The schema is created once beforehand with ``flask upgrade-db``, so no
+schema work is included in the timings.
+
+Usage:
+  python benchmarks/startup.py --runs 10
+  python benchmarks/startup.py --gunicorn --workers 4 --runs 3
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs in the fresh interpreter; prints its timings as JSON
+PROBE = """
+import json, sys, time
+started = time.time()
+began = time.perf_counter()
+import app
+imported = time.perf_counter()
+modules = len(sys.modules)
+application = app.create_app()
+created = time.perf_counter()
+client = application.test_client()
+status = client.get(sys.argv[1]).status_code
+first = time.perf_counter()
+client.get(sys.argv[1])
+second = time.perf_counter()
+print(json.dumps({
+    'started': started,
+    'import_ms': (imported - began) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'first_request_ms': (first - created) * 1000,
+    'second_request_ms': (second - first) * 1000,
+    'modules_after_import': modules,
+    'modules_after_create_app': len(sys.modules),
+    'status': status,
+}))
+"""
+
+# Gunicorn config: each worker appends "pid time" once it has loaded the app
+GUNICORN_HOOKS = """
+import time
+
+def post_worker_init(worker):
+    with open(READY_LOG, 'a') as log:
+        log.write(f'{worker.pid} {time.time()}\\n')
+"""
+
+
+def upgrade_schema(env):
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'main', 'upgrade-db'],
+                   cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL)
+
+
+def probe(env, path):
+    """Time one cold start in a new interpreter."""
+    launched = time.time()
+    result = subprocess.run([sys.executable, '-c', PROBE, path], cwd=ROOT, env=env,
+                            check=True, capture_output=True, text=True)
+    timings = json.loads(result.stdout.strip().splitlines()[-1])
+    if timings['status'] >= 400:
+        sys.exit(f"GET {path} returned {timings['status']}")
+    timings['interpreter_ms'] = (timings.pop('started') - launched) * 1000
+    timings['time_to_first_request_ms'] = sum(timings[key] for key in (
+        'interpreter_ms', 'import_ms', 'create_app_ms', 'first_request_ms'))
+    return timings
+
+
+def wait_for(url, server, timeout=60):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            sys.exit(f"gunicorn exited with status {server.returncode}")
+        try:
+            with urllib.request.urlopen(url, timeout=5) as response:
+                if response.status < 400:
+                    return
+        except (urllib.error.URLError, ConnectionError):
+            pass
+        time.sleep(0.01)
+    sys.exit(f"gunicorn did not answer within {timeout} seconds")
+
+
+def gunicorn_run(env, path, workers, port, workdir):
+    """Time one gunicorn launch: per-worker app load and the first response."""
+    ready_log = os.path.join(workdir, 'ready.log')
+    config = os.path.join(workdir, 'gunicorn_startup.py')
+    with open(config, 'w') as f:
+        f.write(f'READY_LOG = {ready_log!r}\n' + GUNICORN_HOOKS)
+    if os.path.exists(ready_log):
+        os.remove(ready_log)
+
+    command = [sys.executable, '-m', 'gunicorn', '--chdir', ROOT, '-c', config, '-w', str(workers),
+               '-b', f'127.0.0.1:{port}', '--log-level', 'warning', 'main:app']
+    launched = time.time()
+    server = subprocess.Popen(command, env=env)
+    try:
+        wait_for(f'http://127.0.0.1:{port}{path}', server)
+        answered = time.time()
+        # Give slower workers a moment to report in
+        deadline = time.monotonic() + 30
+        ready = []
+        while time.monotonic() < deadline:
+            with open(ready_log) as log:
+                ready = [float(line.split()[1]) for line in log if line.strip()]
+            if len(ready) >= workers:
+                break
+            time.sleep(0.05)
+    finally:
+        server.terminate()
+        server.wait()
+    return {
+        'first_response_ms': (answered - launched) * 1000,
+        'worker_ready_ms': sorted((at - launched) * 1000 for at in ready),
+    }
+
+
+def summarize(name, values):
+    values = sorted(values)
+    return f"{name:<28}{statistics.median(values):>10.1f}{values[0]:>10.1f}{values[-1]:>10.1f}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5, help='cold starts to time')
+    parser.add_argument('--path', default='/', help='path of the first request')
+    parser.add_argument('--gunicorn', action='store_true', help='time a local gunicorn instead')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--port', type=int, default=8766)
+    args = parser.parse_args()
+
+    env = os.environ.copy()
+    env.setdefault('DATABASE_URL', f"sqlite:///{os.path.join(tempfile.gettempdir(), 'blog-startup.db')}")
+    env.setdefault('LOG_LEVEL', 'WARNING')
+    upgrade_schema(env)
+
+    header = f"{'':<28}{'median ms':>10}{'min ms':>10}{'max ms':>10}"
+    if args.gunicorn:
+        runs = []
+        with tempfile.TemporaryDirectory() as workdir:
+            for _ in range(args.runs):
+                runs.append(gunicorn_run(env, args.path, args.workers, args.port, workdir))
+        print(f"gunicorn, {args.workers} worker(s), {args.runs} run(s)")
+        print(header)
+        print(summarize('first response', [run['first_response_ms'] for run in runs]))
+        for number in range(args.workers):
+            times = [run['worker_ready_ms'][number] for run in runs if len(run['worker_ready_ms']) > number]
+            if times:
+                print(summarize(f'worker {number + 1} app loaded', times))
+        return
+
+    runs = [probe(env, args.path) for _ in range(args.runs)]
+    print(f"Cold start, GET {args.path}, {args.runs} run(s)")
+    print(header)
+    for key in ('interpreter_ms', 'import_ms', 'create_app_ms', 'first_request_ms',
+                'second_request_ms', 'time_to_first_request_ms'):
+        print(summarize(key.removesuffix('_ms').replace('_', ' '), [run[key] for run in runs]))
+    print(f"Modules loaded: {runs[-1]['modules_after_import']} after import, "
+          f"{runs[-1]['modules_after_create_app']} after create_app()")
+
+
+if __name__ == "__main__":
+    main()
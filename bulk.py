@@ -0,0 +1,230 @@
+import json
+import logging
+from datetime import datetime
+import click
+from flask.cli import with_appcontext
+from sqlalchemy.exc import SQLAlchemyError
+from werkzeug.datastructures import MultiDict
+from app import db, response_cache, comment_feed
+from models import User, Post, Comment
+from forms import PostForm, CommentForm
+import search
+
+BATCH_SIZE = 500
+
+
+class ItemError(ValueError):
+    """Raised when a single imported item is invalid."""
+
+    def __init__(self, errors):
+        super().__init__(errors)
+        self.errors = errors
+
+
+def iter_json_items(stream, ndjson=False):
+    """Yield (index, item) pairs from a JSON array or an NDJSON stream.
+
+    NDJSON is read line by line, so large imports are never held in memory.
+    Lines that are not valid JSON are yielded as ItemError instances.
+    """
+    if not ndjson:
+        items = json.load(stream)
+        if not isinstance(items, list):
+            raise ValueError("Expected a JSON array")
+        yield from enumerate(items)
+        return
+
+    index = 0
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            yield index, json.loads(line)
+        except ValueError as e:
+            yield index, ItemError({'json': [str(e)]})
+        index += 1
+
+
+def validate(form_class, item, fields):
+    """Validate an item with the same rules as the HTML form."""
+    if isinstance(item, ItemError):
+        raise item
+    if not isinstance(item, dict):
+        raise ItemError({'item': ['Expected a JSON object']})
+    data = {name: item.get(name) for name in fields}
+    if not all(value is None or isinstance(value, str) for value in data.values()):
+        raise ItemError({'item': ['Fields must be strings']})
+    form = form_class(formdata=MultiDict({k: v for k, v in data.items() if v is not None}), meta={'csrf': False})
+    if not form.validate():
+        raise ItemError(form.errors)
+    return {name: form[name].data for name in fields}
+
+
+def timestamps(item):
+    """Keep an imported item's original created_at, if it has one."""
+    value = item.get('created_at')
+    if value is None:
+        return {}
+    try:
+        created_at = datetime.fromisoformat(value)
+    except (TypeError, ValueError):
+        raise ItemError({'created_at': ['Must be an ISO 8601 timestamp']})
+    return {'created_at': created_at, 'updated_at': created_at}
+
+
+def build_post(item, user_id):
+    """Turn an import item into a Post followed by its nested comments."""
+    data = validate(PostForm, item, ('title', 'content'))
+    post = Post(title=data['title'], content=data['content'], user_id=user_id, **timestamps(item))
+    post.render_content()
+    comments = item.get('comments') or []
+    if not isinstance(comments, list):
+        raise ItemError({'comments': ['Expected a JSON array']})
+    objects = [post]
+    for position, comment_item in enumerate(comments):
+        try:
+            comment = build_comment(comment_item, user_id)
+        except ItemError as e:
+            raise ItemError({f'comments[{position}]': e.errors})
+        comment.post = post
+        objects.append(comment)
+    return objects
+
+
+def build_comment(item, user_id):
+    """Turn an import item into a Comment."""
+    data = validate(CommentForm, item, ('content',))
+    comment = Comment(content=data['content'], user_id=user_id, **timestamps(item))
+    if 'post_id' in item:
+        if not isinstance(item['post_id'], int):
+            raise ItemError({'post_id': ['Must be an integer']})
+        comment.post_id = item['post_id']
+    return comment
+
+
+def index_objects(objects):
+    for obj in objects:
+        if isinstance(obj, Post):
+            search.index_post(obj)
+        else:
+            search.index_comment(obj)
+
+
+def save_batch(batch, results):
+    """Insert one batch in a single transaction.
+
+    If the batch fails as a whole, it is retried item by item inside
+    savepoints so that only the offending items are reported.
+    """
+    try:
+        for _, objects in batch:
+            db.session.add_all(objects)
+        db.session.flush()
+        for _, objects in batch:
+            index_objects(objects)
+        db.session.commit()
+        results.extend({'index': index, 'success': True, 'id': objects[0].id} for index, objects in batch)
+        return
+    except SQLAlchemyError:
+        db.session.rollback()
+
+    saved = []
+    for index, objects in batch:
+        try:
+            with db.session.begin_nested():
+                db.session.add_all(objects)
+                db.session.flush()
+                index_objects(objects)
+            saved.append((index, objects))
+        except SQLAlchemyError as e:
+            logging.warning(f"Bulk import item {index} failed: {e}")
+            results.append({'index': index, 'success': False, 'errors': {'database': ['Could not be saved']}})
+    db.session.commit()
+    results.extend({'index': index, 'success': True, 'id': objects[0].id} for index, objects in saved)
+
+
+def import_items(items, build, user_id, batch_size=BATCH_SIZE):
+    """Validate and insert (index, item) pairs in batched transactions.
+
+    ``build`` turns an item into the list of objects to insert, the first
+    of which is the one reported back. Returns a summary with one result
+    per item, in input order.
+    """
+    results = []
+    batch = []
+    for index, item in items:
+        try:
+            batch.append((index, build(item, user_id)))
+        except ItemError as e:
+            results.append({'index': index, 'success': False, 'errors': e.errors})
+        if len(batch) >= batch_size:
+            save_batch(batch, results)
+            batch = []
+    if batch:
+        save_batch(batch, results)
+
+    response_cache.invalidate('post-list')
+    results.sort(key=lambda result: result['index'])
+    created = sum(1 for result in results if result['success'])
+    return {'created': created, 'failed': len(results) - created, 'results': results}
+
+
+def import_posts(items, user_id, batch_size=BATCH_SIZE):
+    """Import posts (optionally with nested comments) owned by user_id."""
+    return import_items(items, build_post, user_id, batch_size)
+
+
+def import_comments(items, user_id, batch_size=BATCH_SIZE):
+    """Import comments by user_id onto existing posts."""
+    known_posts = {}
+
+    def build(item, user_id):
+        comment = build_comment(item, user_id)
+        if comment.post_id is None:
+            raise ItemError({'post_id': ['This field is required.']})
+        if comment.post_id not in known_posts:
+            exists = db.session.query(Post.id).filter_by(id=comment.post_id).first() is not None
+            known_posts[comment.post_id] = exists
+        if not known_posts[comment.post_id]:
+            raise ItemError({'post_id': ['Post does not exist']})
+        return [comment]
+
+    summary = import_items(items, build, user_id, batch_size)
+    changed = [post_id for post_id, exists in known_posts.items() if exists]
+    response_cache.invalidate(*(f'post:{post_id}' for post_id in changed))
+    for post_id in changed:
+        comment_feed.comments_changed(post_id)
+    return summary
+
+
+@click.command('import-posts')
+@click.argument('path', type=click.File('r'))
+@click.option('--user', 'email', required=True, help='Email of the user who will own the posts.')
+@click.option('--ndjson', is_flag=True, help='Read one JSON object per line instead of a JSON array.')
+@click.option('--batch-size', default=BATCH_SIZE, show_default=True)
+@with_appcontext
+def import_posts_command(path, email, ndjson, batch_size):
+    """Import posts from a JSON array or NDJSON file."""
+    run_import(import_posts, path, email, ndjson, batch_size)
+
+
+@click.command('import-comments')
+@click.argument('path', type=click.File('r'))
+@click.option('--user', 'email', required=True, help='Email of the user who will author the comments.')
+@click.option('--ndjson', is_flag=True, help='Read one JSON object per line instead of a JSON array.')
+@click.option('--batch-size', default=BATCH_SIZE, show_default=True)
+@with_appcontext
+def import_comments_command(path, email, ndjson, batch_size):
+    """Import comments from a JSON array or NDJSON file."""
+    run_import(import_comments, path, email, ndjson, batch_size)
+
+
+def run_import(importer, path, email, ndjson, batch_size):
+    user = User.query.filter_by(email=User.normalize_email(email)).first()
+    if user is None:
+        raise click.ClickException(f"No user with email {email}")
+    summary = importer(iter_json_items(path, ndjson), user.id, batch_size)
+    for result in summary['results']:
+        if not result['success']:
+            click.echo(f"item {result['index']}: {json.dumps(result['errors'])}", err=True)
+    click.echo(f"Created {summary['created']}, failed {summary['failed']}")
@@ -0,0 +1,261 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from functools import wraps
+from flask import current_app, g, request, session, make_response
+from flask_login import current_user
+
+
+class LocalCache:
+    """Thread-safe in-process LRU cache with a per-entry TTL.
+
+    Counters from incr() (tag versions, login throttling) are kept apart
+    from the LRU entries, so that a burst of cached pages cannot evict
+    them; expired counters are swept as more are created.
+    """
+
+    def __init__(self, max_entries=1024, default_ttl=300):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self._data = OrderedDict()
+        self._counters = {}
+        self._sweep_at = max_entries
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            if key in self._counters:
+                expires_at, value = self._counters[key]
+                if expires_at is not None and expires_at < time.monotonic():
+                    del self._counters[key]
+                    return None
+                return value
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at is not None and expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        expires_at = time.monotonic() + ttl if ttl else None
+        with self._lock:
+            self._data[key] = (expires_at, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+            self._counters.pop(key, None)
+
+    def incr(self, key, ttl=None):
+        """Atomically increment an integer counter.
+
+        A new counter expires after ttl seconds (never, if ttl is None);
+        incrementing keeps the existing expiry.
+        """
+        now = time.monotonic()
+        with self._lock:
+            expires_at, value = self._counters.get(key, (None, 0))
+            if expires_at is not None and expires_at < now:
+                expires_at, value = None, 0
+            if value == 0 and ttl:
+                expires_at = now + ttl
+            self._counters[key] = (expires_at, value + 1)
+            if len(self._counters) > self._sweep_at:
+                self._counters = {k: entry for k, entry in self._counters.items()
+                                  if entry[0] is None or entry[0] >= now}
+                self._sweep_at = max(self.max_entries, 2 * len(self._counters))
+            return value + 1
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self._counters.clear()
+
+
+class RedisCache:
+    """Cache shared between workers, backed by Redis (optional dependency)."""
+
+    def __init__(self, url, default_ttl=300, prefix='blog:'):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("CACHE_TYPE 'redis' requires the redis package") from e
+        self.client = redis.Redis.from_url(url)
+        self.default_ttl = default_ttl
+        self.prefix = prefix
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        return pickle.loads(value) if value is not None else None
+
+    def set(self, key, value, ttl=None):
+        ttl = self.default_ttl if ttl is None else ttl
+        self.client.set(self.prefix + key, pickle.dumps(value), ex=ttl or None)
+
+    def delete(self, key):
+        self.client.delete(self.prefix + key)
+
+    def incr(self, key, ttl=None):
+        value = self.client.incr(self.prefix + key)
+        if value == 1 and ttl:
+            self.client.expire(self.prefix + key, ttl)
+        return value
+
+    def clear(self):
+        for key in self.client.scan_iter(self.prefix + '*'):
+            self.client.delete(key)
+
+
+class NullCache:
+    """Cache backend that stores nothing; used to switch caching off."""
+
+    def get(self, key):
+        return None
+
+    def set(self, key, value, ttl=None):
+        pass
+
+    def delete(self, key):
+        pass
+
+    def incr(self, key, ttl=None):
+        return 0
+
+    def clear(self):
+        pass
+
+
+class ResponseCache:
+    """Caches rendered GET responses, invalidated by tag.
+
+    Every cache key embeds the current version of the tags it depends on
+    (e.g. ``post-list`` or ``post:42``). Invalidating a tag bumps its
+    version, so dependent entries are never read again and age out of
+    the backend on their own.
+
+    Right after a tag is bumped, read replicas may not have the write yet,
+    so for REPLICA_STICKY_SECONDS responses read from a replica are served
+    but not stored under the new version.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('CACHE_TYPE', 'local')
+        app.config.setdefault('CACHE_DEFAULT_TTL', 300)
+        app.config.setdefault('CACHE_MAX_ENTRIES', 1024)
+        app.config.setdefault('CACHE_REDIS_URL', None)
+
+        cache_type = app.config['CACHE_TYPE']
+        ttl = app.config['CACHE_DEFAULT_TTL']
+        if cache_type == 'local':
+            backend = LocalCache(app.config['CACHE_MAX_ENTRIES'], ttl)
+        elif cache_type == 'redis':
+            backend = RedisCache(app.config['CACHE_REDIS_URL'], ttl)
+        elif cache_type == 'null':
+            backend = NullCache()
+        else:
+            raise ValueError(f"Unknown CACHE_TYPE: {cache_type}")
+        app.extensions['response_cache'] = backend
+
+    @property
+    def backend(self):
+        """The cache backend of the current app."""
+        return current_app.extensions['response_cache']
+
+    def tag_version(self, tag):
+        return self.backend.get(f'tag:{tag}') or 0
+
+    def invalidate(self, *tags):
+        """Drop every cached response that depends on any of the given tags."""
+        replica_lag = current_app.config.get('REPLICA_STICKY_SECONDS')
+        for tag in tags:
+            version = self.backend.incr(f'tag:{tag}')
+            if replica_lag and version:
+                self.backend.incr(f'tag-new:{tag}={version}', ttl=replica_lag)
+
+    def clear(self):
+        self.backend.clear()
+
+    def tag_versions(self, tags):
+        return [(tag, self.tag_version(tag)) for tag in tags]
+
+    def make_key(self, versions):
+        tags = ','.join(f'{tag}={version}' for tag, version in versions)
+        query = '&'.join(f'{k}={v}' for k, v in sorted(request.args.items(multi=True)))
+        return f'view:{request.path}?{query}|{tags}'
+
+    def storable(self, versions):
+        """Whether what this request read may be cached under the given tag versions."""
+        if not current_app.config.get('REPLICA_STICKY_SECONDS') or g.get('read_replica') is None:
+            return True
+        return not any(self.backend.get(f'tag-new:{tag}={version}') for tag, version in versions)
+
+    def shared(self):
+        """Whether every process serving the current request sees the same cache.
+
+        A local cache lives in one process, so under a server running
+        several (``wsgi.multiprocess``) a tag bumped in one of them is not
+        seen by the others.
+        """
+        return not (isinstance(self.backend, LocalCache) and request.environ.get('wsgi.multiprocess'))
+
+    def memoize(self, name, tags, fn):
+        """Return fn() for the current request, cached under the given tags.
+
+        Nothing is memoized unless the cache is shared: a value kept by one
+        process would outlive invalidations made in the others.
+        """
+        if not self.shared():
+            return fn()
+        versions = self.tag_versions(tags)
+        key = f'{name}:{self.make_key(versions)}'
+        value = self.backend.get(key)
+        if value is None:
+            value = fn()
+            if value is not None and self.storable(versions):
+                self.backend.set(key, value)
+        return value
+
+    def cached(self, tags, anonymous_only=False, unless=None):
+        """Decorator caching a view's successful GET responses.
+
+        ``tags`` is called with the view arguments and returns the tags the
+        response depends on. With ``anonymous_only`` the cache is bypassed
+        for logged-in users and for requests with pending flash messages,
+        since those pages are rendered per user.
+        """
+        def decorator(f):
+            @wraps(f)
+            def decorated(*args, **kwargs):
+                if request.method != 'GET' or (unless is not None and unless()):
+                    return f(*args, **kwargs)
+                if anonymous_only and ('_flashes' in session or current_user.is_authenticated):
+                    return f(*args, **kwargs)
+
+                versions = self.tag_versions(tags(**kwargs))
+                key = self.make_key(versions)
+                hit = self.backend.get(key)
+                if hit is not None:
+                    body, status, mimetype = hit
+                    response = make_response(body, status)
+                    response.mimetype = mimetype
+                    return response
+
+                response = make_response(f(*args, **kwargs))
+                if response.status_code == 200 and not response.is_streamed and self.storable(versions):
+                    self.backend.set(key, (response.get_data(), response.status_code, response.mimetype))
+                return response
+            return decorated
+        return decorator
@@ -0,0 +1,75 @@
+import os
+from sqlalchemy import event
+from sqlalchemy.engine import make_url
+
+# Pragmas applied to every new SQLite connection
+SQLITE_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,
+    'mmap_size': 256 * 1024 * 1024,
+    'temp_store': 'MEMORY',
+}
+
+
+def env_int(name, default):
+    value = os.environ.get(name)
+    return int(value) if value else default
+
+
+def env_bool(name, default=False):
+    value = os.environ.get(name)
+    return value.lower() in ('1', 'true', 'yes') if value else default
+
+
+def sqlite_pragmas():
+    """SQLite pragmas, with busy timeout and mmap size overridable from the environment."""
+    pragmas = dict(SQLITE_PRAGMAS)
+    pragmas['busy_timeout'] = env_int('SQLITE_BUSY_TIMEOUT', pragmas['busy_timeout'])
+    pragmas['mmap_size'] = env_int('SQLITE_MMAP_SIZE', pragmas['mmap_size'])
+    return pragmas
+
+
+def engine_options(database_url):
+    """Engine options suited to the database backend of the given URL.
+
+    SQLite connections are local files, so they need no pre-ping or
+    recycling; they get their tuning from pragmas instead. PostgreSQL gets
+    a sized pool and a server-side statement timeout.
+    """
+    backend = make_url(database_url).get_backend_name()
+    if backend == 'sqlite':
+        return {}
+    if backend == 'postgresql':
+        options = {
+            'pool_size': env_int('DB_POOL_SIZE', 5),
+            'max_overflow': env_int('DB_MAX_OVERFLOW', 10),
+            'pool_timeout': env_int('DB_POOL_TIMEOUT', 30),
+            'pool_recycle': env_int('DB_POOL_RECYCLE', 1800),
+            'pool_pre_ping': env_bool('DB_POOL_PRE_PING'),
+        }
+        statement_timeout = env_int('DB_STATEMENT_TIMEOUT', 0)
+        if statement_timeout:
+            options['connect_args'] = {'options': f'-c statement_timeout={statement_timeout}'}
+        return options
+    return {'pool_pre_ping': True, 'pool_recycle': 300}
+
+
+def apply_sqlite_pragmas(engine, pragmas):
+    """Run the given pragmas on every new connection of a SQLite engine."""
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def set_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for name, value in pragmas.items():
+            cursor.execute(f'PRAGMA {name}={value}')
+        cursor.close()
+
+
+def configure_engines(app, db):
+    """Install per-backend connection hooks on the app's engines."""
+    with app.app_context():
+        for engine in db.engines.values():
+            apply_sqlite_pragmas(engine, sqlite_pragmas())
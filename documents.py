@@ -0,0 +1,427 @@
+import glob
+import html
+import logging
+import os
+import re
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+from html.parser import HTMLParser
+
+FORMATS = {
+    'pdf': 'application/pdf',
+    'docx': 'application/vnd.openxmlformats-officedocument.wordprocessingml.document',
+}
+PRINT_CSS = """
+@page { size: A4; margin: 2cm; }
+body { font-family: serif; font-size: 11pt; line-height: 1.5; }
+h1.title { font-size: 22pt; margin-bottom: 0; }
+.byline { color: #555; font-style: italic; }
+pre, code { font-family: monospace; font-size: 9pt; }
+pre { background: #f4f4f4; padding: 6pt; white-space: pre-wrap; }
+img { max-width: 100%; }
+table { border-collapse: collapse; }
+td, th { border: 1px solid #999; padding: 3pt 6pt; }
+"""
+HEADINGS = {'h1', 'h2', 'h3', 'h4', 'h5', 'h6'}
+BLOCKS = HEADINGS | {'p', 'pre', 'li', 'tr'}
+# Width of the text on an A4 page with 2cm margins, in points
+TEXT_WIDTH = 482
+
+
+class BlockParser(HTMLParser):
+    """Flattens rendered post HTML into paragraphs of styled text runs.
+
+    Each block is a dict with a ``style`` (p, h1-h6, pre, blockquote, li
+    or tr), a list ``prefix`` for list items and ``runs`` of (text, bold,
+    italic, code) tuples. Paragraphs inside a blockquote take its style.
+    A table row is one block whose runs hold the cells separated by " | ",
+    with the runs of each cell also in ``cells`` and ``header`` set for a
+    row of <th> cells.
+    """
+
+    def __init__(self):
+        super().__init__()
+        self.blocks = []
+        self.block = None
+        self.bold = self.italic = self.code = self.pre = self.quote = 0
+        self.lists = []
+
+    def start(self, style, prefix=''):
+        if style == 'p' and self.quote:
+            style = 'blockquote'
+        self.block = {'style': style, 'prefix': prefix, 'runs': []}
+        if style == 'tr':
+            self.block.update(cells=[], header=False)
+        self.blocks.append(self.block)
+
+    def add(self, text):
+        if not text.strip() and (self.block is None or self.block['style'] == 'tr'):
+            # Whitespace between blocks, or between table cells
+            return
+        if self.block is None:
+            self.start('p')
+        run = (text, self.bold > 0, self.italic > 0, self.code > 0)
+        self.block['runs'].append(run)
+        if self.block['style'] == 'tr' and self.block['cells']:
+            self.block['cells'][-1].append(run)
+
+    def handle_starttag(self, tag, attrs):
+        if tag in ('ul', 'ol'):
+            self.lists.append([tag, 0])
+        elif tag == 'blockquote':
+            self.quote += 1
+            self.block = None
+        elif tag == 'li':
+            prefix = '• '
+            if self.lists and self.lists[-1][0] == 'ol':
+                self.lists[-1][1] += 1
+                prefix = f'{self.lists[-1][1]}. '
+            self.start('li', '    ' * max(len(self.lists) - 1, 0) + prefix)
+        elif tag in BLOCKS:
+            self.start(tag)
+            if tag == 'pre':
+                self.pre += 1
+        elif tag in ('strong', 'b'):
+            self.bold += 1
+        elif tag in ('em', 'i'):
+            self.italic += 1
+        elif tag == 'code':
+            self.code += 1
+        elif tag in ('td', 'th') and self.block is not None and self.block['style'] == 'tr':
+            if self.block['runs']:
+                self.block['runs'].append((' | ', False, False, False))
+            self.block['cells'].append([])
+            self.block['header'] = tag == 'th'
+        elif tag == 'br':
+            self.add('\n')
+        elif tag == 'img':
+            # Linked images are not fetched; keep their description
+            alt = dict(attrs).get('alt')
+            if alt:
+                self.add(f'[{alt}]')
+
+    def handle_endtag(self, tag):
+        if tag in ('ul', 'ol') and self.lists:
+            self.lists.pop()
+        elif tag == 'blockquote':
+            self.quote -= 1
+            self.block = None
+        elif tag in BLOCKS:
+            if tag == 'pre':
+                self.pre -= 1
+            self.block = None
+        elif tag in ('strong', 'b'):
+            self.bold -= 1
+        elif tag in ('em', 'i'):
+            self.italic -= 1
+        elif tag == 'code':
+            self.code -= 1
+
+    def handle_data(self, data):
+        if not self.pre:
+            data = re.sub(r'\s+', ' ', data)
+        self.add(data)
+
+
+def trim(runs):
+    """Drop the whitespace left at the edges of a block by collapsing."""
+    runs = [list(run) for run in runs]
+    if runs:
+        runs[0][0] = runs[0][0].lstrip()
+        runs[-1][0] = runs[-1][0].rstrip()
+    return [tuple(run) for run in runs if run[0]]
+
+
+def html_blocks(content_html):
+    parser = BlockParser()
+    parser.feed(content_html)
+    parser.close()
+    blocks = []
+    for block in parser.blocks:
+        if block['style'] != 'pre':
+            block['runs'] = trim(block['runs'])
+        if block['style'] == 'tr':
+            block['cells'] = [trim(cell) for cell in block['cells']]
+        if block['runs']:
+            blocks.append(block)
+    return blocks
+
+
+def print_html(document):
+    """A standalone HTML page for printing a post."""
+    images = ''.join(f'<p><img src="file://{html.escape(path)}" alt=""></p>' for path in document['images'])
+    return (f'<!DOCTYPE html><html><head><meta charset="utf-8"><title>{html.escape(document["title"])}</title>'
+            f'<style>{PRINT_CSS}</style></head><body>'
+            f'<h1 class="title">{html.escape(document["title"])}</h1>'
+            f'<p class="byline">{html.escape(document["byline"])}</p>'
+            f'{document["content_html"]}{images}</body></html>')
+
+
+def local_files_only(url):
+    """URL fetcher for WeasyPrint that refuses to fetch anything over the network."""
+    if not url.startswith('file://'):
+        raise ValueError(f"Not fetching {url} while rendering a document")
+    from weasyprint import default_url_fetcher
+    return default_url_fetcher(url)
+
+
+def render_pdf(document, path):
+    """Render with WeasyPrint, or ReportLab where WeasyPrint's libraries are missing."""
+    try:
+        from weasyprint import HTML
+    except (ImportError, OSError):
+        logging.warning("WeasyPrint is not available; rendering the PDF with ReportLab")
+        return render_pdf_reportlab(document, path)
+    HTML(string=print_html(document), url_fetcher=local_files_only).write_pdf(path)
+
+
+def reportlab_markup(runs):
+    parts = []
+    for text, bold, italic, code in runs:
+        text = html.escape(text, quote=False).replace('\n', '<br/>')
+        if code:
+            text = f'<font face="Courier">{text}</font>'
+        if italic:
+            text = f'<i>{text}</i>'
+        if bold:
+            text = f'<b>{text}</b>'
+        parts.append(text)
+    return ''.join(parts)
+
+
+def table_rows(blocks):
+    """Group consecutive table row blocks, yielding (block, rows or None)."""
+    rows = []
+    for block in blocks:
+        if block['style'] == 'tr':
+            rows.append(block)
+            continue
+        if rows:
+            yield None, rows
+            rows = []
+        yield block, None
+    if rows:
+        yield None, rows
+
+
+def render_pdf_reportlab(document, path):
+    from reportlab.lib import colors
+    from reportlab.lib.pagesizes import A4
+    from reportlab.lib.styles import getSampleStyleSheet
+    from reportlab.lib.units import cm
+    from reportlab.platypus import Image, Paragraph, Preformatted, SimpleDocTemplate, Table, TableStyle
+
+    styles = getSampleStyleSheet()
+    story = [Paragraph(html.escape(document['title']), styles['Title']),
+             Paragraph(f"<i>{html.escape(document['byline'])}</i>", styles['Normal'])]
+    for block, rows in table_rows(html_blocks(document['content_html'])):
+        if rows:
+            columns = max(len(row['cells']) for row in rows)
+            data = [[Paragraph(reportlab_markup(cell), styles['BodyText']) for cell in row['cells']]
+                    + [''] * (columns - len(row['cells'])) for row in rows]
+            table = Table(data, colWidths=[TEXT_WIDTH / columns] * columns, repeatRows=int(rows[0]['header']))
+            table.setStyle(TableStyle([('GRID', (0, 0), (-1, -1), 0.5, colors.grey),
+                                       ('VALIGN', (0, 0), (-1, -1), 'TOP')]))
+            story.append(table)
+            continue
+        style = block['style']
+        if style == 'pre':
+            story.append(Preformatted(''.join(run[0] for run in block['runs']), styles['Code']))
+        elif style in HEADINGS:
+            story.append(Paragraph(reportlab_markup(block['runs']), styles[f'Heading{style[1]}']))
+        else:
+            story.append(Paragraph(html.escape(block['prefix']) + reportlab_markup(block['runs']),
+                                   styles['Italic' if style == 'blockquote' else 'BodyText']))
+    for image_path in document['images']:
+        image = Image(image_path)
+        scale = min(1, TEXT_WIDTH / image.imageWidth)
+        image.drawWidth, image.drawHeight = image.imageWidth * scale, image.imageHeight * scale
+        story.append(image)
+
+    pdf = SimpleDocTemplate(path, pagesize=A4, leftMargin=2 * cm, rightMargin=2 * cm, topMargin=2 * cm,
+                            bottomMargin=2 * cm, title=document['title'], author=document['author'])
+    pdf.build(story)
+
+
+def add_runs(paragraph, runs, monospace=False, bold=False):
+    from docx.shared import Pt
+    for text, run_bold, italic, code in runs:
+        run = paragraph.add_run(text)
+        run.bold = bold or run_bold or None
+        run.italic = italic or None
+        if code or monospace:
+            run.font.name = 'Courier New'
+            run.font.size = Pt(9)
+
+
+def render_docx(document, path):
+    from docx import Document
+    from docx.shared import Inches
+
+    doc = Document()
+    doc.core_properties.title = document['title']
+    doc.core_properties.author = document['author']
+    doc.add_heading(document['title'], 0)
+    doc.add_paragraph().add_run(document['byline']).italic = True
+
+    for block, rows in table_rows(html_blocks(document['content_html'])):
+        if rows:
+            table = doc.add_table(rows=len(rows), cols=max(len(row['cells']) for row in rows))
+            table.style = 'Table Grid'
+            for row, table_row in zip(rows, table.rows):
+                for cell, runs in zip(table_row.cells, row['cells']):
+                    add_runs(cell.paragraphs[0], runs, bold=row['header'])
+            continue
+        style = block['style']
+        if style in HEADINGS:
+            paragraph = doc.add_heading(level=min(int(style[1]), 9))
+        elif style == 'blockquote':
+            paragraph = doc.add_paragraph(style='Quote')
+        else:
+            paragraph = doc.add_paragraph()
+        if block['prefix']:
+            paragraph.add_run(block['prefix'])
+        add_runs(paragraph, block['runs'], monospace=style == 'pre')
+    for image_path in document['images']:
+        picture = doc.add_picture(image_path)
+        if picture.width > Inches(6):
+            picture.height = int(picture.height * Inches(6) / picture.width)
+            picture.width = Inches(6)
+    doc.save(path)
+
+
+RENDERERS = {'pdf': render_pdf, 'docx': render_docx}
+
+
+class RenderFailed(RuntimeError):
+    """Raised when a post could not be rendered as a document."""
+
+
+def render(fmt, document, path):
+    """Render a document in a worker process, publishing it under path when complete."""
+    temporary = f'{path}.{os.getpid()}.tmp'
+    try:
+        RENDERERS[fmt](document, temporary)
+        os.replace(temporary, path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+    return path
+
+
+class PostDocuments:
+    """PDF and Word versions of posts, rendered in a process pool and cached on disk.
+
+    A rendered file is named after the post id and its updated_at, so each
+    version of a post is rendered once and an edit simply starts a new
+    file. The cache folder is kept under DOCUMENT_CACHE_BYTES by deleting
+    the least recently used files; a cache hit refreshes a file's mtime.
+    open() never waits for a render: it starts one and returns None, and
+    the client asks again. A failed render is not retried for
+    DOCUMENT_RETRY_SECONDS.
+    """
+
+    def __init__(self, app=None):
+        self.folder = None
+        self._pool = None
+        self._pending = {}
+        self._failed = {}
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('DOCUMENT_FOLDER', os.path.join(app.instance_path, 'documents'))
+        app.config.setdefault('DOCUMENT_CACHE_BYTES', 200 * 1024 * 1024)
+        app.config.setdefault('DOCUMENT_WORKERS', 2)
+        app.config.setdefault('DOCUMENT_RETRY_SECONDS', 60)
+
+        self.folder = app.config['DOCUMENT_FOLDER']
+        self.max_bytes = app.config['DOCUMENT_CACHE_BYTES']
+        self.workers = app.config['DOCUMENT_WORKERS']
+        self.retry_seconds = app.config['DOCUMENT_RETRY_SECONDS']
+        app.extensions['post_documents'] = self
+
+    @property
+    def pool(self):
+        # Created lazily so that each forked server worker gets its own pool
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def path(self, post_id, updated_at, fmt):
+        return os.path.join(self.folder, f'{post_id}-{updated_at:%Y%m%d%H%M%S%f}.{fmt}')
+
+    def open(self, post_id, updated_at, fmt, document):
+        """Open the rendered document, or start rendering it and return None.
+
+        ``document`` holds what the renderers need: title, author, byline,
+        content_html and the file paths of images to include. Raises
+        RenderFailed if this version of the post recently failed to render.
+        """
+        path = self.path(post_id, updated_at, fmt)
+        try:
+            file = open(path, 'rb')
+        except FileNotFoundError:
+            # Not rendered yet, or evicted since: render it again
+            pass
+        else:
+            # Through the descriptor, as eviction may unlink the file meanwhile
+            os.utime(file.fileno())
+            return file
+
+        pool = self.pool
+        submitted = False
+        with self._lock:
+            failed_at, error = self._failed.get(path, (None, None))
+            if failed_at is not None:
+                if time.monotonic() - failed_at < self.retry_seconds:
+                    raise RenderFailed(error)
+                del self._failed[path]
+            if path not in self._pending and not os.path.exists(path):
+                os.makedirs(self.folder, exist_ok=True)
+                future = self._pending[path] = pool.submit(render, fmt, document, path)
+                submitted = True
+        if submitted:
+            # Outside the lock: the callback takes it, and runs here if the render already finished
+            future.add_done_callback(lambda done: self.rendered(post_id, path, done))
+        return None
+
+    def rendered(self, post_id, path, future):
+        error = future.exception()
+        with self._lock:
+            self._pending.pop(path, None)
+            if error is not None:
+                self._failed[path] = (time.monotonic(), f'{type(error).__name__}: {error}')
+        if error is not None:
+            logging.error(f"Rendering {os.path.basename(path)} failed: {error}")
+            return
+        # Earlier versions of this post will not be asked for again
+        extension = os.path.splitext(path)[1]
+        for old in glob.glob(os.path.join(self.folder, f'{post_id}-*{extension}')):
+            if old != path:
+                self.remove(old)
+        self.evict()
+
+    def evict(self):
+        """Delete the least recently used files until the cache fits DOCUMENT_CACHE_BYTES."""
+        files = []
+        for entry in os.scandir(self.folder):
+            if entry.is_file() and not entry.name.endswith('.tmp'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.max_bytes:
+                break
+            self.remove(path)
+            total -= size
+
+    def remove(self, path):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
@@ -0,0 +1,158 @@
+import itertools
+import re
+import threading
+from collections import deque
+from pagination import InvalidCursor
+
+
+class LocalFeed:
+    """In-process event log per channel, with blocking reads.
+
+    Event ids are one counter shared by all channels. Each channel keeps its
+    last ``history`` events; a reader whose cursor is older than that, or
+    from before a restart, gets a single ``reset`` event instead.
+    """
+
+    def __init__(self, history=100):
+        self.history = history
+        self._channels = {}
+        self._evicted = {}
+        self._ids = itertools.count(1)
+        self._last = 0
+        self._changed = threading.Condition()
+
+    def publish(self, channel, event):
+        with self._changed:
+            self._last = next(self._ids)
+            events = self._channels.setdefault(channel, deque())
+            events.append((self._last, event))
+            if len(events) > self.history:
+                self._evicted[channel] = events.popleft()[0]
+            self._changed.notify_all()
+            return str(self._last)
+
+    def cursor(self, channel):
+        with self._changed:
+            events = self._channels.get(channel)
+            return str(events[-1][0] if events else self._last)
+
+    def parse(self, cursor):
+        if not cursor.isdigit():
+            raise InvalidCursor(cursor)
+        return int(cursor)
+
+    def read(self, channel, since, timeout):
+        since = self.parse(since)
+
+        def pending():
+            if since > self._last or since < self._evicted.get(channel, 0):
+                return [(str(self._last), {'type': 'reset'})]
+            return [(str(event_id), event) for event_id, event in self._channels.get(channel, ())
+                    if event_id > since]
+
+        with self._changed:
+            events = pending()
+            if not events and timeout:
+                self._changed.wait_for(pending, timeout)
+                events = pending()
+            return events
+
+
+class RedisFeed:
+    """Event log shared between workers, as one Redis stream per channel."""
+
+    CURSOR = re.compile(r'^\d+-\d+$')
+
+    def __init__(self, url, history=100, prefix='blog:feed:', ttl=86400):
+        try:
+            import redis
+        except ImportError as e:
+            raise RuntimeError("COMMENT_FEED_TYPE 'redis' requires the redis package") from e
+        self.client = redis.Redis.from_url(url, decode_responses=True)
+        self.history = history
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def publish(self, channel, event):
+        key = self.prefix + channel
+        event_id = self.client.xadd(key, {k: str(v) for k, v in event.items()},
+                                    maxlen=self.history, approximate=True)
+        self.client.expire(key, self.ttl)
+        return event_id
+
+    def cursor(self, channel):
+        latest = self.client.xrevrange(self.prefix + channel, count=1)
+        return latest[0][0] if latest else '0-0'
+
+    def parse(self, cursor):
+        if not self.CURSOR.match(cursor):
+            raise InvalidCursor(cursor)
+        return cursor
+
+    def read(self, channel, since, timeout):
+        since = self.parse(since)
+        block = int(timeout * 1000) if timeout else None
+        streams = self.client.xread({self.prefix + channel: since}, count=self.history, block=block)
+        events = []
+        for _, entries in streams or ():
+            for event_id, fields in entries:
+                event = dict(fields)
+                if 'comment_id' in event:
+                    event['comment_id'] = int(event['comment_id'])
+                events.append((event_id, event))
+        return events
+
+
+class CommentFeed:
+    """Publishes new and deleted comments per post for live readers.
+
+    Writers call comment_added/comment_deleted after committing; readers
+    long-poll or stream with read(). A cursor is an opaque string naming
+    the last event a reader has seen.
+    """
+
+    def __init__(self, app=None):
+        self.backend = LocalFeed()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('COMMENT_FEED_TYPE', 'local')
+        app.config.setdefault('COMMENT_FEED_REDIS_URL', app.config.get('CACHE_REDIS_URL'))
+        app.config.setdefault('COMMENT_FEED_HISTORY', 100)
+        app.config.setdefault('COMMENT_FEED_WAIT', 25)
+        app.config.setdefault('COMMENT_FEED_HEARTBEAT', 15)
+        app.config.setdefault('COMMENT_FEED_STREAM_SECONDS', 300)
+
+        feed_type = app.config['COMMENT_FEED_TYPE']
+        history = app.config['COMMENT_FEED_HISTORY']
+        if feed_type == 'local':
+            self.backend = LocalFeed(history)
+        elif feed_type == 'redis':
+            self.backend = RedisFeed(app.config['COMMENT_FEED_REDIS_URL'], history)
+        else:
+            raise ValueError(f"Unknown COMMENT_FEED_TYPE: {feed_type}")
+        app.extensions['comment_feed'] = self
+
+    def comment_added(self, post_id, comment_id):
+        return self.backend.publish(f'post:{post_id}', {'type': 'comment', 'comment_id': comment_id})
+
+    def comment_deleted(self, post_id, comment_id):
+        return self.backend.publish(f'post:{post_id}', {'type': 'delete', 'comment_id': comment_id})
+
+    def comments_changed(self, post_id):
+        """Tell readers to reload the post's comments, e.g. after a bulk import."""
+        return self.backend.publish(f'post:{post_id}', {'type': 'reset'})
+
+    def cursor(self, post_id):
+        """The cursor of the latest event on a post."""
+        return self.backend.cursor(f'post:{post_id}')
+
+    def check_cursor(self, cursor):
+        """Raise InvalidCursor unless the cursor is well-formed."""
+        self.backend.parse(cursor)
+        return cursor
+
+    def read(self, post_id, since, timeout=0):
+        """Return [(cursor, event)] after ``since``, waiting up to timeout seconds for one."""
+        return self.backend.read(f'post:{post_id}', since, timeout)
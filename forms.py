@@ -1,31 +1,46 @@
 from flask_wtf import FlaskForm
+from flask_wtf.file import MultipleFileField, FileAllowed
 from wtforms import StringField, PasswordField, TextAreaField, SubmitField
-from wtforms.validators import DataRequired, Email, Length, EqualTo, ValidationError
+from wtforms.validators import DataRequired, Email, Length, EqualTo
+from sqlalchemy import or_
 from models import User
 
+USERNAME_TAKEN = 'Username is already taken. Please choose a different one.'
+EMAIL_TAKEN = 'Email is already registered. Please use a different one.'
+
 class RegistrationForm(FlaskForm):
     """Form for user registration."""
     username = StringField('Username', validators=[DataRequired(), Length(min=3, max=64)])
-    email = StringField('Email', validators=[DataRequired(), Email()])
+    email = StringField('Email', validators=[DataRequired(), Email()], filters=[User.normalize_email])
     password = PasswordField('Password', validators=[DataRequired(), Length(min=6)])
     confirm_password = PasswordField('Confirm Password', validators=[DataRequired(), EqualTo('password')])
     submit = SubmitField('Sign Up')
     
-    def validate_username(self, username):
-        """Validate that username is unique."""
-        user = User.query.filter_by(username=username.data).first()
-        if user:
-            raise ValidationError('Username is already taken. Please choose a different one.')
+    def validate(self, extra_validators=None):
+        """Validate the fields, then check username and email uniqueness in one query."""
+        if not super().validate(extra_validators):
+            return False
+        return not self.check_conflicts()
     
-    def validate_email(self, email):
-        """Validate that email is unique."""
-        user = User.query.filter_by(email=email.data).first()
-        if user:
-            raise ValidationError('Email is already registered. Please use a different one.')
+    def check_conflicts(self):
+        """Add errors for a username or email that is already in use.
+        
+        Returns True if there was a conflict. The database's unique
+        constraints remain the final word; this only gives friendly errors.
+        """
+        taken = User.query.with_entities(User.username, User.email) \
+            .filter(or_(User.username == self.username.data, User.email == self.email.data)) \
+            .limit(2).all()
+        for username, email in taken:
+            if username == self.username.data and USERNAME_TAKEN not in self.username.errors:
+                self.username.errors.append(USERNAME_TAKEN)
+            if email == self.email.data and EMAIL_TAKEN not in self.email.errors:
+                self.email.errors.append(EMAIL_TAKEN)
+        return bool(taken)
 
 class LoginForm(FlaskForm):
     """Form for user login."""
-    email = StringField('Email', validators=[DataRequired(), Email()])
+    email = StringField('Email', validators=[DataRequired(), Email()], filters=[User.normalize_email])
     password = PasswordField('Password', validators=[DataRequired()])
     submit = SubmitField('Login')
 
@@ -33,6 +48,8 @@ class PostForm(FlaskForm):
     """Form for creating and editing posts."""
     title = StringField('Title', validators=[DataRequired(), Length(min=3, max=128)])
     content = TextAreaField('Content', validators=[DataRequired()])
+    images = MultipleFileField('Images', validators=[
+        FileAllowed(['jpg', 'jpeg', 'png', 'gif', 'webp'], 'Images must be JPEG, PNG, GIF or WebP')])
     submit = SubmitField('Submit')
 
 class CommentForm(FlaskForm):
@@ -1,300 +1,310 @@
 #!/usr/bin/env python3
 """
-CSU CCIS Blog Word Documentation Generator
-Creates an editable Word document with comprehensive project documentation
+CSU CCIS Blog Documentation Generator
+Builds the project documentation as Word and PDF files from the Markdown
+in docs/, with the database schema and route reference generated from
+models.py and routes.py.
+
+Each section is converted to HTML on its own and cached by the hash of
+its sources, so a run converts only the sections that changed, and the
+DOCX and PDF are rendered in parallel only when some section did. When
+nothing changed a run just reads and hashes the sources, without
+importing the app or the document libraries.
+
+Usage:
+  python generate_word_doc.py
+  python generate_word_doc.py --force --formats docx
 """
 
+import argparse
+import hashlib
+import inspect
+import json
 import os
+import re
+import sys
+from concurrent.futures import ProcessPoolExecutor
 from datetime import datetime
-from docx import Document
-from docx.shared import Inches, Pt
-from docx.enum.text import WD_ALIGN_PARAGRAPH
-from docx.oxml.ns import qn
-from docx.shared import RGBColor
-
-def create_word_documentation():
-    """Generate comprehensive Word documentation"""
-    
-    # Create output directory
-    os.makedirs('output', exist_ok=True)
-    
-    # Create new Word document
-    doc = Document()
-    
-    # Set document margins
-    sections = doc.sections
-    for section in sections:
-        section.top_margin = Inches(1)
-        section.bottom_margin = Inches(1)
-        section.left_margin = Inches(1)
-        section.right_margin = Inches(1)
-    
-    # Define CSU CCIS colors
-    csu_brown = RGBColor(139, 69, 19)  # Brown
-    csu_green = RGBColor(34, 139, 34)  # Forest Green
-    csu_gold = RGBColor(255, 215, 0)   # Gold
-    
-    # Title Page
-    title = doc.add_heading('CSU CCIS Blog Application', 0)
-    title.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    title_run = title.runs[0]
-    title_run.font.color.rgb = csu_brown
-    title_run.font.size = Pt(24)
-    
-    subtitle = doc.add_heading('Complete Project Documentation', level=2)
-    subtitle.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    subtitle_run = subtitle.runs[0]
-    subtitle_run.font.color.rgb = csu_green
-    
-    doc.add_paragraph()
-    
-    # Institution info
-    institution = doc.add_paragraph('Colorado State University', style='Normal')
-    institution.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    college = doc.add_paragraph('College of Computing and Information Sciences', style='Normal')
-    college.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    
-    doc.add_paragraph()
-    
-    # Date
-    date_para = doc.add_paragraph(f'Generated: {datetime.now().strftime("%B %d, %Y")}', style='Normal')
-    date_para.alignment = WD_ALIGN_PARAGRAPH.CENTER
-    
-    # Page break
-    doc.add_page_break()
-    
-    # Table of Contents
-    toc_heading = doc.add_heading('Table of Contents', level=1)
-    toc_heading.runs[0].font.color.rgb = csu_brown
-    
-    toc_items = [
-        "1. Project Overview",
-        "2. Entity-Relationship Diagram", 
-        "3. Database Schema",
-        "4. API Specification",
-        "5. Authentication Flow",
-        "6. Setup Guide",
-        "7. Usage Guide",
-        "8. Code Structure",
-        "9. Technologies Used"
-    ]
-    
-    for item in toc_items:
-        doc.add_paragraph(item, style='List Number')
-    
-    doc.add_page_break()
-    
-    # Add documentation sections
-    doc_sections = [
-        ("README.md", "Project Overview"),
-        ("docs/ERD.md", "Entity-Relationship Diagram"),
-        ("docs/DATABASE_SCHEMA.md", "Database Schema"),
-        ("docs/API_SPEC.md", "API Specification"),
-        ("docs/AUTHENTICATION_FLOW.md", "Authentication Flow"),
-        ("docs/SETUP_GUIDE.md", "Setup Guide"),
-        ("docs/USAGE_GUIDE.md", "Usage Guide")
-    ]
-    
-    for file_path, section_title in doc_sections:
-        # Section heading
-        heading = doc.add_heading(section_title, level=1)
-        heading.runs[0].font.color.rgb = csu_brown
-        
-        if os.path.exists(file_path):
-            # Read file content
-            with open(file_path, 'r', encoding='utf-8') as f:
-                content = f.read()
-            
-            # Process markdown content
-            lines = content.split('\n')
-            in_code_block = False
-            
-            for line in lines:
-                line = line.strip()
-                
-                if line.startswith('```'):
-                    in_code_block = not in_code_block
-                    continue
-                
-                if in_code_block:
-                    # Add code as monospace
-                    code_para = doc.add_paragraph(line)
-                    if code_para.runs:
-                        code_run = code_para.runs[0]
-                        code_run.font.name = 'Courier New'
-                        code_run.font.size = Pt(9)
-                    continue
-                
-                if line.startswith('# '):
-                    # Main heading
-                    h = doc.add_heading(line[2:], level=2)
-                    h.runs[0].font.color.rgb = csu_green
-                elif line.startswith('## '):
-                    # Sub heading
-                    h = doc.add_heading(line[3:], level=3)
-                    h.runs[0].font.color.rgb = csu_green
-                elif line.startswith('### '):
-                    # Sub-sub heading
-                    doc.add_heading(line[4:], level=4)
-                elif line.startswith('- ') or line.startswith('* '):
-                    # Bullet point
-                    doc.add_paragraph(line[2:], style='List Bullet')
-                elif line.startswith('1. ') or any(line.startswith(f'{i}. ') for i in range(1, 10)):
-                    # Numbered list
-                    doc.add_paragraph(line[3:], style='List Number')
-                elif line:
-                    # Regular paragraph
-                    doc.add_paragraph(line)
-                else:
-                    # Empty line - add space
-                    doc.add_paragraph()
-        
-        doc.add_page_break()
-    
-    # Code Structure Section
-    structure_heading = doc.add_heading('Code Structure', level=1)
-    structure_heading.runs[0].font.color.rgb = csu_brown
-    
-    doc.add_paragraph('File and Directory Organization:')
-    
-    # Create table for file structure
-    structure_table = doc.add_table(rows=1, cols=2)
-    structure_table.style = 'Table Grid'
-    
-    # Header row
-    header_cells = structure_table.rows[0].cells
-    header_cells[0].text = 'File/Directory'
-    header_cells[1].text = 'Purpose'
-    
-    # Make header bold
-    for cell in header_cells:
-        for paragraph in cell.paragraphs:
-            for run in paragraph.runs:
-                run.font.bold = True
-                run.font.color.rgb = csu_brown
-    
-    # File structure data
-    structure_data = [
-        ("app.py", "Flask application configuration and database setup"),
-        ("main.py", "Application entry point"),
-        ("models.py", "SQLAlchemy database models (User, Post, Comment)"),
-        ("routes.py", "URL routing and view functions"),
-        ("forms.py", "WTForms form definitions and validation"),
-        ("utils.py", "Utility functions and decorators"),
-        ("templates/", "Jinja2 HTML templates"),
-        ("static/css/", "Custom CSS styling with CSU CCIS theme"),
-        ("static/js/", "JavaScript for client-side functionality"),
-        ("static/images/", "CSU CCIS logo and other images"),
-        ("docs/", "Project documentation files")
-    ]
-    
-    # Add data rows
-    for file_name, purpose in structure_data:
-        row_cells = structure_table.add_row().cells
-        row_cells[0].text = file_name
-        row_cells[1].text = purpose
-    
-    doc.add_paragraph()
-    
-    # Technologies Used Section
-    tech_heading = doc.add_heading('Technologies Used', level=1)
-    tech_heading.runs[0].font.color.rgb = csu_brown
-    
-    # Create table for technologies
-    tech_table = doc.add_table(rows=1, cols=4)
-    tech_table.style = 'Table Grid'
-    
-    # Header row
-    tech_header_cells = tech_table.rows[0].cells
-    tech_header_cells[0].text = 'Category'
-    tech_header_cells[1].text = 'Technology'
-    tech_header_cells[2].text = 'Version'
-    tech_header_cells[3].text = 'Purpose'
-    
-    # Make header bold
-    for cell in tech_header_cells:
-        for paragraph in cell.paragraphs:
-            for run in paragraph.runs:
-                run.font.bold = True
-                run.font.color.rgb = csu_brown
-    
-    # Technology data
-    tech_data = [
-        ("Backend", "Flask", "Latest", "Web framework"),
-        ("Database", "PostgreSQL", "Latest", "Primary database"),
-        ("ORM", "SQLAlchemy", "Latest", "Database abstraction"),
-        ("Authentication", "Flask-Login", "Latest", "Session management"),
-        ("Forms", "Flask-WTF", "Latest", "Form handling and validation"),
-        ("Frontend", "Bootstrap 5", "5.3.0", "CSS framework"),
-        ("JavaScript", "Vanilla JS", "ES6+", "Client-side functionality"),
-        ("Server", "Gunicorn", "Latest", "WSGI HTTP server"),
-        ("Security", "Werkzeug", "Latest", "Password hashing")
-    ]
-    
-    # Add technology rows
-    for category, technology, version, purpose in tech_data:
-        tech_row_cells = tech_table.add_row().cells
-        tech_row_cells[0].text = category
-        tech_row_cells[1].text = technology
-        tech_row_cells[2].text = version
-        tech_row_cells[3].text = purpose
-    
-    # Add final sections
-    doc.add_paragraph()
-    
-    features_heading = doc.add_heading('Key Features Implemented', level=1)
-    features_heading.runs[0].font.color.rgb = csu_brown
-    
-    features = [
-        "User Registration and Authentication with secure password hashing",
-        "Blog Post Management (Create, Read, Update, Delete)",
-        "Comment System for user interaction",
-        "Responsive Design with CSU CCIS branding",
-        "User Dashboard for content management",
-        "Form Validation and Error Handling",
-        "Session Management and Security",
-        "Database Relationships and Data Integrity",
-        "RESTful API Endpoints",
-        "Mobile-Friendly Interface"
-    ]
-    
-    for feature in features:
-        doc.add_paragraph(feature, style='List Bullet')
-    
-    # Assignment requirements section
-    doc.add_page_break()
-    
-    requirements_heading = doc.add_heading('Assignment Requirements Met', level=1)
-    requirements_heading.runs[0].font.color.rgb = csu_brown
-    
-    doc.add_paragraph('This project fulfills all requirements for the 21-day course assignment:')
-    
-    requirements = [
-        "✓ Simple web application using Flask framework",
-        "✓ User authentication system (sign-up, sign-in, sign-out)",
-        "✓ Two CRUD features: Blog Posts and Comments",
-        "✓ Frontend-Backend-Database integration",
-        "✓ CSU CCIS branding and professional design",
-        "✓ Comprehensive documentation package",
-        "✓ Database design with proper relationships",
-        "✓ Security best practices implementation",
-        "✓ Responsive and accessible user interface",
-        "✓ Production-ready deployment configuration"
-    ]
-    
-    for req in requirements:
-        doc.add_paragraph(req, style='List Bullet')
-    
-    # Save document
+
+import documents
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+OUTPUT_DIR = 'output'
+OUTPUT_NAME = 'CSU_CCIS_Blog_Documentation'
+CACHE_FILE = '.doc-cache.json'
+# Not allowed in DOCX text (README.md ends with text saved as UTF-16)
+CONTROL_CHARACTERS = re.compile(r'[\x00-\x08\x0b\x0c\x0e-\x1f]')
+TITLE = 'CSU CCIS Blog Application'
+BYLINE = 'Complete Project Documentation · Colorado State University, College of Computing and Information Sciences'
+
+CODE_STRUCTURE = """
+| File/Directory | Purpose |
+|---|---|
+| app.py | Extensions, settings from the environment and the create_app factory |
+| main.py | Application entry point |
+| models.py | SQLAlchemy database models (User, Post, Comment, PostImage) |
+| migrations.py | Schema versions, applied by flask upgrade-db |
+| routes.py | URL routing and view functions |
+| forms.py | WTForms form definitions and validation |
+| utils.py | Utility functions and decorators |
+| rendering.py | Safe Markdown rendering of posts |
+| search.py | Full-text search of posts and comments |
+| pagination.py | Keyset pagination cursors |
+| http_cache.py, cache.py | Conditional requests and the response cache |
+| security.py | Password hashing pool and login throttling |
+| database.py, replicas.py | Engine settings and read replica routing |
+| jobs.py, tasks.py | Background job queue and its jobs |
+| feed.py | Live comment feed |
+| metrics.py | Request metrics served on /metrics |
+| bulk.py, export.py | Bulk import and blog export |
+| assets.py | Static asset build and serving |
+| images.py | Post image storage and resizing |
+| documents.py | PDF and Word rendering of posts and of this documentation |
+| async_api.py | Optional async JSON API |
+| templates/ | Jinja2 HTML templates |
+| static/ | CSS, JavaScript and images with the CSU CCIS theme |
+| benchmarks/ | Load, startup and dataset scripts |
+| docs/ | Project documentation sources |
+"""
+
+TECHNOLOGIES = """
+| Category | Technology | Purpose |
+|---|---|---|
+| Backend | Flask | Web framework |
+| Database | PostgreSQL, SQLite | Primary and development databases |
+| ORM | SQLAlchemy | Database abstraction |
+| Authentication | Flask-Login | Session management |
+| Forms | Flask-WTF | Form handling and validation |
+| Frontend | Bootstrap 5 | CSS framework |
+| JavaScript | Vanilla JS | Client-side functionality |
+| Server | Gunicorn | WSGI HTTP server |
+| Security | Werkzeug | Password hashing |
+| Documents | python-docx, WeasyPrint, ReportLab | Word and PDF output |
+"""
+
+FEATURES = """
+- User Registration and Authentication with secure password hashing
+- Blog Post Management (Create, Read, Update, Delete)
+- Comment System for user interaction
+- Responsive Design with CSU CCIS branding
+- User Dashboard for content management
+- Form Validation and Error Handling
+- Session Management and Security
+- Database Relationships and Data Integrity
+- RESTful API Endpoints
+- Mobile-Friendly Interface
+"""
+
+REQUIREMENTS = """
+This project fulfills all requirements for the 21-day course assignment:
+
+- ✓ Simple web application using Flask framework
+- ✓ User authentication system (sign-up, sign-in, sign-out)
+- ✓ Two CRUD features: Blog Posts and Comments
+- ✓ Frontend-Backend-Database integration
+- ✓ CSU CCIS branding and professional design
+- ✓ Comprehensive documentation package
+- ✓ Database design with proper relationships
+- ✓ Security best practices implementation
+- ✓ Responsive and accessible user interface
+- ✓ Production-ready deployment configuration
+"""
+
+# (title, Markdown files, text, generator); a generator builds Markdown
+# from the app and the files it introspects are among the sources
+SECTIONS = [
+    ('Project Overview', ['README.md'], '', None),
+    ('Entity-Relationship Diagram', ['docs/ERD.md'], '', None),
+    ('Database Schema', ['docs/DATABASE_SCHEMA.md', 'models.py'], '', 'schema'),
+    ('API Specification', ['docs/API_SPEC.md', 'routes.py', 'app.py'], '', 'routes'),
+    ('Authentication Flow', ['docs/AUTHENTICATION_FLOW.md'], '', None),
+    ('Setup Guide', ['docs/SETUP_GUIDE.md'], '', None),
+    ('Usage Guide', ['docs/USAGE_GUIDE.md'], '', None),
+    ('Code Structure', [], CODE_STRUCTURE, None),
+    ('Technologies Used', [], TECHNOLOGIES, None),
+    ('Key Features Implemented', [], FEATURES, None),
+    ('Assignment Requirements Met', [], REQUIREMENTS, None),
+]
+
+
+def file_digest(paths):
+    digest = hashlib.sha256()
+    for path in paths:
+        digest.update(path.encode())
+        with open(os.path.join(ROOT, path), 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()
+
+
+def section_key(version, title, sources, text):
+    """Hash of everything a section is converted from."""
+    present = [path for path in sources if os.path.exists(os.path.join(ROOT, path))]
+    return hashlib.sha256('\0'.join([version, title, text, file_digest(present)]).encode()).hexdigest()
+
+
+def table_cell(value):
+    return str(value).replace('|', '\\|').replace('\n', ' ')
+
+
+def schema_markdown(app):
+    """Tables, columns and indexes as declared in models.py."""
+    from app import db
+    import models  # noqa: F401 (registers the tables)
+    lines = ['## Tables (generated from models.py)']
+    for table in db.metadata.sorted_tables:
+        lines += ['', f'### {table.name}', '', '| Column | Type | Nullable | Notes |', '|---|---|---|---|']
+        for column in table.columns:
+            notes = []
+            if column.primary_key:
+                notes.append('primary key')
+            notes += [f'references {key.target_fullname}' for key in column.foreign_keys]
+            if column.unique:
+                notes.append('unique')
+            if column.default is not None and column.default.is_scalar:
+                notes.append(f'default {column.default.arg!r}')
+            lines.append(f'| {column.name} | {table_cell(column.type)} | '
+                         f'{"yes" if column.nullable else "no"} | {table_cell(", ".join(notes))} |')
+        if table.indexes:
+            lines += ['', 'Indexes:', '']
+            for index in sorted(table.indexes, key=lambda index: index.name or ''):
+                unique = 'unique ' if index.unique else ''
+                lines.append(f'- `{index.name}`: {unique}({", ".join(column.name for column in index.columns)})')
+    return '\n'.join(lines)
+
+
+def routes_markdown(app):
+    """Every URL rule with its methods and the first line of its view's docstring."""
+    lines = ['## Route Reference (generated from routes.py)', '',
+             '| Methods | URL | Endpoint | Description |', '|---|---|---|---|']
+    for rule in sorted(app.url_map.iter_rules(), key=lambda rule: (rule.rule, rule.endpoint)):
+        if rule.endpoint == 'static':
+            continue
+        methods = ', '.join(sorted(rule.methods - {'HEAD', 'OPTIONS'}))
+        summary = (inspect.getdoc(app.view_functions[rule.endpoint]) or '').split('\n')[0]
+        lines.append(f'| {methods} | `{rule.rule}` | {rule.endpoint} | {table_cell(summary)} |')
+    return '\n'.join(lines)
+
+
+GENERATORS = {'schema': schema_markdown, 'routes': routes_markdown}
+
+
+def convert(title, sources, text, generated):
+    """Markdown of one section to HTML, under a level-1 heading with its title."""
+    import markdown
+    parts = []
+    for path in sources:
+        if path.endswith('.md'):
+            full_path = os.path.join(ROOT, path)
+            if os.path.exists(full_path):
+                with open(full_path, encoding='utf-8') as f:
+                    parts.append(CONTROL_CHARACTERS.sub('', f.read()))
+            else:
+                parts.append(f'*{path} is missing.*')
+    parts += [text, generated]
+    # The files' own headings start at level 2, below the section title
+    body = markdown.markdown('\n\n'.join(part for part in parts if part),
+                             extensions=['fenced_code', 'tables', 'sane_lists', 'toc'],
+                             extension_configs={'toc': {'baselevel': 2}})
+    return f'<h1>{title}</h1>\n{body}'
+
+
+def load_cache(path):
     try:
-        doc.save('output/CSU_CCIS_Blog_Documentation.docx')
-        print("✅ Word documentation generated successfully!")
-        print("📝 File saved as: output/CSU_CCIS_Blog_Documentation.docx")
-        return True
+        with open(path, encoding='utf-8') as f:
+            return json.load(f)
+    except (FileNotFoundError, ValueError):
+        return {'sections': {}, 'outputs': {}}
+
+
+def save_cache(path, cache):
+    # Replace the cache in one step so an interrupted run leaves the old one
+    temporary = path + '.tmp'
+    with open(temporary, 'w', encoding='utf-8') as f:
+        json.dump(cache, f)
+    os.replace(temporary, path)
+
+
+def build_documentation(output_dir=OUTPUT_DIR, formats=('docx', 'pdf'), force=False):
+    """Convert the changed sections and render the outdated outputs.
+
+    Returns the paths that were written; an empty list means everything
+    was already up to date.
+    """
+    output_dir = os.path.join(ROOT, output_dir)
+    os.makedirs(output_dir, exist_ok=True)
+    cache_path = os.path.join(output_dir, CACHE_FILE)
+    cache = {'sections': {}, 'outputs': {}} if force else load_cache(cache_path)
+    # Changing the converter or the renderers invalidates everything
+    version = file_digest([os.path.basename(__file__), 'documents.py'])
+
+    sections = []
+    app = None
+    for title, sources, text, generator in SECTIONS:
+        key = section_key(version, title, sources, text)
+        cached = cache['sections'].get(title)
+        if cached is None or cached['key'] != key:
+            generated = ''
+            if generator:
+                if app is None:
+                    # Imported only when a generated section is out of date
+                    from app import create_app
+                    app = create_app()
+                with app.app_context():
+                    generated = GENERATORS[generator](app)
+            cached = {'key': key, 'html': convert(title, sources, text, generated)}
+            print(f"  converted {title}")
+        sections.append((title, cached))
+    cache['sections'] = dict(sections)
+
+    build_key = hashlib.sha256(''.join(cached['key'] for _, cached in sections).encode()).hexdigest()
+    outdated = [fmt for fmt in formats
+                if cache['outputs'].get(fmt) != build_key
+                or not os.path.exists(os.path.join(output_dir, f'{OUTPUT_NAME}.{fmt}'))]
+    written = []
+    if outdated:
+        contents = ''.join(f'<li>{title}</li>' for title, _ in sections)
+        document = {
+            'title': TITLE,
+            'author': 'CSU CCIS',
+            'byline': f'{BYLINE} · Generated {datetime.now().strftime("%B %d, %Y")}',
+            'content_html': f'<h1>Table of Contents</h1><ol>{contents}</ol>'
+                            + ''.join(cached['html'] for _, cached in sections),
+            'images': [],
+        }
+        with ProcessPoolExecutor(max_workers=len(outdated)) as pool:
+            futures = {fmt: pool.submit(documents.render, fmt, document,
+                                        os.path.join(output_dir, f'{OUTPUT_NAME}.{fmt}'))
+                       for fmt in outdated}
+            for fmt, future in futures.items():
+                written.append(future.result())
+                cache['outputs'][fmt] = build_key
+    save_cache(cache_path, cache)
+    return written
+
+
+def create_word_documentation(force=False, formats=('docx', 'pdf')):
+    """Generate the Word and PDF documentation, skipping what is up to date."""
+    try:
+        written = build_documentation(formats=formats, force=force)
     except Exception as e:
-        print(f"❌ Error generating Word document: {e}")
+        print(f"❌ Error generating documentation: {e}")
         return False
+    if not written:
+        print("✅ Documentation is up to date")
+    for path in written:
+        print(f"📝 File saved as: {os.path.relpath(path, ROOT)}")
+    return True
+
 
 if __name__ == "__main__":
-    print("🔄 Generating CSU CCIS Blog Word Documentation...")
-    create_word_documentation()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--force', action='store_true', help='ignore the cache and rebuild everything')
+    parser.add_argument('--formats', default='docx,pdf', help='comma-separated output formats (docx, pdf)')
+    args = parser.parse_args()
+    formats = [fmt.strip() for fmt in args.formats.split(',') if fmt.strip()]
+    unknown = set(formats) - set(documents.RENDERERS)
+    if unknown:
+        parser.error(f"unknown format(s): {', '.join(sorted(unknown))}")
+
+    print("🔄 Generating CSU CCIS Blog Documentation...")
+    sys.exit(0 if create_word_documentation(args.force, formats) else 1)
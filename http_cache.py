@@ -0,0 +1,67 @@
+import hashlib
+import time
+from functools import wraps
+from flask import current_app, request, session, make_response
+from werkzeug.http import is_resource_modified
+
+
+def make_etag(*parts):
+    """Build an ETag value from the parts that determine a response."""
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def csrf_window():
+    """Return the CSRF token generation a page rendered now belongs to.
+
+    Pages for logged-in users embed CSRF tokens that expire after
+    WTF_CSRF_TIME_LIMIT. Windows are half that long, so a page revalidated
+    within the window it was rendered in still has a token that is valid
+    for at least half the limit.
+    """
+    config = current_app.config
+    limit = config.get('WTF_CSRF_TIME_LIMIT', 3600)
+    if not config.get('WTF_CSRF_ENABLED', True) or not limit:
+        return None
+    return session.get('csrf_token'), int(time.time() // max(limit // 2, 1))
+
+
+def conditional(validator, per_user=False):
+    """Decorator answering conditional GETs with 304 Not Modified.
+
+    ``validator`` is called with the view arguments and returns an
+    ``(etag, last_modified)`` pair computed without rendering the view,
+    or None to skip validation. With ``per_user`` the ETag also varies on
+    the logged-in user, for pages whose markup depends on who is viewing,
+    and on the CSRF window, so a 304 never keeps an expired token alive.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return f(*args, **kwargs)
+            if per_user and '_flashes' in session:
+                return f(*args, **kwargs)
+
+            validators = validator(**kwargs)
+            if validators is None:
+                return f(*args, **kwargs)
+            etag, last_modified = validators
+            if per_user:
+                user_id = session.get('_user_id')
+                etag = make_etag(etag, user_id, user_id and csrf_window())
+
+            if not is_resource_modified(request.environ, etag=etag, last_modified=last_modified):
+                response = make_response('', 304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            response.last_modified = last_modified
+            response.cache_control.no_cache = True
+            if per_user:
+                response.vary.add('Cookie')
+            return response
+        return decorated
+    return decorator
@@ -0,0 +1,182 @@
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Formats accepted for upload, with their content types
+UPLOAD_FORMATS = {'JPEG': 'image/jpeg', 'PNG': 'image/png', 'GIF': 'image/gif', 'WEBP': 'image/webp'}
+# Formats of the resized variants, by file extension
+VARIANT_FORMATS = {'webp': ('WEBP', 'image/webp'), 'jpg': ('JPEG', 'image/jpeg')}
+HASH_PATTERN = re.compile(r'^[0-9a-f]{64}$')
+CHUNK_SIZE = 64 * 1024
+# EXIF orientations that turn the image by 90 degrees
+ROTATED = {5, 6, 7, 8}
+
+
+class InvalidImage(ValueError):
+    """Raised for an upload that is not an acceptable image."""
+
+
+def variant_widths(width, widths):
+    """The widths an image of the given width is resized to, never enlarging it."""
+    return sorted({min(target, width) for target in widths})
+
+
+def inspect(path, max_pixels):
+    """Return (width, height, content type) of an image file, as displayed."""
+    from PIL import Image, UnidentifiedImageError
+    try:
+        with Image.open(path) as image:
+            if image.format not in UPLOAD_FORMATS:
+                raise InvalidImage("Images must be JPEG, PNG, GIF or WebP")
+            width, height = image.size
+            if image.getexif().get(0x0112) in ROTATED:
+                width, height = height, width
+            content_type = UPLOAD_FORMATS[image.format]
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError) as e:
+        raise InvalidImage("The file is not a readable image") from e
+    if width * height > max_pixels:
+        raise InvalidImage(f"Images can have at most {max_pixels // 1_000_000} megapixels")
+    return width, height, content_type
+
+
+def render_variants(original, directory, widths, quality):
+    """Write the resized WebP and JPEG variants of an image.
+
+    Runs in a worker process. Existing variants are left alone, and each
+    file appears under its final name only once it is complete.
+    """
+    from PIL import Image, ImageOps
+    with Image.open(original) as source:
+        image = ImageOps.exif_transpose(source)
+        image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+        for width in widths:
+            height = max(1, round(image.height * width / image.width))
+            resized = image if width == image.width else image.resize((width, height), Image.LANCZOS)
+            for ext, (image_format, _) in VARIANT_FORMATS.items():
+                path = os.path.join(directory, f'{width}.{ext}')
+                if os.path.exists(path):
+                    continue
+                output = resized
+                if image_format == 'JPEG' and resized.mode == 'RGBA':
+                    # JPEG has no transparency: flatten onto white
+                    output = Image.new('RGB', resized.size, 'white')
+                    output.paste(resized, mask=resized.getchannel('A'))
+                temporary = f'{path}.{os.getpid()}.tmp'
+                output.save(temporary, image_format, quality=quality, optimize=True)
+                os.replace(temporary, path)
+    return widths
+
+
+class ImageStore:
+    """Content-addressed storage for post images and their resized variants.
+
+    An upload is stored under the SHA-256 of its bytes, so the same file
+    uploaded twice is kept once, and a URL naming that hash never needs to
+    change. Resized WebP and JPEG copies are written next to the original
+    as <width>.webp and <width>.jpg by make_variants(), which runs Pillow
+    in a process pool and is called from a background job rather than the
+    upload request.
+    """
+
+    def __init__(self, app=None):
+        self.folder = None
+        self._pool = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('IMAGE_FOLDER', os.path.join(app.instance_path, 'images'))
+        app.config.setdefault('IMAGE_MAX_BYTES', 10 * 1024 * 1024)
+        app.config.setdefault('IMAGE_MAX_PIXELS', 40_000_000)
+        app.config.setdefault('IMAGE_WIDTHS', (320, 640, 1280))
+        app.config.setdefault('IMAGE_QUALITY', 80)
+        app.config.setdefault('IMAGE_WORKERS', 2)
+        app.config.setdefault('IMAGE_TIMEOUT', 120)
+        app.config.setdefault('IMAGE_MAX_AGE', 31536000)
+        app.config.setdefault('IMAGE_REMOVE_GRACE', 3600)
+
+        self.folder = app.config['IMAGE_FOLDER']
+        self.max_bytes = app.config['IMAGE_MAX_BYTES']
+        self.max_pixels = app.config['IMAGE_MAX_PIXELS']
+        self.target_widths = tuple(app.config['IMAGE_WIDTHS'])
+        self.quality = app.config['IMAGE_QUALITY']
+        self.workers = app.config['IMAGE_WORKERS']
+        self.timeout = app.config['IMAGE_TIMEOUT']
+        app.extensions['image_store'] = self
+
+    @property
+    def pool(self):
+        # Created lazily so that each forked server worker gets its own pool
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    self._pool = ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    def directory(self, sha256):
+        if not HASH_PATTERN.match(sha256):
+            raise ValueError(f"Not an image hash: {sha256}")
+        return os.path.join(self.folder, sha256[:2], sha256)
+
+    def original_path(self, sha256):
+        return os.path.join(self.directory(sha256), 'original')
+
+    def variant_path(self, sha256, width, ext):
+        return os.path.join(self.directory(sha256), f'{width}.{ext}')
+
+    def widths(self, width):
+        """The variant widths for an image of the given width."""
+        return variant_widths(width, self.target_widths)
+
+    def save(self, file):
+        """Store an uploaded file; return (sha256, width, height, content type).
+
+        Raises InvalidImage if the file is too large, not an image, or has
+        too many pixels. Only the image header is decoded here.
+        """
+        os.makedirs(self.folder, exist_ok=True)
+        digest = hashlib.sha256()
+        size = 0
+        with tempfile.NamedTemporaryFile(dir=self.folder, suffix='.upload', delete=False) as temporary:
+            try:
+                for chunk in iter(lambda: file.stream.read(CHUNK_SIZE), b''):
+                    size += len(chunk)
+                    if size > self.max_bytes:
+                        raise InvalidImage(f"Images must be smaller than {self.max_bytes // (1024 * 1024)} MB")
+                    digest.update(chunk)
+                    temporary.write(chunk)
+            except BaseException:
+                os.remove(temporary.name)
+                raise
+        try:
+            width, height, content_type = inspect(temporary.name, self.max_pixels)
+            sha256 = digest.hexdigest()
+            os.makedirs(self.directory(sha256), exist_ok=True)
+            os.replace(temporary.name, self.original_path(sha256))
+        finally:
+            if os.path.exists(temporary.name):
+                os.remove(temporary.name)
+        return sha256, width, height, content_type
+
+    def make_variants(self, sha256, width):
+        """Render the missing variants of a stored image in the process pool."""
+        future = self.pool.submit(render_variants, self.original_path(sha256), self.directory(sha256),
+                                  self.widths(width), self.quality)
+        return future.result(timeout=self.timeout)
+
+    def age(self, sha256):
+        """Seconds since a stored image was last saved, or None if it is not stored."""
+        try:
+            return time.time() - os.path.getmtime(self.directory(sha256))
+        except FileNotFoundError:
+            return None
+
+    def remove(self, sha256):
+        """Delete a stored image and all of its variants."""
+        shutil.rmtree(self.directory(sha256), ignore_errors=True)
@@ -0,0 +1,189 @@
+import json
+import logging
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app, g, has_request_context
+
+
+class JobWorkers:
+    """The worker threads of one app and when it last requeued stale jobs."""
+
+    def __init__(self, app, db):
+        self.app = app
+        self.db = db
+        self.threads = []
+        self.next_stale_check = 0
+        self.lock = threading.Lock()
+        self.wakeup = threading.Event()
+
+
+class JobQueue:
+    """Durable background jobs, stored in the job table.
+
+    enqueue() adds a job to the current database session, so it is
+    committed (or rolled back) together with the write that caused it.
+    Jobs are run by ``flask run-jobs`` (JOBS_MODE 'external', the default,
+    which keeps them off the web workers' CPU) or by worker threads in each
+    app process (JOBS_MODE 'thread', for development). A job
+    that raises is retried with exponential backoff up to
+    JOBS_MAX_ATTEMPTS times and then kept as 'failed'. Jobs should look up
+    current state by id rather than carry it, so that running one late,
+    twice or out of order is harmless. Tasks are shared by every app; the
+    workers of each app are kept in its ``extensions``.
+    """
+
+    def __init__(self, app=None, db=None):
+        self.tasks = {}
+        if app is not None:
+            self.init_app(app, db)
+
+    def init_app(self, app, db):
+        app.config.setdefault('JOBS_MODE', 'external')
+        app.config.setdefault('JOBS_WORKERS', 2)
+        app.config.setdefault('JOBS_POLL_INTERVAL', 5)
+        app.config.setdefault('JOBS_MAX_ATTEMPTS', 5)
+        app.config.setdefault('JOBS_RETRY_DELAY', 10)
+        app.config.setdefault('JOBS_LOCK_TIMEOUT', 300)
+        app.config.setdefault('JOBS_STALE_CHECK_INTERVAL', 60)
+
+        if app.config['JOBS_MODE'] not in ('thread', 'external'):
+            raise ValueError(f"Unknown JOBS_MODE: {app.config['JOBS_MODE']}")
+        app.extensions['job_queue'] = JobWorkers(app, db)
+        app.before_request(self.start_workers)
+        app.after_request(self.wake_after_request)
+
+    @property
+    def workers(self):
+        """The JobWorkers of the current app."""
+        return current_app.extensions['job_queue']
+
+    def task(self, name):
+        """Decorator registering a function as the job called ``name``."""
+        def decorator(f):
+            self.tasks[name] = f
+            return f
+        return decorator
+
+    def enqueue(self, name, delay=0, **kwargs):
+        """Add a job to the current transaction; it runs once that commits, or delay seconds later."""
+        from models import Job
+        if name not in self.tasks:
+            raise LookupError(f"Unknown job: {name}")
+        job = Job(name=name, payload=json.dumps(kwargs))
+        if delay:
+            job.run_at = datetime.utcnow() + timedelta(seconds=delay)
+        self.workers.db.session.add(job)
+        if has_request_context():
+            g.jobs_enqueued = True
+        return job
+
+    def wake_after_request(self, response):
+        if g.get('jobs_enqueued'):
+            self.workers.wakeup.set()
+        return response
+
+    def start_workers(self):
+        # Started from the first request rather than at import, so that
+        # each forked server process gets its own threads
+        workers = self.workers
+        if current_app.config['JOBS_MODE'] != 'thread' or workers.threads:
+            return
+        with workers.lock:
+            if workers.threads:
+                return
+            for number in range(workers.app.config['JOBS_WORKERS']):
+                thread = threading.Thread(target=self.work, args=(workers.app,),
+                                          name=f'job-worker-{number}', daemon=True)
+                thread.start()
+                workers.threads.append(thread)
+
+    def work(self, app, stop=None):
+        """Run the app's jobs until ``stop`` is set, sleeping while the queue is empty."""
+        poll_interval = app.config['JOBS_POLL_INTERVAL']
+        wakeup = app.extensions['job_queue'].wakeup
+        while stop is None or not stop.is_set():
+            try:
+                ran = self.run_next(app)
+            except Exception:
+                logging.exception("Job worker error")
+                ran = False
+            if not ran:
+                wakeup.wait(poll_interval)
+                wakeup.clear()
+
+    def run_pending(self, limit=None):
+        """Run the current app's due jobs in this thread until none are left; return how many ran."""
+        app = current_app._get_current_object()
+        count = 0
+        while (limit is None or count < limit) and self.run_next(app):
+            count += 1
+        return count
+
+    def claim(self):
+        """Mark the next due job as running and return it, or None."""
+        from models import Job
+        workers = self.workers
+        session = workers.db.session
+        now = datetime.utcnow()
+
+        if time.monotonic() >= workers.next_stale_check:
+            workers.next_stale_check = time.monotonic() + current_app.config['JOBS_STALE_CHECK_INTERVAL']
+            self.requeue_stale(now)
+
+        candidates = session.query(Job.id).filter(Job.status == 'queued', Job.run_at <= now) \
+            .order_by(Job.run_at, Job.id).limit(10).all()
+        for (job_id,) in candidates:
+            # Only one worker can move a given job out of 'queued'
+            claimed = session.query(Job).filter(Job.id == job_id, Job.status == 'queued') \
+                .update({'status': 'running', 'locked_at': now, 'attempts': Job.attempts + 1},
+                        synchronize_session=False)
+            session.commit()
+            if claimed:
+                return session.get(Job, job_id)
+        return None
+
+    def requeue_stale(self, now):
+        """Make jobs whose worker died while running them due again."""
+        from models import Job
+        session = self.workers.db.session
+        stale = now - timedelta(seconds=current_app.config['JOBS_LOCK_TIMEOUT'])
+        session.query(Job).filter(Job.status == 'running', Job.locked_at < stale) \
+            .update({'status': 'queued', 'locked_at': None}, synchronize_session=False)
+        session.commit()
+
+    def run_next(self, app):
+        """Claim and run one of the app's jobs; return whether there was one."""
+        with app.app_context():
+            job = self.claim()
+            if job is None:
+                return False
+            self.run(job)
+            return True
+
+    def run(self, job):
+        from models import Job
+        session = self.workers.db.session
+        job_id, name, attempts = job.id, job.name, job.attempts
+        try:
+            task = self.tasks.get(name)
+            if task is None:
+                raise LookupError(f"Unknown job: {name}")
+            task(**json.loads(job.payload))
+            # The job's own writes and its removal from the queue commit together
+            session.delete(job)
+            session.commit()
+        except Exception as e:
+            session.rollback()
+            job = session.get(Job, job_id)
+            job.last_error = f'{type(e).__name__}: {e}'
+            job.locked_at = None
+            if attempts >= current_app.config['JOBS_MAX_ATTEMPTS']:
+                job.status = 'failed'
+                logging.error(f"Job {job_id} ({name}) failed after {attempts} attempts: {e}")
+            else:
+                delay = current_app.config['JOBS_RETRY_DELAY'] * 2 ** (attempts - 1)
+                job.status = 'queued'
+                job.run_at = datetime.utcnow() + timedelta(seconds=delay)
+                logging.warning(f"Job {job_id} ({name}) failed, retrying in {delay}s: {e}")
+            session.commit()
@@ -0,0 +1,189 @@
+import logging
+import threading
+import time
+from collections import Counter
+from flask import current_app, g, has_request_context, request, before_render_template, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_COUNT_BUCKETS = (1, 2, 5, 10, 20, 50, 100, 200)
+SLOW_LOG_QUERIES = 5
+
+slow_log = logging.getLogger('slow_requests')
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values):
+    if not names:
+        return ''
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in zip(names, values)) + '}'
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by a tuple of label values."""
+
+    def __init__(self, name, help, labels, buckets):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        self.series = {}
+
+    def observe(self, labels, value):
+        counts, total, observed = self.series.get(labels, ([0] * len(self.buckets), 0.0, 0))
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                counts[i] += 1
+        self.series[labels] = (counts, total + value, observed + 1)
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.help}', f'# TYPE {self.name} histogram']
+        bucket_labels = self.labels + ('le',)
+        for labels, (counts, total, observed) in sorted(self.series.items()):
+            for bound, count in zip(self.buckets, counts):
+                lines.append(f'{self.name}_bucket{format_labels(bucket_labels, labels + (bound,))} {count}')
+            lines.append(f'{self.name}_bucket{format_labels(bucket_labels, labels + ("+Inf",))} {observed}')
+            lines.append(f'{self.name}_sum{format_labels(self.labels, labels)} {total}')
+            lines.append(f'{self.name}_count{format_labels(self.labels, labels)} {observed}')
+        return lines
+
+
+class MetricSet:
+    """The request counts and histograms of one app."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = Counter()
+        self.latency = Histogram('http_request_duration_seconds', 'Time spent handling requests.',
+                                 ('endpoint',), LATENCY_BUCKETS)
+        self.sql_count = Histogram('db_queries_per_request', 'SQL statements executed per request.',
+                                   ('endpoint',), QUERY_COUNT_BUCKETS)
+        self.sql_time = Histogram('db_query_duration_seconds', 'Time spent in SQL per request.',
+                                  ('endpoint',), LATENCY_BUCKETS)
+        self.render_time = Histogram('template_render_duration_seconds', 'Time spent rendering templates.',
+                                     ('template',), LATENCY_BUCKETS)
+
+    def count(self, labels):
+        with self._lock:
+            self.requests[labels] += 1
+
+    def observe(self, histogram, labels, value):
+        with self._lock:
+            histogram.observe(labels, value)
+
+    def render(self):
+        with self._lock:
+            lines = ['# HELP http_requests_total Requests handled, by endpoint, method and status.',
+                     '# TYPE http_requests_total counter']
+            for labels, count in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{format_labels(("endpoint", "method", "status"), labels)} {count}')
+            for histogram in (self.latency, self.sql_count, self.sql_time, self.render_time):
+                lines.extend(histogram.render())
+        return '\n'.join(lines) + '\n'
+
+
+class RequestMetrics:
+    """Per-endpoint latency, SQL and template render metrics.
+
+    Every SQL statement run during a request is timed through engine
+    events, and template rendering through Flask's template signals. The
+    totals are kept in this process and rendered in the Prometheus text
+    format; requests slower than SLOW_REQUEST_MS, or running more than
+    SLOW_REQUEST_QUERIES statements, are logged with their costliest
+    queries to the ``slow_requests`` logger, except for views marked with
+    long_running(). Each app's totals are kept in its ``extensions``.
+    """
+
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SLOW_REQUEST_MS', 500)
+        app.config.setdefault('SLOW_REQUEST_QUERIES', 50)
+        app.extensions['request_metrics'] = MetricSet()
+
+        # Engine events are global; listen once however many apps are created
+        if not event.contains(Engine, 'before_cursor_execute', self.before_query):
+            event.listen(Engine, 'before_cursor_execute', self.before_query)
+            event.listen(Engine, 'after_cursor_execute', self.after_query)
+        before_render_template.connect(self.before_render, app)
+        template_rendered.connect(self.after_render, app)
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+
+    def long_running(self, f):
+        """Mark a view that waits by design, such as a long poll, so it is not logged as slow."""
+        f.metrics_long_running = True
+        return f
+
+    @property
+    def metrics(self):
+        """The MetricSet of the current app."""
+        return current_app.extensions['request_metrics']
+
+    def before_query(self, conn, cursor, statement, parameters, context, executemany):
+        if has_request_context() and 'metrics_queries' in g:
+            context._metrics_start = time.perf_counter()
+
+    def after_query(self, conn, cursor, statement, parameters, context, executemany):
+        start = getattr(context, '_metrics_start', None)
+        if start is not None and has_request_context() and 'metrics_queries' in g:
+            g.metrics_queries.append((statement, time.perf_counter() - start))
+
+    def before_render(self, sender, template, context, **extra):
+        if has_request_context():
+            g.setdefault('metrics_renders', []).append(time.perf_counter())
+
+    def after_render(self, sender, template, context, **extra):
+        if has_request_context() and g.get('metrics_renders'):
+            start = g.metrics_renders.pop()
+            metrics = sender.extensions['request_metrics']
+            metrics.observe(metrics.render_time, (template.name or '<string>',), time.perf_counter() - start)
+
+    def start_request(self):
+        g.metrics_start = time.perf_counter()
+        g.metrics_queries = []
+
+    def finish_request(self, response):
+        start = g.get('metrics_start')
+        if start is None:
+            return response
+        elapsed = time.perf_counter() - start
+        endpoint = request.endpoint or '<unmatched>'
+        queries = g.metrics_queries
+        sql_time = sum(seconds for _, seconds in queries)
+
+        metrics = self.metrics
+        metrics.count((endpoint, request.method, str(response.status_code)))
+        metrics.observe(metrics.latency, (endpoint,), elapsed)
+        metrics.observe(metrics.sql_count, (endpoint,), len(queries))
+        metrics.observe(metrics.sql_time, (endpoint,), sql_time)
+
+        view = current_app.view_functions.get(request.endpoint)
+        if getattr(view, 'metrics_long_running', False):
+            return response
+        config = current_app.config
+        if elapsed >= config['SLOW_REQUEST_MS'] / 1000 or len(queries) > config['SLOW_REQUEST_QUERIES']:
+            self.log_slow_request(endpoint, elapsed, queries, sql_time)
+        return response
+
+    def log_slow_request(self, endpoint, elapsed, queries, sql_time):
+        # Group identical statements so that N+1 patterns stand out
+        grouped = {}
+        for statement, seconds in queries:
+            count, total = grouped.get(statement, (0, 0.0))
+            grouped[statement] = (count + 1, total + seconds)
+        worst = sorted(grouped.items(), key=lambda item: item[1][1], reverse=True)[:SLOW_LOG_QUERIES]
+        details = ''.join(f'\n  {count}x {total * 1000:.1f}ms {" ".join(statement.split())}'
+                          for statement, (count, total) in worst)
+        slow_log.warning(f"Slow request {request.method} {request.full_path.rstrip('?')} ({endpoint}): "
+                         f"{elapsed * 1000:.1f}ms, {len(queries)} queries in {sql_time * 1000:.1f}ms{details}")
+
+    def render(self):
+        """The current app's metrics in the Prometheus text exposition format."""
+        return self.metrics.render()
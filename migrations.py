@@ -0,0 +1,138 @@
+import logging
+from datetime import datetime
+from sqlalchemy import Column, DateTime, Integer, MetaData, String, Table, inspect, select, text
+
+# Bookkeeping table, kept out of the models' metadata on purpose
+schema_version = Table(
+    'schema_version', MetaData(),
+    Column('version', Integer, primary_key=True),
+    Column('description', String(200), nullable=False),
+    Column('applied_at', DateTime, default=datetime.utcnow),
+)
+
+MIGRATIONS = []
+
+
+def migration(version, description):
+    """Register a schema migration.
+
+    Migrations run in version order after create_all() has built any
+    missing model tables. They must be idempotent, because a fresh database
+    (and one created before versioning was introduced) may already contain
+    part of what they add.
+    """
+    def decorator(fn):
+        MIGRATIONS.append((version, description, fn))
+        MIGRATIONS.sort(key=lambda m: m[0])
+        return fn
+    return decorator
+
+
+def add_column(connection, table, name):
+    """Add one of a model table's declared columns if it is missing."""
+    existing = {column['name'] for column in inspect(connection).get_columns(table.name)}
+    if name in existing:
+        return
+    column = table.c[name]
+    column_type = column.type.compile(dialect=connection.dialect)
+    connection.execute(text(f'ALTER TABLE {connection.dialect.identifier_preparer.format_table(table)} '
+                            f'ADD COLUMN {name} {column_type}'))
+
+
+def create_index(connection, table, name):
+    """Create one of a model table's declared indexes if it is missing."""
+    index = next(index for index in table.indexes if index.name == name)
+    index.create(bind=connection, checkfirst=True)
+
+
+@migration(1, 'Indexes for post listing, dashboard and comment queries')
+def add_hot_path_indexes(connection):
+    from models import Post, Comment
+    for name in ('ix_post_created_at_id', 'ix_post_user_id_created_at'):
+        create_index(connection, Post.__table__, name)
+    for name in ('ix_comment_post_id_created_at', 'ix_comment_user_id'):
+        create_index(connection, Comment.__table__, name)
+
+
+@migration(2, 'Full-text search index over posts and comments')
+def add_search_index(connection):
+    import search
+    search.create_index(connection)
+
+
+@migration(3, 'Store rendered HTML and excerpts on posts')
+def add_rendered_post_columns(connection):
+    from models import Post
+    from rendering import render_markdown, make_excerpt
+    for name in ('content_html', 'excerpt'):
+        add_column(connection, Post.__table__, name)
+
+    table = Post.__table__
+    rows = connection.execute(select(table.c.id, table.c.content).where(table.c.content_html.is_(None))).all()
+    for row in rows:
+        content_html = render_markdown(row.content)
+        connection.execute(table.update().where(table.c.id == row.id).values(
+            content_html=content_html, excerpt=make_excerpt(content_html),
+            updated_at=table.c.updated_at))
+
+
+@migration(4, 'Store user emails lower-cased')
+def normalize_user_emails(connection):
+    from models import User
+    table = User.__table__
+    rows = connection.execute(select(table.c.id, table.c.email)).all()
+    taken = {row.email for row in rows}
+    for row in rows:
+        email = User.normalize_email(row.email)
+        if email == row.email:
+            continue
+        if email in taken:
+            logging.warning(f"Cannot normalize email of user {row.id}: {email} is already in use")
+            continue
+        connection.execute(table.update().where(table.c.id == row.id).values(email=email))
+        taken.add(email)
+
+
+@migration(5, 'Re-render post HTML to drop character-encoded unsafe link schemes')
+def rerender_post_html(connection):
+    from models import Post
+    from rendering import render_markdown, make_excerpt
+    table = Post.__table__
+    rows = connection.execute(select(table.c.id, table.c.content, table.c.content_html)).all()
+    for row in rows:
+        content_html = render_markdown(row.content)
+        if content_html == row.content_html:
+            continue
+        connection.execute(table.update().where(table.c.id == row.id).values(
+            content_html=content_html, excerpt=make_excerpt(content_html),
+            updated_at=table.c.updated_at))
+
+
+def current_version(connection):
+    """Return the latest applied migration version (0 if none)."""
+    versions = connection.execute(select(schema_version.c.version)).scalars().all()
+    return max(versions, default=0)
+
+
+def upgrade(db):
+    """Bring the database schema up to the latest migration.
+
+    Must be called inside an application context with the models imported.
+    """
+    head = MIGRATIONS[-1][0] if MIGRATIONS else 0
+    with db.engine.begin() as connection:
+        if connection.dialect.name == 'postgresql':
+            # Serialise concurrent upgrades from workers booting together
+            connection.execute(text('SELECT pg_advisory_xact_lock(720401)'))
+
+        schema_version.create(bind=connection, checkfirst=True)
+        db.metadata.create_all(bind=connection)
+
+        version = current_version(connection)
+        for number, description, fn in MIGRATIONS:
+            if number <= version:
+                continue
+            logging.info(f"Applying migration {number}: {description}")
+            fn(connection)
+            connection.execute(schema_version.insert(), {'version': number, 'description': description})
+        return head
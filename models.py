@@ -1,12 +1,48 @@
 from datetime import datetime
-from app import db, login_manager
+from flask import current_app
+from sqlalchemy import event, func
+from sqlalchemy.orm import joinedload, load_only
+from app import db, login_manager, response_cache, password_hasher
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
+from rendering import render_markdown, make_excerpt
 
 @login_manager.user_loader
 def load_user(user_id):
-    """Load a user by ID."""
-    return User.query.get(int(user_id))
+    """Load a user by ID, from the user cache when possible."""
+    key = SessionUser.cache_key(int(user_id))
+    data = response_cache.backend.get(key)
+    if data is None:
+        user = db.session.get(User, int(user_id))
+        if user is None:
+            return None
+        data = SessionUser.from_user(user).to_dict()
+        response_cache.backend.set(key, data, ttl=current_app.config['USER_CACHE_TTL'])
+    return SessionUser(**data)
+
+class SessionUser(UserMixin):
+    """Lightweight projection of User used as current_user.
+    
+    Holds only what templates and permission checks need, so it can be
+    cached between requests instead of loading the User row every time.
+    """
+    
+    def __init__(self, id, username):
+        self.id = id
+        self.username = username
+    
+    @staticmethod
+    def cache_key(user_id):
+        return f'user:{user_id}'
+    
+    @classmethod
+    def from_user(cls, user):
+        return cls(id=user.id, username=user.username)
+    
+    def to_dict(self):
+        return {'id': self.id, 'username': self.username}
+    
+    def __repr__(self):
+        return f'<SessionUser {self.username}>'
 
 class User(UserMixin, db.Model):
     """User model for authentication and user management."""
@@ -20,43 +56,110 @@ class User(UserMixin, db.Model):
     posts = db.relationship('Post', backref='author', lazy='dynamic', cascade='all, delete-orphan')
     comments = db.relationship('Comment', backref='author', lazy='dynamic', cascade='all, delete-orphan')
     
+    @staticmethod
+    def normalize_email(email):
+        """Emails are stored and looked up trimmed and lower-cased."""
+        return email.strip().lower() if email else email
+    
     def set_password(self, password):
         """Hash and set the user's password."""
-        self.password_hash = generate_password_hash(password)
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
-        """Check if the provided password matches the stored hash."""
-        return check_password_hash(self.password_hash, password)
+        """Check if the provided password matches the stored hash.
+        
+        On success, a hash made with outdated settings is replaced with one
+        using the current method and cost; the caller commits the change.
+        """
+        if not password_hasher.verify(self.password_hash, password):
+            return False
+        if password_hasher.needs_rehash(self.password_hash):
+            self.set_password(password)
+        return True
     
     def __repr__(self):
         return f'<User {self.username}>'
 
+@event.listens_for(User, 'after_update')
+@event.listens_for(User, 'after_delete')
+def invalidate_cached_user(mapper, connection, user):
+    """Drop a changed or deleted user from the user cache."""
+    response_cache.backend.delete(SessionUser.cache_key(user.id))
+
 class Post(db.Model):
     """Post model for blog posts."""
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(128), nullable=False)
     content = db.Column(db.Text, nullable=False)
+    content_html = db.Column(db.Text)
+    excerpt = db.Column(db.Text)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     
     # Relationships
     comments = db.relationship('Comment', backref='post', lazy='dynamic', cascade='all, delete-orphan')
+    images = db.relationship('PostImage', backref='post', lazy='dynamic', cascade='all, delete-orphan',
+                             order_by='PostImage.id')
+    
+    __table_args__ = (
+        db.Index('ix_post_created_at_id', 'created_at', 'id'),
+        db.Index('ix_post_user_id_created_at', 'user_id', 'created_at'),
+    )
     
     def __repr__(self):
         return f'<Post {self.title}>'
     
-    def to_dict(self):
+    def render_content(self):
+        """Render the Markdown content to HTML and refresh the excerpt."""
+        self.content_html = render_markdown(self.content)
+        self.excerpt = make_excerpt(self.content_html)
+    
+    @staticmethod
+    def with_author(query):
+        """Eager-load each post's author in the same query."""
+        return query.options(joinedload(Post.author).load_only(User.id, User.username))
+    
+    @staticmethod
+    def for_listing(query):
+        """Load only what list views show, leaving the post bodies in the database."""
+        return Post.with_author(query).options(load_only(
+            Post.id, Post.title, Post.excerpt, Post.created_at, Post.updated_at, Post.user_id))
+    
+    @staticmethod
+    def with_images(post_id):
+        """Return (post, images) with the post's author, in one query, or None if there is no such post."""
+        rows = Post.with_author(db.session.query(Post, PostImage)) \
+            .outerjoin(PostImage, PostImage.post_id == Post.id) \
+            .filter(Post.id == post_id).order_by(PostImage.id).all()
+        if not rows:
+            return None
+        return rows[0][0], [image for _, image in rows if image is not None]
+    
+    @staticmethod
+    def comment_counts(post_ids):
+        """Count comments for many posts in one grouped query."""
+        if not post_ids:
+            return {}
+        rows = db.session.query(Comment.post_id, func.count(Comment.id)) \
+            .filter(Comment.post_id.in_(post_ids)) \
+            .group_by(Comment.post_id).all()
+        return dict(rows)
+    
+    def to_dict(self, comment_count=None):
         """Convert post to dictionary for JSON serialization."""
+        if comment_count is None:
+            comment_count = self.comments.count()
         return {
             'id': self.id,
             'title': self.title,
             'content': self.content,
+            'excerpt': self.excerpt,
             'created_at': self.created_at.isoformat(),
             'updated_at': self.updated_at.isoformat(),
             'author': self.author.username,
             'user_id': self.user_id,
-            'comment_count': self.comments.count()
+            'comment_count': comment_count
         }
 
 class Comment(db.Model):
@@ -68,9 +171,27 @@ class Comment(db.Model):
     user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
     post_id = db.Column(db.Integer, db.ForeignKey('post.id'), nullable=False)
     
+    __table_args__ = (
+        db.Index('ix_comment_post_id_created_at', 'post_id', 'created_at'),
+        db.Index('ix_comment_user_id', 'user_id'),
+    )
+    
     def __repr__(self):
         return f'<Comment {self.id}>'
     
+    @staticmethod
+    def with_author(query):
+        """Eager-load each comment's author in the same query."""
+        return query.options(joinedload(Comment.author).load_only(User.id, User.username))
+    
+    @staticmethod
+    def summary(post_ids):
+        """Return (count, latest updated_at) of the comments on the given posts."""
+        if not post_ids:
+            return 0, None
+        return db.session.query(func.count(Comment.id), func.max(Comment.updated_at)) \
+            .filter(Comment.post_id.in_(post_ids)).one()
+    
     def to_dict(self):
         """Convert comment to dictionary for JSON serialization."""
         return {
@@ -82,3 +203,63 @@ class Comment(db.Model):
             'user_id': self.user_id,
             'post_id': self.post_id
         }
+
+class PostImage(db.Model):
+    """Image attached to a post; the file is in the image store under its hash."""
+    id = db.Column(db.Integer, primary_key=True)
+    post_id = db.Column(db.Integer, db.ForeignKey('post.id'), nullable=False)
+    sha256 = db.Column(db.String(64), nullable=False)
+    width = db.Column(db.Integer, nullable=False)
+    height = db.Column(db.Integer, nullable=False)
+    content_type = db.Column(db.String(32), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_post_image_post_id', 'post_id'),
+        db.Index('ix_post_image_sha256', 'sha256'),
+    )
+    
+    def __repr__(self):
+        return f'<PostImage {self.id} {self.sha256[:12]}>'
+
+class Deletion(db.Model):
+    """Tombstone of a deleted post or comment, read by incremental exports."""
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(10), nullable=False)
+    object_id = db.Column(db.Integer, nullable=False)
+    post_id = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_deletion_deleted_at', 'deleted_at'),
+    )
+    
+    def __repr__(self):
+        return f'<Deletion {self.kind} {self.object_id}>'
+
+class Job(db.Model):
+    """Background job waiting to run; see jobs.JobQueue."""
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(64), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')
+    status = db.Column(db.String(10), nullable=False, default='queued')
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    locked_at = db.Column(db.DateTime)
+    last_error = db.Column(db.Text)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    
+    __table_args__ = (
+        db.Index('ix_job_status_run_at', 'status', 'run_at'),
+    )
+    
+    def __repr__(self):
+        return f'<Job {self.id} {self.name}>'
+
+def serialize_posts(posts):
+    """Serialize a batch of posts with a single comment-count query.
+    
+    Authors should already be loaded, e.g. via Post.with_author().
+    """
+    counts = Post.comment_counts([post.id for post in posts])
+    return [post.to_dict(comment_count=counts.get(post.id, 0)) for post in posts]
@@ -0,0 +1,64 @@
+import html
+import re
+from urllib.parse import urlsplit
+import markdown
+from markdown.extensions import Extension
+from markdown.treeprocessors import Treeprocessor
+
+EXCERPT_LENGTH = 300
+SAFE_URL_SCHEMES = {'', 'http', 'https', 'mailto'}
+
+
+class SafeLinkTreeprocessor(Treeprocessor):
+    """Drop link and image URLs that use unsafe schemes such as javascript:."""
+
+    def run(self, root):
+        for element in root.iter():
+            for attribute in ('href', 'src'):
+                value = element.get(attribute)
+                if value is None:
+                    continue
+                # Markdown keeps character references in attributes as written,
+                # and browsers decode them and ignore whitespace and control
+                # characters before reading the scheme
+                url = re.sub(r'[\x00-\x20\x7f]', '', html.unescape(value))
+                try:
+                    scheme = urlsplit(url).scheme.lower()
+                except ValueError:
+                    scheme = None
+                if scheme not in SAFE_URL_SCHEMES:
+                    del element.attrib[attribute]
+
+
+class LazyImageTreeprocessor(Treeprocessor):
+    """Let browsers defer loading and decoding images linked from elsewhere."""
+
+    def run(self, root):
+        for element in root.iter('img'):
+            element.set('loading', 'lazy')
+            element.set('decoding', 'async')
+
+
+class SafeMarkdownExtension(Extension):
+    """Treat raw HTML in Markdown source as text and sanitise URLs."""
+
+    def extendMarkdown(self, md):
+        md.preprocessors.deregister('html_block')
+        md.inlinePatterns.deregister('html')
+        md.treeprocessors.register(SafeLinkTreeprocessor(md), 'safe_links', 0)
+        md.treeprocessors.register(LazyImageTreeprocessor(md), 'lazy_images', 1)
+
+
+def render_markdown(text):
+    """Render post Markdown to HTML that is safe to output unescaped."""
+    md = markdown.Markdown(extensions=[SafeMarkdownExtension(), 'fenced_code', 'tables', 'sane_lists'])
+    return md.convert(text)
+
+
+def make_excerpt(rendered_html, length=EXCERPT_LENGTH):
+    """Build a plain-text excerpt from rendered HTML."""
+    text = html.unescape(re.sub(r'<[^>]+>', ' ', rendered_html))
+    text = ' '.join(text.split())
+    if len(text) <= length:
+        return text
+    return text[:length].rsplit(' ', 1)[0] + '...'
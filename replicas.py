@@ -0,0 +1,94 @@
+import itertools
+import threading
+import time
+from functools import wraps
+from flask import current_app, g, has_app_context, has_request_context, session
+from flask_sqlalchemy.session import Session
+from sqlalchemy import event
+from database import engine_options
+
+REPLICA_BIND_PREFIX = 'replica_'
+
+
+def replica_binds(urls):
+    """SQLALCHEMY_BINDS entries for the read replicas, with per-backend engine options."""
+    return {
+        f'{REPLICA_BIND_PREFIX}{number}': dict(engine_options(url), url=url)
+        for number, url in enumerate(urls)
+    }
+
+
+class RoutingSession(Session):
+    """Session that sends reads to the replica chosen for the current request.
+
+    Flushes always go to the primary, as does everything outside views
+    marked with ReplicaRouter.read_only.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if bind is None and not self._flushing and has_app_context():
+            replica = g.get('read_replica')
+            if replica is not None:
+                return replica
+        return super().get_bind(mapper, clause=clause, bind=bind, **kwargs)
+
+
+class ReplicaSet:
+    """The replica engines of one app, handed out in turn."""
+
+    def __init__(self, engines):
+        self.engines = engines
+        self._cycle = itertools.cycle(engines)
+        self._lock = threading.Lock()
+
+    def next_engine(self):
+        with self._lock:
+            return next(self._cycle)
+
+
+class ReplicaRouter:
+    """Round-robin routing of read-only views to replica engines.
+
+    After a client writes anything, its reads stay on the primary for
+    REPLICA_STICKY_SECONDS so it sees its own changes despite replica lag.
+    Each app's engines are kept in its ``extensions``.
+    """
+
+    def init_app(self, app, db):
+        app.config.setdefault('REPLICA_STICKY_SECONDS', 5)
+        with app.app_context():
+            engines = [engine for key, engine in sorted(db.engines.items(), key=lambda item: str(item[0]))
+                       if key and key.startswith(REPLICA_BIND_PREFIX)]
+        app.extensions['replica_router'] = ReplicaSet(engines)
+
+        if not event.contains(RoutingSession, 'after_flush', self.record_write):
+            event.listen(RoutingSession, 'after_flush', self.record_write)
+        app.after_request(self.remember_write)
+
+    @property
+    def replicas(self):
+        """The ReplicaSet of the current app."""
+        return current_app.extensions['replica_router']
+
+    @property
+    def engines(self):
+        return self.replicas.engines
+
+    def record_write(self, db_session, flush_context):
+        if has_request_context():
+            g.db_wrote = True
+
+    def remember_write(self, response):
+        if g.get('db_wrote') and self.engines:
+            session['primary_until'] = time.time() + current_app.config['REPLICA_STICKY_SECONDS']
+        return response
+
+    def read_only(self, f):
+        """Decorator routing a view's queries to a replica when one is configured."""
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            replicas = self.replicas
+            if replicas.engines and session.get('primary_until', 0) < time.time():
+                g.read_replica = replicas.next_engine()
+            return f(*args, **kwargs)
+        return decorated
@@ -1,101 +1,432 @@
+import hmac
+import io
+import json
 import logging
+import math
+import os
+import time
 from datetime import datetime
-from flask import render_template, redirect, url_for, flash, request, jsonify, abort
+from flask import Blueprint, current_app, render_template, redirect, url_for, flash, request, jsonify, abort, Response, stream_with_context, send_file
+from sqlalchemy import func
+from sqlalchemy.exc import IntegrityError
 from flask_login import login_user, logout_user, current_user, login_required
+from flask_wtf.csrf import validate_csrf
+from wtforms.validators import ValidationError
 from werkzeug.exceptions import NotFound, Forbidden
-from app import app, db
-from models import User, Post, Comment
+from app import db, response_cache, login_throttle, replica_router, request_metrics, comment_feed, job_queue, image_store, post_documents
+from models import User, Post, Comment, PostImage, Deletion, serialize_posts
+from security import HashingBusy
 from forms import RegistrationForm, LoginForm, PostForm, CommentForm
-from utils import format_datetime
+from utils import format_datetime, chunked
+import search
+import bulk
+import export
+from http_cache import conditional, make_etag
+from images import InvalidImage, HASH_PATTERN, VARIANT_FORMATS
+import documents
+from pagination import InvalidCursor, keyset_newest_first, keyset_page, parse_limit
+
+blog = Blueprint('blog', __name__)
 
 # Register template filters
-app.jinja_env.filters['format_datetime'] = format_datetime
+blog.add_app_template_filter(format_datetime, 'format_datetime')
+
+POSTS_PER_PAGE = 5
+DASHBOARD_PER_PAGE = 20
+COMMENTS_PER_PAGE = 20
+SEARCH_PER_PAGE = 10
+
+def post_list_tags(**kwargs):
+    """Cache tags for views listing many posts."""
+    return ['post-list']
+
+def post_tags(post_id):
+    """Cache tags for views showing a single post and its comments."""
+    return [f'post:{post_id}']
+
+def posts_validator(rows, total=None):
+    """ETag and Last-Modified for a list of (id, updated_at) post rows and their comments."""
+    comment_count, comments_updated = Comment.summary([row.id for row in rows])
+    timestamps = [row.updated_at for row in rows] + [comments_updated]
+    last_modified = max((dt for dt in timestamps if dt is not None), default=None)
+    etag = make_etag(total, [tuple(row) for row in rows], comment_count, comments_updated)
+    return etag, last_modified
+
+def index_validator():
+    """Validators for one page of the home page, from ids and timestamps only."""
+    page = request.args.get('page', 1, type=int)
+    def compute():
+        rows = Post.query.with_entities(Post.id, Post.updated_at) \
+            .order_by(Post.created_at.desc()) \
+            .limit(POSTS_PER_PAGE).offset(max(page - 1, 0) * POSTS_PER_PAGE).all()
+        return posts_validator(rows, db.session.query(func.count(Post.id)).scalar())
+    return response_cache.memoize('etag', post_list_tags(), compute)
+
+def post_validator(post_id):
+    """Validators for a single post and its comments."""
+    def compute():
+        row = Post.query.with_entities(Post.id, Post.updated_at).filter_by(id=post_id).first()
+        return posts_validator([row]) if row else None
+    return response_cache.memoize('etag', post_tags(post_id), compute)
 
-@app.route('/')
+def api_posts_validator():
+    """Validators for one keyset page of /api/posts."""
+    limit = parse_limit(request.args.get('limit', type=int))
+    def compute():
+        try:
+            query = keyset_newest_first(Post.query.with_entities(Post.id, Post.updated_at), Post, request.args.get('cursor'))
+        except InvalidCursor:
+            return None
+        return posts_validator(query.limit(limit + 1).all())
+    return response_cache.memoize('etag', post_list_tags(), compute)
+
+@blog.route('/')
+@replica_router.read_only
+@conditional(index_validator, per_user=True)
+@response_cache.cached(post_list_tags, anonymous_only=True)
 def index():
     """Home page - shows latest posts."""
     page = request.args.get('page', 1, type=int)
-    posts = Post.query.order_by(Post.created_at.desc()).paginate(page=page, per_page=5)
-    return render_template('index.html', posts=posts)
+    posts = Post.for_listing(Post.query).order_by(Post.created_at.desc()).paginate(page=page, per_page=POSTS_PER_PAGE)
+    comment_counts = Post.comment_counts([post.id for post in posts.items])
+    return render_template('index.html', posts=posts, comment_counts=comment_counts)
 
-@app.route('/register', methods=['GET', 'POST'])
+@blog.route('/register', methods=['GET', 'POST'])
 def register():
     """User registration page."""
     if current_user.is_authenticated:
-        return redirect(url_for('index'))
+        return redirect(url_for('blog.index'))
     
     form = RegistrationForm()
     if form.validate_on_submit():
+        if not login_throttle.allow(request.remote_addr):
+            flash('Too many attempts. Please wait a few minutes and try again.', 'danger')
+            return render_template('register.html', form=form), 429
         user = User(username=form.username.data, email=form.email.data)
-        user.set_password(form.password.data)
+        try:
+            user.set_password(form.password.data)
+        except HashingBusy:
+            flash('The server is busy. Please try again in a moment.', 'warning')
+            return render_template('register.html', form=form), 503
         db.session.add(user)
-        db.session.commit()
+        try:
+            db.session.commit()
+        except IntegrityError:
+            # Someone registered the same username or email since validation
+            db.session.rollback()
+            form.check_conflicts()
+            return render_template('register.html', form=form), 409
         flash('Your account has been created! You can now log in.', 'success')
-        return redirect(url_for('login'))
+        return redirect(url_for('blog.login'))
     
     return render_template('register.html', form=form)
 
-@app.route('/login', methods=['GET', 'POST'])
+@blog.route('/login', methods=['GET', 'POST'])
 def login():
     """User login page."""
     if current_user.is_authenticated:
-        return redirect(url_for('index'))
+        return redirect(url_for('blog.index'))
     
     form = LoginForm()
     if form.validate_on_submit():
+        if not login_throttle.allow(request.remote_addr, form.email.data):
+            flash('Too many login attempts. Please wait a few minutes and try again.', 'danger')
+            return render_template('login.html', form=form), 429
         user = User.query.filter_by(email=form.email.data).first()
-        if user and user.check_password(form.password.data):
+        try:
+            authenticated = user is not None and user.check_password(form.password.data)
+        except HashingBusy:
+            flash('The server is busy. Please try again in a moment.', 'warning')
+            return render_template('login.html', form=form), 503
+        if authenticated:
+            if db.session.is_modified(user):
+                # The password was rehashed with the current settings
+                db.session.commit()
             login_user(user)
             next_page = request.args.get('next')
             flash('You have been logged in successfully!', 'success')
-            return redirect(next_page or url_for('dashboard'))
+            return redirect(next_page or url_for('blog.dashboard'))
         else:
             flash('Login failed. Please check your email and password.', 'danger')
     
     return render_template('login.html', form=form)
 
-@app.route('/logout')
+@blog.route('/logout')
 @login_required
 def logout():
     """Log user out and redirect to home page."""
     logout_user()
     flash('You have been logged out.', 'info')
-    return redirect(url_for('index'))
+    return redirect(url_for('blog.index'))
 
-@app.route('/dashboard')
+@blog.route('/dashboard')
+@replica_router.read_only
 @login_required
 def dashboard():
     """User dashboard - shows user's posts and allows creating new ones."""
-    posts = Post.query.filter_by(user_id=current_user.id).order_by(Post.created_at.desc()).all()
-    return render_template('dashboard.html', posts=posts)
+    posts, next_cursor = keyset_page(Post.for_listing(Post.query).filter_by(user_id=current_user.id), Post, limit=DASHBOARD_PER_PAGE)
+    comment_counts = Post.comment_counts([post.id for post in posts])
+    post_count = db.session.query(func.count(Post.id)).filter_by(user_id=current_user.id).scalar()
+    return render_template('dashboard.html', posts=posts, comment_counts=comment_counts,
+                           post_count=post_count, next_cursor=next_cursor)
+
+@blog.route('/dashboard/posts')
+@replica_router.read_only
+@login_required
+def dashboard_posts():
+    """Next page of the dashboard's post rows, for "load more"."""
+    try:
+        posts, next_cursor = keyset_page(Post.for_listing(Post.query).filter_by(user_id=current_user.id), Post,
+                                         request.args.get('cursor'), DASHBOARD_PER_PAGE)
+    except InvalidCursor:
+        return jsonify({"success": False, "message": "Invalid cursor"}), 400
+    comment_counts = Post.comment_counts([post.id for post in posts])
+    html = render_template('_dashboard_rows.html', posts=posts, comment_counts=comment_counts)
+    return jsonify({"html": html, "next_cursor": next_cursor})
 
-@app.route('/post/new', methods=['GET', 'POST'])
+@blog.route('/post/new', methods=['GET', 'POST'])
 @login_required
 def create_post():
     """Create a new blog post."""
     form = PostForm()
     if form.validate_on_submit():
-        post = Post(
-            title=form.title.data,
-            content=form.content.data,
-            user_id=current_user.id
-        )
-        db.session.add(post)
-        db.session.commit()
-        flash('Your post has been created!', 'success')
-        return redirect(url_for('dashboard'))
+        uploads = save_images(form)
+        if uploads is not None:
+            post = Post(
+                title=form.title.data,
+                content=form.content.data,
+                user_id=current_user.id
+            )
+            post.render_content()
+            db.session.add(post)
+            db.session.flush()
+            attach_images(post, uploads)
+            job_queue.enqueue('index_post', post_id=post.id)
+            commit_with_images(uploads)
+            response_cache.invalidate('post-list')
+            flash('Your post has been created!', 'success')
+            return redirect(url_for('blog.dashboard'))
     
     return render_template('create_post.html', form=form, title='New Post')
 
-@app.route('/post/<int:post_id>')
+def save_images(form):
+    """Store the uploaded images; return their details, or None after adding a form error."""
+    uploads = []
+    for file in form.images.data or []:
+        if not file or not file.filename:
+            continue
+        try:
+            uploads.append(image_store.save(file))
+        except InvalidImage as e:
+            form.images.errors = list(form.images.errors) + [f'{file.filename}: {e}']
+            discard_images(uploads)
+            return None
+    return uploads
+
+def discard_images(uploads):
+    """Queue the removal of images stored by a request that failed, in a transaction of its own."""
+    db.session.rollback()
+    if uploads:
+        for sha256 in {sha256 for sha256, *_ in uploads}:
+            job_queue.enqueue('remove_image_files', sha256=sha256)
+        db.session.commit()
+
+def commit_with_images(uploads):
+    """Commit the current transaction, discarding the stored uploads if that fails."""
+    try:
+        db.session.commit()
+    except Exception:
+        discard_images(uploads)
+        raise
+
+def attach_images(post, uploads):
+    """Attach stored images to a post and queue their resizing."""
+    images = [PostImage(post=post, sha256=sha256, width=width, height=height, content_type=content_type)
+              for sha256, width, height, content_type in uploads]
+    db.session.add_all(images)
+    db.session.flush()
+    for image in images:
+        job_queue.enqueue('resize_image', image_id=image.id)
+
+@blog.route('/post/<int:post_id>')
+@replica_router.read_only
+@conditional(post_validator, per_user=True)
+@response_cache.cached(post_tags, anonymous_only=True)
 def post_detail(post_id):
     """Show detailed view of a post with comments."""
-    post = Post.query.get_or_404(post_id)
-    comments = Comment.query.filter_by(post_id=post_id).order_by(Comment.created_at.desc()).all()
+    # Taken before the comments are read, so the live feed cannot miss one
+    feed_cursor = comment_feed.cursor(post_id)
+    found = Post.with_images(post_id)
+    if found is None:
+        abort(404)
+    post, images = found
+    comments, next_cursor = keyset_page(Comment.with_author(Comment.query).filter_by(post_id=post_id), Comment,
+                                        limit=COMMENTS_PER_PAGE)
+    comment_count = Post.comment_counts([post_id]).get(post_id, 0)
     form = CommentForm()
-    return render_template('post_detail.html', post=post, comments=comments, form=form)
+    return render_template('post_detail.html', post=post, comments=comments, form=form, images=images,
+                           comment_count=comment_count, next_cursor=next_cursor, feed_cursor=feed_cursor)
+
+@blog.route('/images/<sha256>/<int:width>.<ext>')
+def post_image(sha256, width, ext):
+    """A resized post image; its URL names its content, so it is cached for good."""
+    if ext not in VARIANT_FORMATS or not HASH_PATTERN.match(sha256):
+        abort(404)
+    path = image_store.variant_path(sha256, width, ext)
+    if os.path.exists(path):
+        response = send_file(path, mimetype=VARIANT_FORMATS[ext][1], conditional=True,
+                             max_age=current_app.config['IMAGE_MAX_AGE'])
+        response.cache_control.immutable = True
+        return response
+    
+    # Not resized yet: send the original, but keep it out of caches under this URL
+    image = PostImage.query.with_entities(PostImage.width, PostImage.content_type).filter_by(sha256=sha256).first()
+    original = image_store.original_path(sha256)
+    if image is None or width not in image_store.widths(image.width) or not os.path.exists(original):
+        abort(404)
+    response = send_file(original, mimetype=image.content_type)
+    response.cache_control.no_store = True
+    return response
+
+@blog.route('/post/<int:post_id>.<any(pdf, docx):fmt>')
+@replica_router.read_only
+def post_document(post_id, fmt):
+    """Download a post as PDF or Word, rendered once per version of the post."""
+    found = Post.with_images(post_id)
+    if found is None:
+        abort(404)
+    post, images = found
+    document = {
+        'title': post.title,
+        'author': post.author.username,
+        'byline': f'Posted by {post.author.username} on {format_datetime(post.created_at)}',
+        'content_html': post.content_html,
+        'images': document_images(images),
+    }
+    try:
+        file = post_documents.open(post.id, post.updated_at, fmt, document)
+    except documents.RenderFailed as e:
+        logging.error(f"Post {post.id} could not be rendered as {fmt}: {e}")
+        return render_template('error.html', error_code=500, message="The document could not be generated"), 500
+    if file is None:
+        # Rendering in the pool; the browser retries on its own
+        return Response('The document is being prepared, please wait.', 202, mimetype='text/plain',
+                        headers={'Retry-After': '2', 'Refresh': '2'})
+    return send_file(file, mimetype=documents.FORMATS[fmt], as_attachment=True,
+                     download_name=f'post-{post.id}.{fmt}', etag=os.path.basename(file.name),
+                     last_modified=post.updated_at)
+
+def document_images(images):
+    """Files for a post's images in documents: the largest JPEG variant, or the original."""
+    paths = []
+    for image in images:
+        path = image_store.variant_path(image.sha256, image_store.widths(image.width)[-1], 'jpg')
+        if not os.path.exists(path) and image.content_type != 'image/webp':
+            path = image_store.original_path(image.sha256)
+        if os.path.exists(path):
+            paths.append(path)
+    return paths
+
+@blog.app_template_global()
+def image_srcset(image, ext):
+    """srcset listing a post image's resized variants in one format."""
+    return ', '.join(f"{url_for('blog.post_image', sha256=image.sha256, width=width, ext=ext)} {width}w"
+                     for width in image_store.widths(image.width))
+
+@blog.app_template_global()
+def image_src(image, ext):
+    """src for browsers without srcset support: the middle-sized variant."""
+    widths = image_store.widths(image.width)
+    return url_for('blog.post_image', sha256=image.sha256, width=widths[len(widths) // 2], ext=ext)
+
+@blog.route('/post/<int:post_id>/comments')
+@replica_router.read_only
+def post_comments(post_id):
+    """Next page of a post's rendered comments, for "load more"."""
+    post = Post.query.with_entities(Post.id, Post.user_id).filter_by(id=post_id).first_or_404()
+    try:
+        comments, next_cursor = keyset_page(Comment.with_author(Comment.query).filter_by(post_id=post_id), Comment,
+                                            request.args.get('cursor'), COMMENTS_PER_PAGE)
+    except InvalidCursor:
+        return jsonify({"success": False, "message": "Invalid cursor"}), 400
+    html = render_template('_comments.html', post=post, comments=comments)
+    return jsonify({"html": html, "next_cursor": next_cursor})
+
+@blog.route('/post/<int:post_id>/events')
+@request_metrics.long_running
+def post_events(post_id):
+    """New and deleted comments on a post, as server-sent events or a long poll.
 
-@app.route('/post/<int:post_id>/edit', methods=['GET', 'POST'])
+    Deliberately not routed to a replica: a new comment must be readable
+    as soon as its event arrives.
+    """
+    post = Post.query.with_entities(Post.id, Post.user_id).filter_by(id=post_id).first_or_404()
+    since = request.args.get('since') or request.headers.get('Last-Event-ID')
+    try:
+        since = comment_feed.check_cursor(since) if since else comment_feed.cursor(post_id)
+    except InvalidCursor:
+        return jsonify({"success": False, "message": "Invalid cursor"}), 400
+    # Don't hold a database connection while waiting for events
+    db.session.close()
+
+    if request.accept_mimetypes.best == 'text/event-stream':
+        return Response(stream_with_context(stream_feed_events(post, since)), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+    max_wait = current_app.config['COMMENT_FEED_WAIT']
+    wait = request.args.get('wait', max_wait, type=float)
+    # nan would make the wait below never time out
+    wait = min(max(wait, 0), max_wait) if math.isfinite(wait) else max_wait
+    events = render_feed_events(post, comment_feed.read(post_id, since, wait))
+    return jsonify({
+        "events": [event for _, event in events],
+        "cursor": events[-1][0] if events else since
+    })
+
+def render_feed_events(post, events):
+    """Turn feed events into JSON payloads, rendering new comments for the current user."""
+    new_ids = [event['comment_id'] for _, event in events if event['type'] == 'comment']
+    comments = {}
+    if new_ids:
+        query = Comment.with_author(Comment.query).filter(Comment.post_id == post.id, Comment.id.in_(new_ids))
+        comments = {comment.id: comment for comment in query}
+
+    rendered = []
+    for cursor, event in events:
+        if event['type'] == 'comment':
+            comment = comments.get(event['comment_id'])
+            if comment is None:
+                # Deleted again before we got to it
+                continue
+            event = dict(event, html=render_template('_comments.html', post=post, comments=[comment]))
+        elif event['type'] == 'reset':
+            event = dict(event, comment_count=Post.comment_counts([post.id]).get(post.id, 0))
+        rendered.append((cursor, event))
+    # Nor while waiting for the next one
+    db.session.close()
+    return rendered
+
+def stream_feed_events(post, since):
+    """Server-sent events for a post until COMMENT_FEED_STREAM_SECONDS pass.
+
+    The browser reconnects on its own afterwards, resuming from the last
+    event id it received.
+    """
+    yield 'retry: 3000\n\n'
+    heartbeat = current_app.config['COMMENT_FEED_HEARTBEAT']
+    deadline = time.monotonic() + current_app.config['COMMENT_FEED_STREAM_SECONDS']
+    cursor = since
+    while time.monotonic() < deadline:
+        events = comment_feed.read(post.id, cursor, min(heartbeat, max(deadline - time.monotonic(), 0)))
+        if not events:
+            # Keeps proxies from timing out and notices disconnected clients
+            yield ': keepalive\n\n'
+            continue
+        cursor = events[-1][0]
+        for event_id, event in render_feed_events(post, events):
+            yield f"id: {event_id}\nevent: {event['type']}\ndata: {json.dumps(event)}\n\n"
+
+@blog.route('/post/<int:post_id>/edit', methods=['GET', 'POST'])
 @login_required
 def edit_post(post_id):
     """Edit an existing blog post."""
@@ -104,23 +435,35 @@ def edit_post(post_id):
     # Check if the current user is the author of the post
     if post.user_id != current_user.id:
         flash('You cannot edit a post that is not yours.', 'danger')
-        return redirect(url_for('post_detail', post_id=post_id))
+        return redirect(url_for('blog.post_detail', post_id=post_id))
     
     form = PostForm()
     if form.validate_on_submit():
-        post.title = form.title.data
-        post.content = form.content.data
-        post.updated_at = datetime.utcnow()
-        db.session.commit()
-        flash('Your post has been updated!', 'success')
-        return redirect(url_for('post_detail', post_id=post_id))
+        uploads = save_images(form)
+        if uploads is not None:
+            post.title = form.title.data
+            post.content = form.content.data
+            post.render_content()
+            post.updated_at = datetime.utcnow()
+            remove_ids = request.form.getlist('remove_image', type=int)
+            removed = post.images.filter(PostImage.id.in_(remove_ids)).all() if remove_ids else []
+            for image in removed:
+                db.session.delete(image)
+            for sha256 in {image.sha256 for image in removed}:
+                job_queue.enqueue('remove_image_files', sha256=sha256)
+            attach_images(post, uploads)
+            job_queue.enqueue('index_post', post_id=post.id)
+            commit_with_images(uploads)
+            response_cache.invalidate('post-list', f'post:{post_id}')
+            flash('Your post has been updated!', 'success')
+            return redirect(url_for('blog.post_detail', post_id=post_id))
     elif request.method == 'GET':
         form.title.data = post.title
         form.content.data = post.content
     
-    return render_template('edit_post.html', form=form, post=post)
+    return render_template('edit_post.html', form=form, post=post, images=post.images.all())
 
-@app.route('/post/<int:post_id>/delete', methods=['POST'])
+@blog.route('/post/<int:post_id>/delete', methods=['POST'])
 @login_required
 def delete_post(post_id):
     """Delete a blog post."""
@@ -130,11 +473,18 @@ def delete_post(post_id):
     if post.user_id != current_user.id:
         return jsonify({"success": False, "message": "You cannot delete a post that is not yours"}), 403
     
+    comment_ids = [comment_id for (comment_id,) in post.comments.with_entities(Comment.id)]
+    job_queue.enqueue('remove_post', post_id=post.id, comment_ids=comment_ids)
+    for (sha256,) in post.images.with_entities(PostImage.sha256).distinct():
+        job_queue.enqueue('remove_image_files', sha256=sha256)
+    # Its comments go with it, so one tombstone covers them
+    db.session.add(Deletion(kind='post', object_id=post.id, post_id=post.id))
     db.session.delete(post)
     db.session.commit()
+    response_cache.invalidate('post-list', f'post:{post_id}')
     return jsonify({"success": True, "message": "Post deleted successfully"})
 
-@app.route('/post/<int:post_id>/comment', methods=['POST'])
+@blog.route('/post/<int:post_id>/comment', methods=['POST'])
 @login_required
 def add_comment(post_id):
     """Add a comment to a post."""
@@ -148,12 +498,18 @@ def add_comment(post_id):
             post_id=post_id
         )
         db.session.add(comment)
+        db.session.flush()
+        job_queue.enqueue('index_comment', comment_id=comment.id)
+        if current_app.config['MAIL_SERVER']:
+            job_queue.enqueue('notify_comment', comment_id=comment.id)
         db.session.commit()
+        response_cache.invalidate('post-list', f'post:{post_id}')
+        comment_feed.comment_added(post_id, comment.id)
         flash('Your comment has been added!', 'success')
     
-    return redirect(url_for('post_detail', post_id=post_id))
+    return redirect(url_for('blog.post_detail', post_id=post_id))
 
-@app.route('/comment/<int:comment_id>/delete', methods=['POST'])
+@blog.route('/comment/<int:comment_id>/delete', methods=['POST'])
 @login_required
 def delete_comment(comment_id):
     """Delete a comment."""
@@ -164,39 +520,186 @@ def delete_comment(comment_id):
     if comment.user_id != current_user.id and post.user_id != current_user.id:
         return jsonify({"success": False, "message": "You cannot delete this comment"}), 403
     
+    post_id = comment.post_id
+    comment_id = comment.id
+    job_queue.enqueue('remove_comment', comment_id=comment_id)
+    db.session.add(Deletion(kind='comment', object_id=comment_id, post_id=post_id))
     db.session.delete(comment)
     db.session.commit()
+    response_cache.invalidate('post-list', f'post:{post_id}')
+    comment_feed.comment_deleted(post_id, comment_id)
     return jsonify({"success": True, "message": "Comment deleted successfully"})
 
-@app.route('/api/posts')
+@blog.route('/api/posts')
+@replica_router.read_only
+@conditional(lambda: None if wants_ndjson() else api_posts_validator())
+@response_cache.cached(post_list_tags, unless=lambda: wants_ndjson())
 def api_posts():
-    """API endpoint to get all posts."""
-    posts = Post.query.order_by(Post.created_at.desc()).all()
-    return jsonify([post.to_dict() for post in posts])
+    """API endpoint to get posts, newest first, one keyset page at a time."""
+    cursor = request.args.get('cursor')
+    if wants_ndjson():
+        return stream_posts_ndjson(cursor, request.args.get('limit', type=int))
 
-@app.route('/api/posts/<int:post_id>')
+    limit = parse_limit(request.args.get('limit', type=int))
+    try:
+        posts, next_cursor = keyset_page(Post.with_author(Post.query), Post, cursor, limit)
+    except InvalidCursor:
+        return jsonify({"success": False, "message": "Invalid cursor"}), 400
+    return jsonify({
+        "posts": serialize_posts(posts),
+        "next_cursor": next_cursor
+    })
+
+def wants_ndjson():
+    """Check whether the client asked for a newline-delimited JSON stream."""
+    if request.args.get('format') == 'ndjson':
+        return True
+    best = request.accept_mimetypes.best_match(['application/json', 'application/x-ndjson'])
+    return best == 'application/x-ndjson'
+
+def stream_posts_ndjson(cursor, limit=None):
+    """Stream posts as NDJSON straight off a server-side cursor."""
+    try:
+        query = keyset_newest_first(Post.with_author(Post.query), Post, cursor)
+    except InvalidCursor:
+        return jsonify({"success": False, "message": "Invalid cursor"}), 400
+    if limit is not None:
+        query = query.limit(max(limit, 1))
+
+    def generate():
+        for batch in chunked(query.yield_per(100), 100):
+            yield ''.join(json.dumps(item) + '\n' for item in serialize_posts(batch))
+
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@blog.route('/api/posts/<int:post_id>')
+@replica_router.read_only
+@conditional(post_validator)
+@response_cache.cached(post_tags)
 def api_post(post_id):
     """API endpoint to get a specific post."""
-    post = Post.query.get_or_404(post_id)
+    post = Post.with_author(Post.query).filter_by(id=post_id).first_or_404()
     return jsonify(post.to_dict())
 
-@app.route('/api/posts/<int:post_id>/comments')
+@blog.route('/api/posts/<int:post_id>/comments')
+@replica_router.read_only
+@conditional(post_validator)
+@response_cache.cached(post_tags)
 def api_post_comments(post_id):
     """API endpoint to get comments for a specific post."""
-    comments = Comment.query.filter_by(post_id=post_id).order_by(Comment.created_at.desc()).all()
+    comments = Comment.with_author(Comment.query).filter_by(post_id=post_id).order_by(Comment.created_at.desc()).all()
     return jsonify([comment.to_dict() for comment in comments])
 
-@app.errorhandler(404)
+@blog.route('/search')
+@replica_router.read_only
+def search_page():
+    """Search posts and comments."""
+    query = request.args.get('q', '')
+    page = request.args.get('page', 1, type=int)
+    hits, total = search.search(query, page=page, per_page=SEARCH_PER_PAGE)
+    pages = (total + SEARCH_PER_PAGE - 1) // SEARCH_PER_PAGE
+    return render_template('search.html', query=query, hits=hits, total=total, page=page, pages=pages)
+
+@blog.route('/api/posts/bulk', methods=['POST'])
+@login_required
+def api_bulk_posts():
+    """API endpoint to create many posts (with optional nested comments) at once."""
+    return bulk_import(bulk.import_posts)
+
+@blog.route('/api/comments/bulk', methods=['POST'])
+@login_required
+def api_bulk_comments():
+    """API endpoint to create many comments at once."""
+    return bulk_import(bulk.import_comments)
+
+BULK_MIMETYPES = ('application/json', 'application/x-ndjson')
+
+def bulk_import(importer):
+    """Run a bulk importer over a JSON array or NDJSON request body."""
+    # Cross-site forms can only send form or text/plain bodies; a JSON body
+    # and the X-CSRFToken header both need the page's own scripts
+    if request.mimetype not in BULK_MIMETYPES:
+        return jsonify({"success": False, "message": "Send application/json or application/x-ndjson"}), 415
+    if current_app.config.get('WTF_CSRF_ENABLED', True):
+        try:
+            validate_csrf(request.headers.get('X-CSRFToken'))
+        except ValidationError as e:
+            return jsonify({"success": False, "message": f"CSRF check failed: {e}"}), 400
+    ndjson = request.mimetype == 'application/x-ndjson'
+    stream = io.TextIOWrapper(request.stream, encoding='utf-8')
+    try:
+        summary = importer(bulk.iter_json_items(stream, ndjson), current_user.id)
+    except ValueError as e:
+        db.session.rollback()
+        return jsonify({"success": False, "message": f"Invalid request body: {e}"}), 400
+    return jsonify(dict(summary, success=summary['failed'] == 0))
+
+@blog.route('/api/export')
+@login_required
+def api_export():
+    """API endpoint streaming every post with its comments and authors.
+
+    Read from the primary: rows a lagging replica has not seen yet would be
+    missing from this export and, being older than its cursor, from the next.
+    """
+    fmt = request.args.get('format', 'ndjson')
+    if fmt not in export.FORMATS:
+        return jsonify({"success": False, "message": f"Unknown format: {fmt}"}), 400
+    try:
+        since = request.args.get('since')
+        since = datetime.fromisoformat(since) if since else None
+    except ValueError:
+        return jsonify({"success": False, "message": "Invalid since timestamp"}), 400
+    after = request.args.get('after', type=int)
+
+    cursor, chunks = export.export_stream(fmt, since, after)
+    response = Response(stream_with_context(chunks), mimetype=export.MIMETYPES[fmt])
+    response.headers['X-Export-Cursor'] = cursor.isoformat()
+    filename = f"blog-export-{cursor:%Y%m%dT%H%M%S}.{fmt}"
+    response.headers['Content-Disposition'] = f'attachment; filename="{filename}"'
+    return response
+
+@blog.route('/api/search')
+@replica_router.read_only
+def api_search():
+    """API endpoint to search posts and comments."""
+    query = request.args.get('q', '')
+    page = request.args.get('page', 1, type=int)
+    per_page = parse_limit(request.args.get('per_page', type=int), default=SEARCH_PER_PAGE)
+    hits, total = search.search(query, page=page, per_page=per_page)
+    return jsonify({
+        "query": query,
+        "page": page,
+        "per_page": per_page,
+        "total": total,
+        "results": [dict(hit, title=str(hit['title']), snippet=str(hit['snippet'])) for hit in hits]
+    })
+
+LOCAL_ADDRESSES = ('127.0.0.1', '::1')
+
+@blog.route('/metrics')
+def metrics():
+    """Prometheus metrics for this worker process, for METRICS_TOKEN holders or local scrapers."""
+    token = current_app.config.get('METRICS_TOKEN')
+    authorized = token and hmac.compare_digest(request.headers.get('Authorization', ''), f'Bearer {token}')
+    # ProxyFix replaces remote_addr with the address from X-Forwarded-For, which
+    # a client can send itself; the peer must be local too, whether a proxy or not
+    peer = request.environ.get('werkzeug.proxy_fix.orig', {}).get('REMOTE_ADDR', request.remote_addr)
+    if not authorized and (peer not in LOCAL_ADDRESSES or request.remote_addr not in LOCAL_ADDRESSES):
+        abort(403)
+    return Response(request_metrics.render(), mimetype='text/plain; version=0.0.4')
+
+@blog.app_errorhandler(404)
 def page_not_found(e):
     """Handle 404 errors."""
     return render_template('error.html', error_code=404, message="Page not found"), 404
 
-@app.errorhandler(403)
+@blog.app_errorhandler(403)
 def forbidden(e):
     """Handle 403 errors."""
     return render_template('error.html', error_code=403, message="Forbidden"), 403
 
-@app.errorhandler(500)
+@blog.app_errorhandler(500)
 def server_error(e):
     """Handle 500 errors."""
     logging.error(f"Server error: {e}")
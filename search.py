@@ -0,0 +1,175 @@
+import re
+from markupsafe import Markup, escape
+from sqlalchemy import text
+from app import db
+
+# Markers wrapped around matched terms by the database, swapped for <mark>
+# tags only after the snippet text has been HTML-escaped.
+HIT_START = '\x02'
+HIT_END = '\x03'
+
+SQLITE_SCHEMA = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS search_index USING fts5(
+        title, body, kind UNINDEXED, ref_id UNINDEXED, post_id UNINDEXED,
+        tokenize='porter unicode61')""",
+]
+
+POSTGRES_SCHEMA = [
+    """CREATE TABLE IF NOT EXISTS search_index (
+        doc_id BIGINT PRIMARY KEY,
+        kind VARCHAR(10) NOT NULL,
+        ref_id INTEGER NOT NULL,
+        post_id INTEGER NOT NULL,
+        title TEXT NOT NULL DEFAULT '',
+        body TEXT NOT NULL,
+        tsv TSVECTOR NOT NULL)""",
+    "CREATE INDEX IF NOT EXISTS ix_search_index_tsv ON search_index USING GIN (tsv)",
+]
+
+POSTGRES_TSV = ("setweight(to_tsvector('english', :title), 'A') || "
+                "setweight(to_tsvector('english', :body), 'B')")
+
+
+def doc_id(kind, ref_id):
+    """Map a post or comment id onto a single document id space."""
+    return ref_id * 2 + (1 if kind == 'comment' else 0)
+
+
+def dialect(bind):
+    return bind.get_bind().dialect.name if hasattr(bind, 'get_bind') else bind.dialect.name
+
+
+def supported(bind):
+    return dialect(bind) in ('sqlite', 'postgresql')
+
+
+def create_index(connection):
+    """Create the search index and fill it from existing posts and comments."""
+    if not supported(connection):
+        return
+    schema = SQLITE_SCHEMA if dialect(connection) == 'sqlite' else POSTGRES_SCHEMA
+    for statement in schema:
+        connection.execute(text(statement))
+    connection.execute(text("DELETE FROM search_index"))
+
+    posts = connection.execute(text("SELECT id, title, content FROM post")).all()
+    for row in posts:
+        write_document(connection, 'post', row.id, row.id, row.title, row.content)
+    comments = connection.execute(text("SELECT id, post_id, content FROM comment")).all()
+    for row in comments:
+        write_document(connection, 'comment', row.id, row.post_id, '', row.content)
+
+
+def write_document(bind, kind, ref_id, post_id, title, body):
+    """Insert or replace one document in the index."""
+    params = {'doc_id': doc_id(kind, ref_id), 'kind': kind, 'ref_id': ref_id,
+              'post_id': post_id, 'title': title, 'body': body}
+    if dialect(bind) == 'sqlite':
+        bind.execute(text("DELETE FROM search_index WHERE rowid = :doc_id"), params)
+        bind.execute(text(
+            "INSERT INTO search_index (rowid, title, body, kind, ref_id, post_id) "
+            "VALUES (:doc_id, :title, :body, :kind, :ref_id, :post_id)"), params)
+    else:
+        bind.execute(text(
+            "INSERT INTO search_index (doc_id, kind, ref_id, post_id, title, body, tsv) "
+            f"VALUES (:doc_id, :kind, :ref_id, :post_id, :title, :body, {POSTGRES_TSV}) "
+            "ON CONFLICT (doc_id) DO UPDATE SET title = EXCLUDED.title, "
+            "body = EXCLUDED.body, tsv = EXCLUDED.tsv"), params)
+
+
+def delete_documents(bind, doc_ids):
+    key = 'rowid' if dialect(bind) == 'sqlite' else 'doc_id'
+    for value in doc_ids:
+        bind.execute(text(f"DELETE FROM search_index WHERE {key} = :doc_id"), {'doc_id': value})
+
+
+def index_post(post):
+    """Add or refresh a post in the index, within the current transaction."""
+    if supported(db.session):
+        write_document(db.session, 'post', post.id, post.id, post.title, post.content)
+
+
+def index_comment(comment):
+    """Add a comment to the index, within the current transaction."""
+    if supported(db.session):
+        write_document(db.session, 'comment', comment.id, comment.post_id, '', comment.content)
+
+
+def remove_post(post_id, comment_ids=()):
+    """Remove a post and its comments from the index."""
+    if supported(db.session):
+        ids = [doc_id('post', post_id)] + [doc_id('comment', cid) for cid in comment_ids]
+        delete_documents(db.session, ids)
+
+
+def remove_comment(comment_id):
+    """Remove a comment from the index."""
+    if supported(db.session):
+        delete_documents(db.session, [doc_id('comment', comment_id)])
+
+
+def sqlite_match(query):
+    """Turn free text into a safe FTS5 query: all words, last one as a prefix."""
+    words = re.findall(r'\w+', query)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += '*'
+    return ' '.join(terms)
+
+
+def highlight(value):
+    """Escape snippet text and mark up the matched terms."""
+    return Markup(str(escape(value)).replace(HIT_START, '<mark>').replace(HIT_END, '</mark>'))
+
+
+def search(query, page=1, per_page=10):
+    """Run a ranked search over posts and comments.
+
+    Returns (hits, total). Each hit is a dict with kind, id, post_id,
+    post_title, title and snippet; title and snippet are safe HTML with
+    matched terms wrapped in <mark>.
+    """
+    if not supported(db.session) or not query.strip():
+        return [], 0
+    offset = (max(page, 1) - 1) * per_page
+
+    if dialect(db.session) == 'sqlite':
+        match = sqlite_match(query)
+        if match is None:
+            return [], 0
+        params = {'match': match, 'limit': per_page, 'offset': offset}
+        total = db.session.execute(text(
+            "SELECT count(*) FROM search_index WHERE search_index MATCH :match"), params).scalar()
+        rows = db.session.execute(text(
+            "SELECT kind, ref_id, post_id, "
+            "highlight(search_index, 0, char(2), char(3)) AS title, "
+            "snippet(search_index, 1, char(2), char(3), '…', 32) AS snippet "
+            "FROM search_index WHERE search_index MATCH :match "
+            "ORDER BY bm25(search_index, 5.0, 1.0) LIMIT :limit OFFSET :offset"), params).all()
+    else:
+        params = {'query': query, 'limit': per_page, 'offset': offset,
+                  'options': f'StartSel={HIT_START}, StopSel={HIT_END}, MaxWords=35, MinWords=15'}
+        total = db.session.execute(text(
+            "SELECT count(*) FROM search_index "
+            "WHERE tsv @@ websearch_to_tsquery('english', :query)"), params).scalar()
+        rows = db.session.execute(text(
+            "SELECT kind, ref_id, post_id, "
+            "ts_headline('english', title, q, :options) AS title, "
+            "ts_headline('english', body, q, :options) AS snippet "
+            "FROM search_index, websearch_to_tsquery('english', :query) AS q "
+            "WHERE tsv @@ q ORDER BY ts_rank(tsv, q) DESC, doc_id DESC "
+            "LIMIT :limit OFFSET :offset"), params).all()
+
+    from models import Post
+    post_ids = {row.post_id for row in rows}
+    titles = dict(Post.query.with_entities(Post.id, Post.title).filter(Post.id.in_(post_ids)).all()) if post_ids else {}
+    hits = [{
+        'kind': row.kind,
+        'id': row.ref_id,
+        'post_id': row.post_id,
+        'post_title': titles.get(row.post_id, ''),
+        'title': highlight(row.title),
+        'snippet': highlight(row.snippet),
+    } for row in rows]
+    return hits, total
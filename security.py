@@ -0,0 +1,137 @@
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures import TimeoutError as FutureTimeoutError
+from werkzeug.security import generate_password_hash, check_password_hash
+from cache import LocalCache, NullCache
+
+
+class HashingBusy(RuntimeError):
+    """Raised when the password hashing pool is saturated."""
+
+
+class PasswordHasher:
+    """Password hashing with a configurable method, run in a bounded pool.
+
+    Hashing is deliberately slow, so it is executed on a small pool of
+    threads (or processes) and at most PASSWORD_HASH_WORKERS +
+    PASSWORD_HASH_QUEUE jobs may be in flight per worker. Further requests
+    fail fast with HashingBusy instead of piling up behind a login burst.
+    """
+
+    def __init__(self, app=None):
+        self.method = 'scrypt'
+        self.pool_type = 'none'
+        self.workers = 1
+        self.timeout = None
+        self._pool = None
+        self._slots = None
+        self._prefix = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('PASSWORD_HASH_METHOD', 'scrypt')
+        app.config.setdefault('PASSWORD_HASH_POOL', 'thread')
+        app.config.setdefault('PASSWORD_HASH_WORKERS', 2)
+        app.config.setdefault('PASSWORD_HASH_QUEUE', 16)
+        app.config.setdefault('PASSWORD_HASH_TIMEOUT', 10)
+
+        self.method = app.config['PASSWORD_HASH_METHOD']
+        self.pool_type = app.config['PASSWORD_HASH_POOL']
+        if self.pool_type not in ('thread', 'process', 'none'):
+            raise ValueError(f"Unknown PASSWORD_HASH_POOL: {self.pool_type}")
+        self.workers = app.config['PASSWORD_HASH_WORKERS']
+        self.timeout = app.config['PASSWORD_HASH_TIMEOUT']
+        self._slots = threading.BoundedSemaphore(self.workers + app.config['PASSWORD_HASH_QUEUE'])
+        app.extensions['password_hasher'] = self
+
+    @property
+    def pool(self):
+        # Created lazily so that each forked server worker gets its own pool
+        if self._pool is None:
+            with self._lock:
+                if self._pool is None:
+                    executor = ProcessPoolExecutor if self.pool_type == 'process' else ThreadPoolExecutor
+                    self._pool = executor(max_workers=self.workers)
+        return self._pool
+
+    def run(self, fn, *args):
+        if self.pool_type == 'none':
+            return fn(*args)
+        if not self._slots.acquire(blocking=False):
+            raise HashingBusy("Password hashing pool is saturated")
+        try:
+            future = self.pool.submit(fn, *args)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        try:
+            return future.result(timeout=self.timeout)
+        except FutureTimeoutError:
+            raise HashingBusy("Password hashing timed out")
+
+    def hash(self, password):
+        """Hash a password with the configured method."""
+        return self.run(generate_password_hash, password, self.method)
+
+    def verify(self, password_hash, password):
+        """Check a password against a stored hash of any supported method."""
+        return self.run(check_password_hash, password_hash, password)
+
+    @property
+    def prefix(self):
+        """The method and cost parameters that new hashes are created with."""
+        if self._prefix is None:
+            self._prefix = generate_password_hash('', self.method).split('$', 1)[0]
+        return self._prefix
+
+    def needs_rehash(self, password_hash):
+        """Whether a stored hash was made with other settings than the current ones."""
+        return password_hash.split('$', 1)[0] != self.prefix
+
+
+class LoginThrottle:
+    """Fixed-window limits on login attempts per client IP and per account.
+
+    Counters live in the cache backend, so they are shared between workers
+    when the cache is; with caching switched off they are kept in this
+    process. Attempts are counted before any password is hashed.
+    """
+
+    def __init__(self, cache, app=None):
+        self.cache = cache
+        self.counters = LocalCache()
+        self.per_ip = 0
+        self.per_account = 0
+        self.window = 300
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('LOGIN_ATTEMPTS_PER_IP', 30)
+        app.config.setdefault('LOGIN_ATTEMPTS_PER_ACCOUNT', 10)
+        app.config.setdefault('LOGIN_ATTEMPT_WINDOW', 300)
+        self.per_ip = app.config['LOGIN_ATTEMPTS_PER_IP']
+        self.per_account = app.config['LOGIN_ATTEMPTS_PER_ACCOUNT']
+        self.window = app.config['LOGIN_ATTEMPT_WINDOW']
+        app.extensions['login_throttle'] = self
+
+    def hit(self, scope, key, limit):
+        if not limit:
+            return True
+        window = int(time.time() // self.window)
+        store = self.cache.backend
+        if isinstance(store, NullCache):
+            store = self.counters
+        count = store.incr(f'throttle:{scope}:{key}:{window}', ttl=self.window)
+        return count <= limit
+
+    def allow(self, ip, account=None):
+        """Record an attempt and return whether it is within the limits."""
+        allowed = self.hit('ip', ip, self.per_ip)
+        if account is not None:
+            allowed = self.hit('account', account.lower(), self.per_account) and allowed
+        return allowed
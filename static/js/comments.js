@@ -3,8 +3,26 @@
 document.addEventListener('DOMContentLoaded', function() {
     // Handle comment deletion
     setupCommentDeletion();
+    
+    // Load further pages of comments on demand
+    setupLoadMore(document.getElementById('loadMoreCommentsBtn'),
+                  document.getElementById('comments-container'));
+    
+    // Show comments added or deleted by others while the page is open
+    setupCommentFeed(document.getElementById('comments-container'));
 });
 
+// Add delta to the comments count shown in the heading, if present
+function adjustCommentsCount(delta) {
+    const commentsCountElement = document.querySelector('.comments-count');
+    if (commentsCountElement) {
+        const currentCount = parseInt(commentsCountElement.textContent, 10);
+        if (!isNaN(currentCount)) {
+            commentsCountElement.textContent = currentCount + delta;
+        }
+    }
+}
+
 function setupCommentDeletion() {
     // Get comment deletion modal elements
     const deleteCommentModal = document.getElementById('deleteCommentModal');
@@ -15,17 +33,18 @@ function setupCommentDeletion() {
     const modal = new bootstrap.Modal(deleteCommentModal);
     let commentIdToDelete = null;
     
-    // Add event listeners to all delete comment buttons
-    document.querySelectorAll('.delete-comment-btn').forEach(button => {
-        button.addEventListener('click', function() {
-            commentIdToDelete = this.closest('.comment-card').getAttribute('data-comment-id');
-            
-            if (commentIdToDelete) {
-                modal.show();
-            } else {
-                console.error('No comment ID found for deletion');
-            }
-        });
+    // Listen on the document so comments added by "load more" are covered too
+    document.addEventListener('click', function(event) {
+        const button = event.target.closest('.delete-comment-btn');
+        if (!button) return;
+        
+        commentIdToDelete = button.closest('.comment-card').getAttribute('data-comment-id');
+        
+        if (commentIdToDelete) {
+            modal.show();
+        } else {
+            console.error('No comment ID found for deletion');
+        }
     });
     
     // Handle confirm delete button click
@@ -52,15 +71,7 @@ function setupCommentDeletion() {
                 const commentElement = document.querySelector(`.comment-card[data-comment-id="${commentIdToDelete}"]`);
                 if (commentElement) {
                     commentElement.remove();
-                    
-                    // Update comments count if present
-                    const commentsCountElement = document.querySelector('.comments-count');
-                    if (commentsCountElement) {
-                        const currentCount = parseInt(commentsCountElement.textContent, 10);
-                        if (!isNaN(currentCount)) {
-                            commentsCountElement.textContent = currentCount - 1;
-                        }
-                    }
+                    adjustCommentsCount(-1);
                     
                     showNotification('Comment deleted successfully.', 'success');
                 }
@@ -75,3 +86,64 @@ function setupCommentDeletion() {
         });
     });
 }
+
+// Subscribe to the post's comment feed with server-sent events.
+// The container carries the feed endpoint and the cursor of the last event
+// already reflected in the page; the browser resumes from the last event id
+// by itself when the connection drops.
+function setupCommentFeed(container) {
+    if (!container || !window.EventSource) return;
+    
+    const feedUrl = container.getAttribute('data-feed-url');
+    const cursor = container.getAttribute('data-feed-cursor');
+    if (!feedUrl) return;
+    
+    const source = new EventSource(`${feedUrl}?since=${encodeURIComponent(cursor || '')}`);
+    
+    source.addEventListener('comment', function(event) {
+        const data = JSON.parse(event.data);
+        // Our own comments are already on the page after the redirect
+        if (document.getElementById(`comment-${data.comment_id}`)) return;
+        
+        const placeholder = container.querySelector('.no-comments');
+        if (placeholder) placeholder.remove();
+        container.insertAdjacentHTML('afterbegin', data.html);
+        adjustCommentsCount(1);
+    });
+    
+    source.addEventListener('delete', function(event) {
+        const data = JSON.parse(event.data);
+        const commentElement = document.getElementById(`comment-${data.comment_id}`);
+        if (commentElement) {
+            commentElement.remove();
+            adjustCommentsCount(-1);
+        }
+    });
+    
+    source.addEventListener('reset', function(event) {
+        // Too much changed to apply one by one: reload the first page of comments
+        const data = JSON.parse(event.data);
+        fetch(container.getAttribute('data-comments-url'), {
+            headers: { 'X-Requested-With': 'XMLHttpRequest' },
+            credentials: 'same-origin'
+        })
+        .then(handleFetchError)
+        .then(page => {
+            container.innerHTML = page.html;
+            const button = document.getElementById('loadMoreCommentsBtn');
+            if (button && page.next_cursor) {
+                button.setAttribute('data-cursor', page.next_cursor);
+            } else if (button) {
+                button.remove();
+            }
+            const commentsCountElement = document.querySelector('.comments-count');
+            if (commentsCountElement) {
+                commentsCountElement.textContent = data.comment_count;
+            }
+        })
+        .catch(error => console.error('Error reloading comments:', error));
+    });
+    
+    // Stop reconnecting when the user leaves the page
+    window.addEventListener('beforeunload', () => source.close());
+}
@@ -61,3 +61,39 @@ function showNotification(message, type = 'success') {
         }
     }, 5000);
 }
+
+// Append the next page of server-rendered items when a "load more" button is clicked.
+// The button carries the endpoint in data-url and the next page cursor in data-cursor.
+function setupLoadMore(button, container) {
+    if (!button || !container) return;
+    
+    button.addEventListener('click', function() {
+        const cursor = button.getAttribute('data-cursor');
+        if (!cursor) return;
+        
+        button.disabled = true;
+        const url = `${button.getAttribute('data-url')}?cursor=${encodeURIComponent(cursor)}`;
+        
+        fetch(url, {
+            headers: { 'X-Requested-With': 'XMLHttpRequest' },
+            credentials: 'same-origin'
+        })
+        .then(handleFetchError)
+        .then(data => {
+            container.insertAdjacentHTML('beforeend', data.html);
+            
+            if (data.next_cursor) {
+                button.setAttribute('data-cursor', data.next_cursor);
+                button.disabled = false;
+            } else {
+                // Last page reached
+                button.remove();
+            }
+        })
+        .catch(error => {
+            console.error('Error loading more items:', error);
+            button.disabled = false;
+            showNotification('An error occurred while loading more items.', 'danger');
+        });
+    });
+}
@@ -3,6 +3,10 @@
 document.addEventListener('DOMContentLoaded', function() {
     // Handle post deletion
     setupPostDeletion();
+    
+    // Load further pages of dashboard posts on demand
+    setupLoadMore(document.getElementById('loadMorePostsBtn'),
+                  document.getElementById('dashboard-posts'));
 });
 
 function setupPostDeletion() {
@@ -15,18 +19,19 @@ function setupPostDeletion() {
     const modal = new bootstrap.Modal(deletePostModal);
     let postIdToDelete = null;
     
-    // Add event listeners to all delete post buttons
-    document.querySelectorAll('.delete-post-btn').forEach(button => {
-        button.addEventListener('click', function() {
-            postIdToDelete = this.getAttribute('data-post-id') || 
-                             this.closest('tr')?.getAttribute('data-post-id');
-            
-            if (postIdToDelete) {
-                modal.show();
-            } else {
-                console.error('No post ID found for deletion');
-            }
-        });
+    // Listen on the document so rows added by "load more" are covered too
+    document.addEventListener('click', function(event) {
+        const button = event.target.closest('.delete-post-btn');
+        if (!button) return;
+        
+        postIdToDelete = button.getAttribute('data-post-id') || 
+                         button.closest('tr')?.getAttribute('data-post-id');
+        
+        if (postIdToDelete) {
+            modal.show();
+        } else {
+            console.error('No post ID found for deletion');
+        }
     });
     
     // Handle confirm delete button click
@@ -56,6 +61,15 @@ function setupPostDeletion() {
                 if (postElement) {
                     // If we're on the dashboard or a listing page, remove the post element
                     postElement.remove();
+                    
+                    // Update posts count if present
+                    const postsCountElement = document.querySelector('.posts-count');
+                    if (postsCountElement) {
+                        const currentCount = parseInt(postsCountElement.textContent, 10);
+                        if (!isNaN(currentCount)) {
+                            postsCountElement.textContent = currentCount - 1;
+                        }
+                    }
                     showNotification('Post deleted successfully.', 'success');
                 } else {
                     // If we're on the post detail page, redirect to dashboard
@@ -0,0 +1,108 @@
+import logging
+import smtplib
+import threading
+from email.message import EmailMessage
+import click
+from flask import current_app, url_for
+from flask.cli import with_appcontext
+from app import db, job_queue, image_store
+from models import User, Post, Comment, PostImage
+import search
+
+
+@job_queue.task('index_post')
+def index_post(post_id):
+    """Add or refresh a post in the search index."""
+    post = db.session.get(Post, post_id)
+    if post is not None:
+        search.index_post(post)
+
+
+@job_queue.task('index_comment')
+def index_comment(comment_id):
+    """Add a comment to the search index."""
+    comment = db.session.get(Comment, comment_id)
+    if comment is not None:
+        search.index_comment(comment)
+
+
+@job_queue.task('remove_post')
+def remove_post(post_id, comment_ids=()):
+    """Remove a deleted post and its comments from the search index."""
+    search.remove_post(post_id, comment_ids)
+
+
+@job_queue.task('remove_comment')
+def remove_comment(comment_id):
+    """Remove a deleted comment from the search index."""
+    search.remove_comment(comment_id)
+
+
+@job_queue.task('resize_image')
+def resize_image(image_id):
+    """Render the resized variants of an uploaded post image."""
+    image = db.session.get(PostImage, image_id)
+    if image is not None:
+        image_store.make_variants(image.sha256, image.width)
+
+
+@job_queue.task('remove_image_files')
+def remove_image_files(sha256):
+    """Delete a stored image once no post uses it any more.
+
+    An image saved in the last IMAGE_REMOVE_GRACE seconds may belong to an
+    upload that has not committed yet, so it is checked again later.
+    """
+    if PostImage.query.filter_by(sha256=sha256).first() is not None:
+        return
+    age = image_store.age(sha256)
+    grace = current_app.config['IMAGE_REMOVE_GRACE']
+    if age is not None and age < grace:
+        job_queue.enqueue('remove_image_files', delay=grace - age, sha256=sha256)
+    else:
+        image_store.remove(sha256)
+
+
+@job_queue.task('notify_comment')
+def notify_comment(comment_id):
+    """Email a post's author about a new comment from someone else."""
+    comment = db.session.get(Comment, comment_id)
+    if comment is None:
+        return
+    post = db.session.get(Post, comment.post_id)
+    if post.user_id == comment.user_id:
+        return
+    author = db.session.get(User, post.user_id)
+    commenter = db.session.get(User, comment.user_id)
+
+    message = EmailMessage()
+    message['From'] = current_app.config['MAIL_FROM']
+    message['To'] = author.email
+    message['Subject'] = f'New comment on "{post.title}"'
+    with current_app.test_request_context(base_url=current_app.config['SITE_URL']):
+        link = url_for('blog.post_detail', post_id=post.id, _anchor=f'comment-{comment.id}', _external=True)
+    message.set_content(f"{commenter.username} commented on your post:\n\n{comment.content}\n\n{link}\n")
+    send_mail(message)
+
+
+def send_mail(message):
+    with smtplib.SMTP(current_app.config['MAIL_SERVER'], current_app.config['MAIL_PORT'], timeout=10) as smtp:
+        smtp.send_message(message)
+
+
+@click.command('run-jobs')
+@click.option('--once', is_flag=True, help='Run the jobs that are due now and exit.')
+@click.option('--workers', type=int, default=1, show_default=True, help='Worker threads.')
+@with_appcontext
+def run_jobs_command(once, workers):
+    """Run background jobs from the job table."""
+    if once:
+        click.echo(f"Ran {job_queue.run_pending()} jobs")
+        return
+    logging.info(f"Running background jobs with {workers} worker(s)")
+    app = current_app._get_current_object()
+    threads = [threading.Thread(target=job_queue.work, args=(app,), daemon=True) for _ in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
@@ -0,0 +1,66 @@
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app import create_app, db
+
+
+def make_app(tmp_path, **config):
+    app = create_app({
+        "TESTING": True,
+        "SQLALCHEMY_DATABASE_URI": f"sqlite:///{tmp_path / 'blog.db'}",
+        "SQLALCHEMY_BINDS": {},
+        "WTF_CSRF_ENABLED": False,
+        "IMAGE_FOLDER": str(tmp_path / 'images'),
+        "DOCUMENT_FOLDER": str(tmp_path / 'documents'),
+        "PASSWORD_HASH_METHOD": "pbkdf2:sha256:1000",
+        "PASSWORD_HASH_POOL": "none",
+        **config,
+    })
+    import migrations
+    with app.app_context():
+        migrations.upgrade(db)
+    return app
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = make_app(tmp_path)
+    yield app
+    with app.app_context():
+        db.session.remove()
+        db.engine.dispose()
+
+
+@pytest.fixture
+def client(app):
+    return app.test_client()
+
+
+@pytest.fixture
+def user(app):
+    from models import User
+    with app.app_context():
+        user = User(username='alice', email='alice@example.com')
+        user.set_password('secret1')
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+@pytest.fixture
+def post(app, user):
+    from models import Post
+    with app.app_context():
+        post = Post(title='Hello', content='First post', user_id=user)
+        post.render_content()
+        db.session.add(post)
+        db.session.commit()
+        return post.id
+
+
+def login(client, email='alice@example.com', password='secret1'):
+    return client.post('/login', data={'email': email, 'password': password})
@@ -0,0 +1,25 @@
+import sys
+
+import pytest
+
+from assets import minify_js
+
+
+@pytest.fixture(autouse=True)
+def without_rjsmin(monkeypatch):
+    monkeypatch.setitem(sys.modules, 'rjsmin', None)
+
+
+def test_minify_js_keeps_code_after_block_comments():
+    assert minify_js('/* init */ start();\n') == 'start();'
+    assert minify_js('/* a */ x = 1; /* b\n */ y();\n') == 'x = 1; /* b\n*/ y();'
+
+
+def test_minify_js_drops_comment_lines():
+    source = '/**\n * Setup.\n */\nrun(); // go\n\n  // done\n  /* one */ /* two */\n'
+    assert minify_js(source) == 'run(); // go'
+
+
+def test_minify_js_keeps_template_literals():
+    source = 'const html = `\n  <p>\n  /* kept */\n`;\n'
+    assert minify_js(source) == 'const html = `\n  <p>\n  /* kept */\n`;'
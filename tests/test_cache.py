@@ -0,0 +1,33 @@
+from datetime import datetime, timedelta
+
+from app import db
+from conftest import login
+
+
+def edit_elsewhere(app, post_id):
+    """Change a post without invalidating this process's cache, as another worker would."""
+    from models import Post
+    with app.app_context():
+        post = db.session.get(Post, post_id)
+        post.title = 'Edited'
+        post.updated_at = datetime.utcnow() + timedelta(minutes=1)
+        db.session.commit()
+
+
+def revalidate(app, client, post_id, multiprocess):
+    environ = {'wsgi.multiprocess': multiprocess}
+    login(client)
+    client.get('/')  # show the login flash, which would skip validation
+    etag = client.get(f'/post/{post_id}', environ_overrides=environ).headers['ETag']
+    edit_elsewhere(app, post_id)
+    return client.get(f'/post/{post_id}', headers={'If-None-Match': etag}, environ_overrides=environ)
+
+
+def test_local_cache_memoizes_etags_in_one_process(app, client, post):
+    assert revalidate(app, client, post, multiprocess=False).status_code == 304
+
+
+def test_local_cache_does_not_memoize_etags_across_processes(app, client, post):
+    response = revalidate(app, client, post, multiprocess=True)
+    assert response.status_code == 200
+    assert 'Edited' in response.get_data(as_text=True)
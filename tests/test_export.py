@@ -0,0 +1,35 @@
+import json
+from datetime import datetime, timedelta
+
+import export
+from app import db
+from conftest import login
+
+
+def test_export_cursor_overlaps_writes_in_flight(app, client, user, post):
+    from models import Post
+    login(client)
+    before = datetime.utcnow()
+    with client.get('/api/export') as response:
+        cursor = datetime.fromisoformat(response.headers['X-Export-Cursor'])
+    assert cursor <= before - export.CURSOR_OVERLAP + timedelta(seconds=1)
+
+    # An edit stamped just before the export started but committed after it
+    with app.app_context():
+        db.session.get(Post, post).title = 'Edited'
+        db.session.commit()
+        db.session.execute(Post.__table__.update().values(updated_at=before - timedelta(seconds=1)))
+        db.session.commit()
+    response = client.get('/api/export', query_string={'since': cursor.isoformat()})
+    records = [json.loads(line) for line in response.data.splitlines()]
+    assert [record['title'] for record in records] == ['Edited']
+
+
+def test_incremental_export_lists_deletions(app, client, user, post):
+    login(client)
+    with client.get('/api/export') as response:
+        cursor = response.headers['X-Export-Cursor']
+    assert client.post(f'/post/{post}/delete').status_code == 200
+    response = client.get('/api/export', query_string={'since': cursor})
+    records = [json.loads(line) for line in response.data.splitlines()]
+    assert [(record['type'], record['kind'], record['id']) for record in records] == [('deletion', 'post', post)]
@@ -0,0 +1,18 @@
+import time
+
+
+def test_long_poll_rejects_nan_wait(app, client, post):
+    app.config['COMMENT_FEED_WAIT'] = 0.2
+    start = time.monotonic()
+    response = client.get(f'/post/{post}/events?wait=nan')
+    assert response.status_code == 200
+    assert response.get_json()['events'] == []
+    assert time.monotonic() - start < 5
+
+
+def test_long_poll_clamps_wait(app, client, post):
+    app.config['COMMENT_FEED_WAIT'] = 0.2
+    start = time.monotonic()
+    assert client.get(f'/post/{post}/events?wait=inf').status_code == 200
+    assert client.get(f'/post/{post}/events?wait=-1').status_code == 200
+    assert time.monotonic() - start < 5
@@ -0,0 +1,71 @@
+import io
+import json
+import os
+import time
+
+from PIL import Image
+
+from app import db
+from conftest import login
+
+
+def add_image(app, post_id, sha256, width=640):
+    from models import PostImage
+    with app.app_context():
+        db.session.add(PostImage(post_id=post_id, sha256=sha256, width=width, height=480, content_type='image/jpeg'))
+        db.session.commit()
+
+
+def test_post_detail_shows_images_in_order(app, client, post):
+    add_image(app, post, 'b' * 64)
+    add_image(app, post, 'a' * 64)
+    page = client.get(f'/post/{post}').get_data(as_text=True)
+    assert page.index('b' * 64) < page.index('a' * 64)
+
+
+def test_post_detail_without_images(client, post):
+    assert client.get(f'/post/{post}').status_code == 200
+    assert client.get('/post/999').status_code == 404
+
+
+
+def png():
+    data = io.BytesIO()
+    Image.new('RGB', (4, 3)).save(data, 'PNG')
+    data.seek(0)
+    return data
+
+
+def queued_removals(app):
+    from models import Job
+    with app.app_context():
+        return [json.loads(job.payload)['sha256'] for job in Job.query.filter_by(name='remove_image_files')]
+
+
+def test_failed_upload_queues_removal_of_stored_images(app, client, user):
+    login(client)
+    response = client.post('/post/new', data={
+        'title': 'Pictures', 'content': 'Two of them',
+        'images': [(png(), 'good.png'), (io.BytesIO(b'not an image'), 'bad.png')],
+    })
+    assert 'bad.png: The file is not a readable image' in response.get_data(as_text=True)
+    [sha256] = queued_removals(app)
+    assert os.path.isdir(app.extensions['image_store'].directory(sha256))
+
+
+def test_remove_image_files_waits_for_recent_uploads(app):
+    import tasks
+    store = app.extensions['image_store']
+    upload = type('Upload', (), {'stream': png()})()
+    sha256, *_ = store.save(upload)
+    with app.app_context():
+        tasks.remove_image_files(sha256)
+        db.session.commit()
+    assert os.path.isdir(store.directory(sha256))
+    assert queued_removals(app) == [sha256]
+
+    stored = time.time() - app.config['IMAGE_REMOVE_GRACE'] - 1
+    os.utime(store.directory(sha256), (stored, stored))
+    with app.app_context():
+        tasks.remove_image_files(sha256)
+    assert not os.path.isdir(store.directory(sha256))
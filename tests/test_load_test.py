@@ -0,0 +1,25 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+import load_test
+
+
+def result(throughput, p95_ms):
+    return {'requests': 200, 'errors': 0, 'throughput': throughput, 'p50_ms': p95_ms,
+            'p95_ms': p95_ms, 'p99_ms': p95_ms, 'queries_per_request': 0.0}
+
+
+def compare(previous, current):
+    baseline = {'meta': {'date': 'then'}, 'results': {'index': previous}}
+    return load_test.compare({'index': current}, baseline, 0.25, 1.0, 0.5)
+
+
+def test_throughput_drop_on_fast_endpoint_fails():
+    # 0.37ms per request: the latency slack alone would allow a 4x drop
+    assert compare(result(2700, 0.4), result(700, 0.6))
+
+
+def test_throughput_within_tolerance_passes():
+    assert not compare(result(2700, 0.4), result(2200, 0.6))
@@ -0,0 +1,37 @@
+import pytest
+
+from app import db
+from conftest import make_app
+
+
+@pytest.fixture
+def app(tmp_path):
+    app = make_app(tmp_path, TRUSTED_PROXIES=1)
+    yield app
+    with app.app_context():
+        db.engine.dispose()
+
+
+def scrape(client, peer, forwarded_for=None, **headers):
+    if forwarded_for:
+        headers['X-Forwarded-For'] = forwarded_for
+    return client.get('/metrics', headers=headers, environ_base={'REMOTE_ADDR': peer})
+
+
+def test_metrics_for_local_scrapers(client):
+    assert scrape(client, '127.0.0.1').status_code == 200
+
+
+@pytest.mark.parametrize('peer, forwarded_for', [
+    ('203.0.113.5', None),
+    ('203.0.113.5', '127.0.0.1'),  # spoofed by the client
+    ('127.0.0.1', '203.0.113.5'),  # through a proxy on this host
+])
+def test_metrics_refused_to_remote_clients(client, peer, forwarded_for):
+    assert scrape(client, peer, forwarded_for).status_code == 403
+
+
+def test_metrics_with_token(app, client):
+    app.config['METRICS_TOKEN'] = 'secret'
+    assert scrape(client, '203.0.113.5', Authorization='Bearer secret').status_code == 200
+    assert scrape(client, '203.0.113.5', Authorization='Bearer wrong').status_code == 403
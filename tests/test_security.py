@@ -0,0 +1,17 @@
+from cache import NullCache
+
+
+def test_login_throttle_without_a_cache(app):
+    throttle = app.extensions['login_throttle']
+    throttle.per_ip = 2
+    with app.app_context():
+        app.extensions['response_cache'] = NullCache()
+        assert [throttle.allow('203.0.113.5') for _ in range(3)] == [True, True, False]
+
+
+def test_login_throttle_ignores_forwarded_for_without_proxies(app, client, user):
+    app.extensions['login_throttle'].per_ip = 2
+    statuses = [client.post('/login', data={'email': 'alice@example.com', 'password': 'wrong'},
+                            headers={'X-Forwarded-For': f'198.51.100.{n}'}).status_code
+                for n in range(3)]
+    assert statuses == [200, 200, 429]
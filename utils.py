@@ -1,4 +1,5 @@
 from functools import wraps
+from itertools import islice
 from flask import flash, redirect, url_for
 from flask_login import current_user
 
@@ -8,7 +9,7 @@ def requires_auth(f):
     def decorated(*args, **kwargs):
         if not current_user.is_authenticated:
             flash('Please log in to access this page.', 'warning')
-            return redirect(url_for('login'))
+            return redirect(url_for('blog.login'))
         return f(*args, **kwargs)
     return decorated
 
@@ -17,3 +18,12 @@ def format_datetime(dt, format='%B %d, %Y at %I:%M %p'):
     if dt:
         return dt.strftime(format)
     return ""
+
+def chunked(iterable, size):
+    """Yield lists of up to size items from an iterable."""
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk